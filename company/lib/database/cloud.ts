@@ -1,7 +1,8 @@
 // Cloud database connection and utilities (PostgreSQL)
 
 import { Pool, PoolClient, QueryResult } from 'pg';
-import { DatabaseConfig, Organization, User, Device, Event, Incident, File, AuditLog } from '@/types/database';
+import { DatabaseConfig, Organization, User, Device, Event, Incident, File, AuditLog, ChangeBatch } from '@/types/database';
+import { DEFAULT_SYNC_BATCH_SIZE, decodeSyncToken, encodeSyncToken, getSyncTableSpec } from './delta';
 
 export class CloudDatabase {
   private pool: Pool;
@@ -34,7 +35,7 @@ export class CloudDatabase {
     try {
       // Set current organization context for RLS
       if (this.currentOrgId) {
-        await client.query('SET app.current_org_id = $1', [this.currentOrgId]);
+        await client.query("SELECT set_config('app.current_org_id', $1, false)", [this.currentOrgId]);
       }
       return await client.query(text, params);
     } finally {
@@ -278,6 +279,82 @@ export class CloudDatabase {
     return result.rows[0];
   }
 
+  // Delta sync: rows written and deleted after the cursor in `token`, oldest
+  // first. Only transactions older than the oldest one still running are
+  // visible, so the returned token never passes a write that has yet to commit.
+  async getChanges(orgId: string, tableName: string, token?: string | null, options: {
+    limit?: number;
+    created_after?: Date;
+  } = {}): Promise<ChangeBatch> {
+    const spec = getSyncTableSpec(tableName);
+    const cursor = decodeSyncToken(token);
+    const limit = options.limit || DEFAULT_SYNC_BATCH_SIZE;
+    const select = spec.softDelete ? [...spec.columns, 'deleted_at'] : spec.columns;
+
+    // Split at the cursor's transaction rather than comparing (sync_xid, id) as
+    // a row: every row that predates migration 003 shares one sync_xid, and the
+    // planner then estimates the row comparison as empty and sorts the whole
+    // remainder of the table for every batch.
+    const columns = `${select.join(', ')}, sync_xid::text AS row_xid`;
+    const params: any[] = [orgId, cursor.xid, cursor.id, limit];
+    let windowFilter = '';
+    if (spec.windowed && options.created_after) {
+      windowFilter = ' AND created_at >= $5';
+      params.push(options.created_after);
+    }
+    const query = `SELECT * FROM (
+        (SELECT ${columns} FROM ${tableName}
+         WHERE ${spec.orgColumn} = $1 AND sync_xid = $2::xid8 AND id > $3::uuid${windowFilter}
+         ORDER BY id LIMIT $4)
+        UNION ALL
+        (SELECT ${columns} FROM ${tableName}
+         WHERE ${spec.orgColumn} = $1 AND sync_xid > $2::xid8
+           AND sync_xid < pg_snapshot_xmin(pg_current_snapshot())${windowFilter}
+         ORDER BY sync_xid, id LIMIT $4)
+      ) changed
+      ORDER BY row_xid::xid8, id LIMIT $4`;
+
+    const [changed, tombstones] = await Promise.all([
+      this.query(query, params),
+      this.query<{ record_id: string; tombstone_xid: string; tombstone_seq: string }>(
+        `SELECT record_id::text AS record_id, sync_xid::text AS tombstone_xid, seq::text AS tombstone_seq
+         FROM sync_tombstones
+         WHERE org_id = $1 AND table_name = $2
+           AND (sync_xid, seq) > ($3::xid8, $4::bigint)
+           AND sync_xid < pg_snapshot_xmin(pg_current_snapshot())
+         ORDER BY sync_xid, seq LIMIT $5`,
+        [orgId, tableName, cursor.tombstoneXid, cursor.tombstoneSeq, limit]
+      )
+    ]);
+
+    const rows: any[][] = [];
+    const deleted: string[] = [];
+    for (const row of changed.rows) {
+      if (spec.softDelete && row.deleted_at) {
+        deleted.push(row.id);
+      } else {
+        rows.push(spec.columns.map(column => row[column]));
+      }
+    }
+    deleted.push(...tombstones.rows.map(row => row.record_id));
+
+    const lastRow = changed.rows[changed.rows.length - 1];
+    const lastTombstone = tombstones.rows[tombstones.rows.length - 1];
+    return {
+      table: tableName,
+      columns: spec.columns,
+      rows,
+      deleted,
+      token: encodeSyncToken({
+        xid: lastRow ? lastRow.row_xid : cursor.xid,
+        id: lastRow ? lastRow.id : cursor.id,
+        tombstoneXid: lastTombstone ? lastTombstone.tombstone_xid : cursor.tombstoneXid,
+        tombstoneSeq: lastTombstone ? lastTombstone.tombstone_seq : cursor.tombstoneSeq
+      }),
+      hasMore: changed.rows.length === limit || tombstones.rows.length === limit
+    };
+  }
+
   // Health check
   async healthCheck(): Promise<boolean> {
     try {
@@ -0,0 +1,109 @@
+// Delta sync protocol shared by the cloud reader and the local applier
+
+import { SyncCursor } from '@/types/database';
+
+export interface SyncTableSpec {
+  localTable: string;
+  orgColumn: string;
+  // Shipped to the desktop in this order; every one exists in both schemas
+  columns: string[];
+  // Stored as JSON text in SQLite (JSONB and array columns in PostgreSQL)
+  jsonColumns: string[];
+  // Rows with deleted_at set are sent as tombstones rather than upserts
+  softDelete: boolean;
+  // Append-only and windowed by created_at instead of tombstoned
+  windowed?: boolean;
+}
+
+export const SYNC_TABLES: Record<string, SyncTableSpec> = {
+  organizations: {
+    localTable: 'cached_organizations',
+    orgColumn: 'id',
+    columns: ['id', 'name', 'slug', 'plan', 'settings'],
+    jsonColumns: ['settings'],
+    softDelete: true
+  },
+  users: {
+    localTable: 'cached_users',
+    orgColumn: 'org_id',
+    columns: ['id', 'org_id', 'email', 'first_name', 'last_name', 'role', 'permissions'],
+    jsonColumns: ['permissions'],
+    softDelete: true
+  },
+  devices: {
+    localTable: 'cached_devices',
+    orgColumn: 'org_id',
+    columns: ['id', 'org_id', 'name', 'device_type', 'os', 'ip_address', 'mac_address', 'location', 'status', 'last_seen_at', 'metadata'],
+    jsonColumns: ['location', 'metadata'],
+    softDelete: true
+  },
+  events: {
+    localTable: 'cached_events',
+    orgColumn: 'org_id',
+    columns: ['id', 'org_id', 'device_id', 'event_type', 'severity', 'source', 'message', 'data', 'tags', 'created_at'],
+    jsonColumns: ['data', 'tags'],
+    softDelete: false,
+    windowed: true
+  },
+  incidents: {
+    localTable: 'cached_incidents',
+    orgColumn: 'org_id',
+    columns: ['id', 'org_id', 'title', 'description', 'severity', 'status', 'assigned_to', 'source_event_ids', 'affected_device_ids', 'resolution_notes', 'resolved_at', 'created_at', 'updated_at'],
+    jsonColumns: ['source_event_ids', 'affected_device_ids'],
+    softDelete: false
+  },
+  files: {
+    localTable: 'cached_files',
+    orgColumn: 'org_id',
+    columns: ['id', 'org_id', 'filename', 'content_type', 'size_bytes', 'storage_path', 'checksum', 'encrypted', 'metadata', 'created_at'],
+    jsonColumns: ['metadata'],
+    softDelete: false
+  },
+  security_policies: {
+    localTable: 'cached_security_policies',
+    orgColumn: 'org_id',
+    columns: ['id', 'org_id', 'name', 'description', 'policy_type', 'conditions', 'actions', 'enabled'],
+    jsonColumns: ['conditions', 'actions'],
+    softDelete: false
+  },
+  device_groups: {
+    localTable: 'cached_device_groups',
+    orgColumn: 'org_id',
+    columns: ['id', 'org_id', 'name', 'description', 'device_ids', 'criteria'],
+    jsonColumns: ['device_ids', 'criteria'],
+    softDelete: false
+  }
+};
+
+export const DEFAULT_SYNC_BATCH_SIZE = 5000;
+
+export const INITIAL_SYNC_CURSOR: SyncCursor = {
+  xid: '0',
+  id: '00000000-0000-0000-0000-000000000000',
+  tombstoneXid: '0',
+  tombstoneSeq: '0'
+};
+
+export function getSyncTableSpec(tableName: string): SyncTableSpec {
+  const spec = SYNC_TABLES[tableName];
+  if (!spec) {
+    throw new Error(`Table ${tableName} is not delta-synced`);
+  }
+  return spec;
+}
+
+// Tokens are stored in sync_status.sync_token: "<xid>:<id>/<tombstone xid>:<tombstone seq>"
+export function encodeSyncToken(cursor: SyncCursor): string {
+  return `${cursor.xid}:${cursor.id}/${cursor.tombstoneXid}:${cursor.tombstoneSeq}`;
+}
+
+export function decodeSyncToken(token?: string | null): SyncCursor {
+  if (!token) {
+    return { ...INITIAL_SYNC_CURSOR };
+  }
+  const match = /^(\d+):([0-9a-f-]{36})\/(\d+):(\d+)$/i.exec(token);
+  if (!match) {
+    throw new Error(`Invalid sync token: ${token}`);
+  }
+  return { xid: match[1], id: match[2], tombstoneXid: match[3], tombstoneSeq: match[4] };
+}
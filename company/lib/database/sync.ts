@@ -2,6 +2,7 @@
 
 import { CloudDatabase } from './cloud';
 import { LocalDatabase } from './local';
+import { DEFAULT_SYNC_BATCH_SIZE, SYNC_TABLES, getSyncTableSpec } from './delta';
 import { SyncOptions, SyncStatus } from '@/types/database';
 
 export class DatabaseSync {
@@ -15,7 +16,7 @@ export class DatabaseSync {
 
   // Sync all data for an organization
   async syncOrganization(orgId: string, options: SyncOptions = {}): Promise<void> {
-    const tables = options.tables || ['organizations', 'users', 'devices', 'events', 'incidents', 'files'];
+    const tables = options.tables || Object.keys(SYNC_TABLES);
     
     try {
       // Set organization context
@@ -39,32 +40,12 @@ export class DatabaseSync {
 
   // Sync specific table
   private async syncTable(orgId: string, tableName: string, options: SyncOptions): Promise<void> {
-    const syncStatus = this.localDb.getSyncStatus(tableName);
-    const since = options.since || (syncStatus?.last_sync_at ? new Date(syncStatus.last_sync_at) : undefined);
-    
     try {
-      switch (tableName) {
-        case 'organizations':
-          await this.syncOrganizations(orgId, since);
-          break;
-        case 'users':
-          await this.syncUsers(orgId, since);
-          break;
-        case 'devices':
-          await this.syncDevices(orgId, since);
-          break;
-        case 'events':
-          await this.syncEvents(orgId, since, options);
-          break;
-        case 'incidents':
-          await this.syncIncidents(orgId, since);
-          break;
-        case 'files':
-          await this.syncFiles(orgId, since);
-          break;
-        default:
-          console.warn(`Unknown table: ${tableName}`);
+      if (options.forceFullSync) {
+        this.localDb.resetSyncedTable(tableName);
       }
+      const syncStatus = this.localDb.getSyncStatus(tableName);
+      await this.pullChanges(orgId, tableName, syncStatus?.sync_token, options);
 
       // Update sync status
       this.localDb.updateSyncStatus(tableName, new Date(), undefined, undefined);
@@ -76,119 +57,35 @@ export class DatabaseSync {
     }
   }
 
-  // Sync organizations
-  private async syncOrganizations(orgId: string, since?: Date): Promise<void> {
-    const org = await this.cloudDb.getOrganization(orgId);
-    if (org) {
-      this.localDb.cacheOrganization({
-        id: org.id,
-        name: org.name,
-        slug: org.slug,
-        plan: org.plan,
-        settings: org.settings,
-        last_synced_at: new Date()
-      });
-    }
-  }
-
-  // Sync users
-  private async syncUsers(orgId: string, since?: Date): Promise<void> {
-    const users = await this.cloudDb.getUsersByOrg(orgId);
-    
-    for (const user of users) {
-      this.localDb.cacheUser({
-        id: user.id,
-        org_id: user.org_id,
-        email: user.email,
-        first_name: user.first_name,
-        last_name: user.last_name,
-        role: user.role,
-        permissions: user.permissions,
-        last_synced_at: new Date()
-      });
-    }
-  }
-
-  // Sync devices
-  private async syncDevices(orgId: string, since?: Date): Promise<void> {
-    const devices = await this.cloudDb.getDevicesByOrg(orgId);
-    
-    for (const device of devices) {
-      this.localDb.cacheDevice({
-        id: device.id,
-        org_id: device.org_id,
-        name: device.name,
-        device_type: device.device_type,
-        os: device.os,
-        ip_address: device.ip_address,
-        mac_address: device.mac_address,
-        location: device.location,
-        status: device.status,
-        last_seen_at: device.last_seen_at,
-        metadata: device.metadata,
-        last_synced_at: new Date()
-      });
-    }
-  }
-
-  // Sync events (with time-based filtering for performance)
-  private async syncEvents(orgId: string, since?: Date, options: SyncOptions = {}): Promise<void> {
-    const limit = options.batchSize || 1000;
-    const startDate = since || new Date(Date.now() - 7 * 24 * 60 * 60 * 1000); // Default to last 7 days
-    
-    const events = await this.cloudDb.getEventsByOrg(orgId, {
-      start_date: startDate,
-      limit: limit
+  // Pull changed and deleted rows after the table's stored cursor. The next
+  // batch is requested as soon as the current one arrives, so the cloud query
+  // runs while the current batch is written locally.
+  private async pullChanges(orgId: string, tableName: string, token: string | undefined, options: SyncOptions): Promise<number> {
+    const spec = getSyncTableSpec(tableName);
+    const fetchBatch = (from?: string) => this.cloudDb.getChanges(orgId, tableName, from, {
+      limit: options.batchSize || DEFAULT_SYNC_BATCH_SIZE,
+      // Events are windowed like the local cache: default to the last 7 days
+      created_after: spec.windowed ? options.since || new Date(Date.now() - 7 * 24 * 60 * 60 * 1000) : undefined
     });
-    
-    for (const event of events) {
-      this.localDb.cacheEvent({
-        id: event.id,
-        org_id: event.org_id,
-        device_id: event.device_id,
-        event_type: event.event_type,
-        severity: event.severity,
-        source: event.source,
-        message: event.message,
-        data: event.data,
-        tags: event.tags,
-        created_at: event.created_at,
-        last_synced_at: new Date()
-      });
-    }
-  }
 
-  // Sync incidents
-  private async syncIncidents(orgId: string, since?: Date): Promise<void> {
-    const incidents = await this.cloudDb.getIncidentsByOrg(orgId);
-    
-    for (const incident of incidents) {
-      this.localDb.cacheIncident({
-        id: incident.id,
-        org_id: incident.org_id,
-        title: incident.title,
-        description: incident.description,
-        severity: incident.severity,
-        status: incident.status,
-        assigned_to: incident.assigned_to,
-        source_event_ids: incident.source_event_ids,
-        affected_device_ids: incident.affected_device_ids,
-        resolution_notes: incident.resolution_notes,
-        resolved_at: incident.resolved_at,
-        created_at: incident.created_at,
-        updated_at: incident.updated_at,
-        last_synced_at: new Date()
-      });
+    let applied = 0;
+    let batch = await fetchBatch(token);
+    while (true) {
+      const next = batch.hasMore ? fetchBatch(batch.token) : null;
+      try {
+        this.localDb.applyChangeBatch(batch);
+      } catch (error) {
+        next?.catch(() => undefined);
+        throw error;
+      }
+      applied += batch.rows.length + batch.deleted.length;
+      if (!next) {
+        return applied;
+      }
+      batch = await next;
     }
   }
 
-  // Sync files metadata
-  private async syncFiles(orgId: string, since?: Date): Promise<void> {
-    // This would need to be implemented based on your file management API
-    // For now, we'll skip the actual implementation
-    console.log('File sync not implemented yet');
-  }
-
   // Upload offline changes to cloud
   async uploadOfflineChanges(orgId: string): Promise<void> {
     try {
@@ -293,7 +190,7 @@ export class DatabaseSync {
 
   // Get sync status for all tables
   getSyncStatus(): Record<string, SyncStatus | null> {
-    const tables = ['organizations', 'users', 'devices', 'events', 'incidents', 'files'];
+    const tables = Object.keys(SYNC_TABLES);
     const status: Record<string, SyncStatus | null> = {};
     
     for (const table of tables) {
@@ -0,0 +1,117 @@
+-- Migration: 003_delta_sync.sql
+-- Description: Change tracking and tombstones for delta sync to desktop caches
+-- Created: 2026-10-18
+
+-- Every synced row carries the id of the transaction that last wrote it
+-- (sync_xid). A client's high-water mark is the (sync_xid, id) of the last
+-- row it applied, and a pull only returns rows written by transactions older
+-- than the oldest one still running (pg_snapshot_xmin), so a slow transaction
+-- committing after a pull can never land behind the client's mark.
+-- Requires PostgreSQL 13+ (xid8).
+
+CREATE OR REPLACE FUNCTION touch_sync_xid()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.sync_xid = pg_current_xact_id();
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+-- Hard deletes leave a tombstone; soft deletes (deleted_at) are sent as
+-- tombstones by the pull itself. TG_ARGV[0] names the column holding the org id.
+CREATE TABLE sync_tombstones (
+    seq BIGSERIAL PRIMARY KEY,
+    org_id UUID NOT NULL,
+    table_name VARCHAR(100) NOT NULL,
+    record_id UUID NOT NULL,
+    sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX idx_sync_tombstones_pull ON sync_tombstones(org_id, table_name, sync_xid, seq);
+
+CREATE OR REPLACE FUNCTION record_sync_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sync_tombstones (org_id, table_name, record_id)
+    VALUES ((to_jsonb(OLD) ->> TG_ARGV[0])::uuid, TG_TABLE_NAME, OLD.id);
+    RETURN OLD;
+END;
+$$ language 'plpgsql';
+
+ALTER TABLE organizations ADD COLUMN sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE users ADD COLUMN sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE devices ADD COLUMN sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE events ADD COLUMN sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE incidents ADD COLUMN sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE files ADD COLUMN sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE security_policies ADD COLUMN sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE device_groups ADD COLUMN sync_xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+
+-- Pull order: one index range scan per (org, table) from the client's mark
+CREATE INDEX idx_organizations_sync ON organizations(id, sync_xid);
+CREATE INDEX idx_users_org_sync ON users(org_id, sync_xid, id);
+CREATE INDEX idx_devices_org_sync ON devices(org_id, sync_xid, id);
+CREATE INDEX idx_events_org_sync ON events(org_id, sync_xid, id);
+CREATE INDEX idx_incidents_org_sync ON incidents(org_id, sync_xid, id);
+CREATE INDEX idx_files_org_sync ON files(org_id, sync_xid, id);
+CREATE INDEX idx_security_policies_org_sync ON security_policies(org_id, sync_xid, id);
+CREATE INDEX idx_device_groups_org_sync ON device_groups(org_id, sync_xid, id);
+
+-- Triggers for sync_xid
+CREATE TRIGGER touch_organizations_sync_xid BEFORE UPDATE ON organizations
+    FOR EACH ROW EXECUTE FUNCTION touch_sync_xid();
+
+CREATE TRIGGER touch_users_sync_xid BEFORE UPDATE ON users
+    FOR EACH ROW EXECUTE FUNCTION touch_sync_xid();
+
+CREATE TRIGGER touch_devices_sync_xid BEFORE UPDATE ON devices
+    FOR EACH ROW EXECUTE FUNCTION touch_sync_xid();
+
+CREATE TRIGGER touch_events_sync_xid BEFORE UPDATE ON events
+    FOR EACH ROW EXECUTE FUNCTION touch_sync_xid();
+
+CREATE TRIGGER touch_incidents_sync_xid BEFORE UPDATE ON incidents
+    FOR EACH ROW EXECUTE FUNCTION touch_sync_xid();
+
+CREATE TRIGGER touch_files_sync_xid BEFORE UPDATE ON files
+    FOR EACH ROW EXECUTE FUNCTION touch_sync_xid();
+
+CREATE TRIGGER touch_security_policies_sync_xid BEFORE UPDATE ON security_policies
+    FOR EACH ROW EXECUTE FUNCTION touch_sync_xid();
+
+CREATE TRIGGER touch_device_groups_sync_xid BEFORE UPDATE ON device_groups
+    FOR EACH ROW EXECUTE FUNCTION touch_sync_xid();
+
+-- Triggers for tombstones. Events are append-only and aged out by partition
+-- (and by the desktop's own retention), so they get none.
+CREATE TRIGGER tombstone_organizations AFTER DELETE ON organizations
+    FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone('id');
+
+CREATE TRIGGER tombstone_users AFTER DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone('org_id');
+
+CREATE TRIGGER tombstone_devices AFTER DELETE ON devices
+    FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone('org_id');
+
+CREATE TRIGGER tombstone_incidents AFTER DELETE ON incidents
+    FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone('org_id');
+
+CREATE TRIGGER tombstone_files AFTER DELETE ON files
+    FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone('org_id');
+
+CREATE TRIGGER tombstone_security_policies AFTER DELETE ON security_policies
+    FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone('org_id');
+
+CREATE TRIGGER tombstone_device_groups AFTER DELETE ON device_groups
+    FOR EACH ROW EXECUTE FUNCTION record_sync_tombstone('org_id');
+
+-- Tombstones are scoped like the rows they replace
+ALTER TABLE sync_tombstones ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY org_isolation_policy ON sync_tombstones
+    FOR ALL TO authenticated
+    USING (org_id = current_setting('app.current_org_id', true)::uuid);
+
+GRANT ALL PRIVILEGES ON sync_tombstones TO odin_user;
+GRANT ALL PRIVILEGES ON SEQUENCE sync_tombstones_seq_seq TO odin_user;
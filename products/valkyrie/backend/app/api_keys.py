@@ -0,0 +1,109 @@
+"""Scoped API keys stored in the `api_keys` table.
+
+Key format: ``vk_<key_id>_<secret>``. `key_id` is public (safe to log and show
+in the UI); `key_digest` is an HMAC-SHA256 of the whole key under the server
+secret and is what the lookup hits, through a unique index. The bcrypt hash in
+`api_keys.key` is still checked, but callers cache the resolved principal
+(see auth.get_current_user), so bcrypt runs at most once per key per cache
+window instead of once per row per request.
+
+Keys minted before this format existed have no digest and do not
+authenticate: the request path never scans bcrypt hashes, since that would
+let any junk key cost one bcrypt round per legacy row. Operators who still
+hold such a key convert it offline with scripts/backfill_api_key_digests.py.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+from typing import Optional, Tuple
+
+from passlib.hash import bcrypt
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+KEY_PREFIX = "vk"
+
+def _pepper() -> bytes:
+    return os.getenv("VALKYRIE_SECRET_KEY", "dev-secret-key").encode("utf-8")
+
+def key_digest(raw_key: str) -> str:
+    """Keyed digest used for the indexed lookup (never store the raw key)."""
+    return hmac.new(_pepper(), raw_key.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def parse_key_id(raw_key: str) -> Optional[str]:
+    """Return the public key id of a `vk_` key, or None for legacy keys."""
+    parts = raw_key.split("_", 2)
+    if len(parts) != 3 or parts[0] != KEY_PREFIX or not parts[1] or not parts[2]:
+        return None
+    return parts[1]
+
+def generate_api_key() -> Tuple[str, str]:
+    """Mint a new key; returns (key_id, raw_key). Show raw_key once, store only hashes."""
+    key_id = secrets.token_hex(6)
+    return key_id, f"{KEY_PREFIX}_{key_id}_{secrets.token_urlsafe(32)}"
+
+def hash_api_key(raw_key: str) -> dict:
+    """Column values to persist for a new key."""
+    return {
+        "key": bcrypt.hash(raw_key),
+        "key_id": parse_key_id(raw_key),
+        "key_digest": key_digest(raw_key),
+    }
+
+def _principal(row) -> dict:
+    return {
+        "id": None,
+        "name": f"api-key:{row['key_id']}",
+        "role": row["role"],
+        "api_key_id": str(row["id"]),
+        # Same type as projects.id, so it compares equal to route/ACL project ids
+        "project_id": int(row["project_id"]) if row["project_id"] is not None else None,
+    }
+
+def resolve_api_key(db, raw_key: str) -> Optional[dict]:
+    """Look up and verify an API key; returns a principal dict or None."""
+    digest = key_digest(raw_key)
+    row = db.execute(text("""
+        SELECT id, key_id, project_id, key, role FROM api_keys
+        WHERE key_digest = :d
+    """), {"d": digest}).mappings().first()
+    if row is None:
+        return None
+    # The digest matched through the index; bcrypt is the second factor
+    # against a leaked VALKYRIE_SECRET_KEY, not the search mechanism.
+    return _principal(row) if bcrypt.verify(raw_key, row["key"]) else None
+
+async def resolve_api_key_async(db, raw_key: str) -> Optional[dict]:
+    """resolve_api_key for an AsyncSession; bcrypt runs off the event loop."""
+    digest = key_digest(raw_key)
+    row = (await db.execute(text("""
+        SELECT id, key_id, project_id, key, role FROM api_keys
+        WHERE key_digest = :d
+    """), {"d": digest})).mappings().first()
+    if row is None:
+        return None
+    verified = await run_in_threadpool(bcrypt.verify, raw_key, row["key"])
+    return _principal(row) if verified else None
+
+def backfill_legacy_key(db, raw_key: str) -> Optional[str]:
+    """Give a pre-digest key its key_id/key_digest; returns the api_keys row id.
+
+    Checks the raw key against every digest-less row with bcrypt, so it is for
+    scripts/backfill_api_key_digests.py only, never the request path. The
+    caller commits.
+    """
+    from .auth import invalidate_principal  # auth imports this module
+    digest = key_digest(raw_key)
+    rows = db.execute(text("""
+        SELECT id, key FROM api_keys WHERE key_digest IS NULL
+    """)).mappings().all()
+    for row in rows:
+        if bcrypt.verify(raw_key, row["key"]):
+            db.execute(text("""
+                UPDATE api_keys SET key_id = :i, key_digest = :d
+                WHERE id = :id AND key_digest IS NULL
+            """), {"i": hashlib.sha256(digest.encode("ascii")).hexdigest()[:12], "d": digest, "id": row["id"]})
+            invalidate_principal(api_key=raw_key, api_key_id=row["id"])
+            return str(row["id"])
+    return None
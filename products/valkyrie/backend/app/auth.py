@@ -1,37 +1,172 @@
+import hashlib
+import os
+from typing import FrozenSet, Optional
 from fastapi import Header, HTTPException, Depends
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from .api_keys import KEY_PREFIX, resolve_api_key, resolve_api_key_async
+from .cache import LRUTTLCache
 from .db import get_db
+from .db_async import get_async_db
 
 ROLE_ORDER = {"intern":0, "viewer":1, "editor":2, "admin":3, "ceo":4}
 
-def get_current_user(x_api_key: str = Header(None), db: Session = Depends(get_db)):
-    # DEVELOPMENT MODE - Skip API key validation
-    DEV_MODE = True
-    
-    if DEV_MODE:
-        # Return a mock user for development
-        return {
-            "id": 1,
-            "name": "Developer",
-            "role": "ceo"
-        }
-    
-    # Production mode - validate API key
-    user = db.execute(text("SELECT id, name, role FROM users WHERE api_key=:k"), {"k": x_api_key}).mappings().first()
+# DEVELOPMENT MODE - Skip API key validation
+DEV_MODE = True
+
+# Resolved principals keyed by a digest of the API key, so raw keys never sit
+# in process memory longer than the request that carried them. Writers of
+# users.api_key/role and api_keys call invalidate_principal; the TTL bounds
+# how long other workers (and offline scripts) can serve a stale principal.
+_principal_cache = LRUTTLCache(
+    max_entries=int(os.getenv("VALKYRIE_AUTH_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("VALKYRIE_AUTH_CACHE_TTL", "30")),
+)
+
+# Readable project ids per user id, so authorization checks become set tests
+# instead of one query per project. project_membership writers call
+# invalidate_acl; other workers pick the change up within
+# VALKYRIE_ACL_CACHE_TTL seconds.
+_acl_cache = LRUTTLCache(
+    max_entries=int(os.getenv("VALKYRIE_ACL_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("VALKYRIE_ACL_CACHE_TTL", "60")),
+)
+
+def _key_digest(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def invalidate_principal(api_key: Optional[str] = None, user_id: Optional[int] = None,
+                         api_key_id: Optional[str] = None) -> int:
+    """Forget cached principals after a key or role write; returns how many went.
+
+    By raw key, by users.id (every key of that user, e.g. after a role change)
+    or by api_keys row id (rotation/revocation). No argument drops them all.
+    """
+    if api_key is None and user_id is None and api_key_id is None:
+        dropped = len(_principal_cache)
+        _principal_cache.clear()
+        return dropped
+    dropped = int(api_key is not None and _principal_cache.pop(_key_digest(api_key)))
+    if user_id is not None or api_key_id is not None:
+        dropped += _principal_cache.pop_where(
+            lambda _k, principal: (user_id is not None and principal["id"] == user_id)
+            or (api_key_id is not None and principal.get("api_key_id") == str(api_key_id)))
+    return dropped
+
+def clear_principal_cache():
+    _principal_cache.clear()
+
+def principal_cache_stats() -> dict:
+    """Hit/miss counters; every hit is one users lookup saved."""
+    return _principal_cache.stats()
+
+# get_current_user/readable_project_ids come in a sync and an async flavour;
+# everything but the query execution lives in the helpers below so the two
+# cannot drift apart.
+_USER_BY_KEY = text("SELECT id, name, role FROM users WHERE api_key=:k")
+_MEMBERSHIPS = text("SELECT project_id FROM project_membership WHERE user_id=:u")
+_NEEDS_LOOKUP = object()
+
+def _dev_user() -> dict:
+    # Return a mock user for development
+    return {
+        "id": 1,
+        "name": "Developer",
+        "role": "ceo"
+    }
+
+def _cached_principal(x_api_key: Optional[str]):
+    """(cache key, cached principal or None); 401 without a key."""
+    if not x_api_key:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    digest = _key_digest(x_api_key)
+    return digest, _principal_cache.get(digest)
+
+def _is_user_key(x_api_key: str) -> bool:
+    """Plain users.api_key values; `vk_` keys live in api_keys."""
+    return not x_api_key.startswith(KEY_PREFIX + "_")
+
+def _remember_principal(digest: str, user: Optional[dict]) -> dict:
     if not user:
         raise HTTPException(status_code=401, detail="Invalid API key")
+    _principal_cache.set(digest, user)
     return user
 
-def user_can_read_project(user, project_id: int, db: Session) -> bool:
+def get_current_user(x_api_key: str = Header(None), db: Session = Depends(get_db)):
+    if DEV_MODE:
+        return _dev_user()
+
+    # Production mode - validate API key
+    digest, user = _cached_principal(x_api_key)
+    if user is not None:
+        return user
+    if _is_user_key(x_api_key):
+        row = db.execute(_USER_BY_KEY, {"k": x_api_key}).mappings().first()
+        user = dict(row) if row else None
+    if user is None:
+        # Scoped key from api_keys: indexed digest lookup + one bcrypt check,
+        # then served from the principal cache for the rest of the TTL.
+        user = resolve_api_key(db, x_api_key)
+    return _remember_principal(digest, user)
+
+async def get_current_user_async(x_api_key: str = Header(None), db: AsyncSession = Depends(get_async_db)):
+    """get_current_user for endpoints on the async engine (same cache, same rules)."""
+    if DEV_MODE:
+        return _dev_user()
+
+    digest, user = _cached_principal(x_api_key)
+    if user is not None:
+        return user
+    if _is_user_key(x_api_key):
+        row = (await db.execute(_USER_BY_KEY, {"k": x_api_key})).mappings().first()
+        user = dict(row) if row else None
+    if user is None:
+        user = await resolve_api_key_async(db, x_api_key)
+    return _remember_principal(digest, user)
+
+def _readable_without_query(user):
+    """The readable set when no query is needed, else _NEEDS_LOOKUP."""
     if user["role"] == "ceo":
-        return True
-    r = db.execute(text("""
-        SELECT 1 FROM project_membership
-        WHERE user_id=:u AND project_id=:p
-        LIMIT 1
-    """), {"u": user["id"], "p": project_id}).first()
-    return r is not None
+        return None
+    if user["id"] is None:
+        # Scoped API key: bound to the project it was issued for
+        return frozenset([user["project_id"]]) if user.get("project_id") is not None else frozenset()
+    ids = _acl_cache.get(user["id"])
+    return _NEEDS_LOOKUP if ids is None else ids
+
+def _remember_memberships(user, rows) -> FrozenSet:
+    ids = frozenset(r[0] for r in rows)
+    _acl_cache.set(user["id"], ids)
+    return ids
+
+def invalidate_acl(user_id: Optional[int] = None):
+    """Call after writing project_membership (None = every user, e.g. bulk changes)."""
+    if user_id is None:
+        _acl_cache.clear()
+    else:
+        _acl_cache.pop(user_id)
+
+def readable_project_ids(user, db: Session) -> Optional[FrozenSet]:
+    """Projects the user may read, or None when the user may read every project."""
+    ids = _readable_without_query(user)
+    if ids is _NEEDS_LOOKUP:
+        ids = _remember_memberships(user, db.execute(_MEMBERSHIPS, {"u": user["id"]}).all())
+    return ids
+
+async def readable_project_ids_async(user, db: AsyncSession) -> Optional[FrozenSet]:
+    """readable_project_ids on an AsyncSession, sharing the same ACL cache."""
+    ids = _readable_without_query(user)
+    if ids is _NEEDS_LOOKUP:
+        ids = _remember_memberships(user, (await db.execute(_MEMBERSHIPS, {"u": user["id"]})).all())
+    return ids
+
+def user_can_read_project(user, project_id: int, db: Session) -> bool:
+    ids = readable_project_ids(user, db)
+    return ids is None or project_id in ids
+
+def acl_cache_stats() -> dict:
+    return _acl_cache.stats()
 
 def require_min_role(user, min_role: str):
     if ROLE_ORDER[user["role"]] < ROLE_ORDER[min_role]:
@@ -0,0 +1,205 @@
+"""Content-addressed, deduplicating blob store for uploaded files.
+
+File bytes live once per SHA-256 under <root>/ab/cd/<sha256>; which user file
+points at which blob is tracked in the `user_files` table and every blob row
+in `blobs` carries a reference count (migration 005_blob_store). Uploading
+content that is already stored costs a metadata row, not another copy.
+
+Ordering rules that keep refcounts and disk in agreement:
+  * take the reference in the DB (row lock on the blob) before touching disk,
+    and commit only after the file is in place;
+  * gc() locks a zero-ref row, unlinks the file, then deletes the row in the
+    same transaction, so a concurrent upload of that content waits and then
+    re-creates both.
+
+A crash or a failed commit after adopt() leaves a file with no `blobs` row.
+register_orphans() finds such files (and stale staging files) once they are
+older than the GC grace period and records them as zero-ref blobs, so the
+next gc() removes them under the same row locks as any other blob.
+"""
+import os
+import time
+from typing import Iterator, Optional, Tuple
+
+import aiofiles.os
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .uploads import discard
+
+BLOB_DIR = "valkyrie_blobs"
+GC_GRACE_SECONDS = int(os.getenv("VALKYRIE_BLOB_GC_GRACE_SECONDS", "3600"))
+
+
+class BlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def path_for(self, sha256: str) -> str:
+        if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+            raise ValueError("invalid sha256")
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def has(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    async def adopt(self, tmp_path: str, sha256: str) -> bool:
+        """Move a staged upload into place; False if the content was already stored."""
+        final = self.path_for(sha256)
+        if os.path.exists(final):
+            await discard(tmp_path)
+            return False
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        await aiofiles.os.replace(tmp_path, final)
+        return True
+
+    def walk(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """(sha256, stat) for every blob file on disk."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root and "tmp" in dirnames:
+                dirnames.remove("tmp")
+            for name in filenames:
+                try:
+                    self.path_for(name)
+                    yield name, os.stat(os.path.join(dirpath, name))
+                except (ValueError, FileNotFoundError):
+                    continue
+
+
+def _incref(db: Session, sha256: str, size: int):
+    db.execute(text("""
+        INSERT INTO blobs (sha256, size_bytes, refcount) VALUES (:s, :n, 1)
+        ON CONFLICT (sha256) DO UPDATE
+        SET refcount = blobs.refcount + 1, updated_at = now()
+    """), {"s": sha256, "n": size})
+
+
+def _decref(db: Session, sha256: str):
+    db.execute(text("""
+        UPDATE blobs SET refcount = refcount - 1, updated_at = now()
+        WHERE sha256 = :s
+    """), {"s": sha256})
+
+
+def link_file(db: Session, user_id: str, filename: str, sha256: str, size: int,
+              project_id: Optional[int] = None) -> Optional[dict]:
+    """Point user_id/filename at a blob, replacing any previous content.
+
+    Returns the row the name pointed at before (None for a new name). Does
+    not commit: the caller commits once the blob is on disk.
+    """
+    previous = db.execute(text("""
+        SELECT sha256, size_bytes, project_id FROM user_files
+        WHERE user_id = :u AND filename = :f FOR UPDATE
+    """), {"u": user_id, "f": filename}).mappings().first()
+    previous = dict(previous) if previous is not None else None
+    if previous is None or previous["sha256"] != sha256:
+        _incref(db, sha256, size)
+    db.execute(text("""
+        INSERT INTO user_files (user_id, filename, sha256, size_bytes, project_id)
+        VALUES (:u, :f, :s, :n, :p)
+        ON CONFLICT (user_id, filename) DO UPDATE
+        SET sha256 = excluded.sha256, size_bytes = excluded.size_bytes,
+            project_id = excluded.project_id, created_at = now()
+    """), {"u": user_id, "f": filename, "s": sha256, "n": size, "p": project_id})
+    if previous is not None and previous["sha256"] != sha256:
+        _decref(db, previous["sha256"])
+    return previous
+
+
+def unlink_file(db: Session, user_id: str, filename: str) -> Optional[dict]:
+    """Drop a user's reference and return the removed row; the blob goes at the next gc()."""
+    removed = db.execute(text("""
+        DELETE FROM user_files WHERE user_id = :u AND filename = :f
+        RETURNING sha256, size_bytes, project_id
+    """), {"u": user_id, "f": filename}).mappings().first()
+    if removed is not None:
+        _decref(db, removed["sha256"])
+        removed = dict(removed)
+    return removed
+
+
+def lookup_file(db: Session, user_id: str, filename: str):
+    return db.execute(text("""
+        SELECT uf.filename, uf.sha256, uf.size_bytes, uf.project_id, uf.created_at
+        FROM user_files uf WHERE uf.user_id = :u AND uf.filename = :f
+    """), {"u": user_id, "f": filename}).mappings().first()
+
+
+def gc(db: Session, store: BlobStore, grace_seconds: int = GC_GRACE_SECONDS, limit: int = 1000) -> dict:
+    """Delete blobs nobody references any more (untouched for grace_seconds)."""
+    rows = db.execute(text("""
+        SELECT sha256, size_bytes FROM blobs
+        WHERE refcount <= 0 AND updated_at < now() - (:g * interval '1 second')
+        ORDER BY updated_at LIMIT :lim
+        FOR UPDATE SKIP LOCKED
+    """), {"g": grace_seconds, "lim": limit}).all()
+    freed = 0
+    for sha256, size in rows:
+        try:
+            os.remove(store.path_for(sha256))
+            freed += size or 0
+        except FileNotFoundError:
+            pass
+        db.execute(text("DELETE FROM blobs WHERE sha256 = :s"), {"s": sha256})
+    db.commit()
+    return {"deleted_blobs": len(rows), "bytes_freed": freed}
+
+
+def register_orphans(db: Session, store: BlobStore, grace_seconds: int = GC_GRACE_SECONDS,
+                     batch: int = 1000) -> dict:
+    """Record blob files without a `blobs` row as zero-ref blobs; drop stale staging files.
+
+    Only files untouched for grace_seconds are considered, which keeps this
+    away from uploads between adopt() and commit. ON CONFLICT DO NOTHING
+    waits for an in-flight upload's uncommitted row and then leaves it alone;
+    once registered, a concurrent upload of the same content just takes a
+    reference to the row like any dedup hit.
+    """
+    cutoff = time.time() - grace_seconds
+    candidates = [(sha256, st.st_size, st.st_mtime) for sha256, st in store.walk() if st.st_mtime < cutoff]
+    registered = 0
+    for start in range(0, len(candidates), batch):
+        chunk = candidates[start:start + batch]
+        known = set(db.execute(text("SELECT sha256 FROM blobs WHERE sha256 = ANY(:s)"),
+                               {"s": [c[0] for c in chunk]}).scalars())
+        for sha256, size, mtime in chunk:
+            if sha256 not in known:
+                registered += db.execute(text("""
+                    INSERT INTO blobs (sha256, size_bytes, refcount, created_at, updated_at)
+                    VALUES (:s, :n, 0, to_timestamp(:t), to_timestamp(:t))
+                    ON CONFLICT (sha256) DO NOTHING
+                """), {"s": sha256, "n": size, "t": mtime}).rowcount
+        db.commit()
+
+    stale = 0
+    if os.path.isdir(store.tmp_dir):
+        for name in os.listdir(store.tmp_dir):
+            path = os.path.join(store.tmp_dir, name)
+            try:
+                if name.endswith(".part") and os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+                    stale += 1
+            except FileNotFoundError:
+                pass
+    return {"orphan_blobs": registered, "stale_tmp_files": stale}
+
+
+def dedup_stats(db: Session) -> dict:
+    row = db.execute(text("""
+        SELECT count(*) AS blobs,
+               coalesce(sum(size_bytes), 0) AS physical_bytes,
+               coalesce(sum(size_bytes * greatest(refcount, 0)), 0) AS logical_bytes,
+               coalesce(sum(greatest(refcount, 0)), 0) AS refs
+        FROM blobs
+    """)).mappings().first()
+    physical, logical = int(row["physical_bytes"]), int(row["logical_bytes"])
+    return {
+        "blobs": int(row["blobs"]),
+        "references": int(row["refs"]),
+        "physical_bytes": physical,
+        "logical_bytes": logical,
+        "bytes_saved": max(logical - physical, 0),
+        "dedup_ratio": round(logical / physical, 3) if physical else 1.0,
+    }
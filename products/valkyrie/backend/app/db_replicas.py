@@ -0,0 +1,193 @@
+"""Read-replica routing for read-only endpoints.
+
+Endpoints that only read depend on `get_read_db` instead of `get_async_db`;
+everything that writes keeps using the primary. `get_read_db` hands out a
+session on a healthy replica (round robin) unless one of these applies, in
+which case it falls back to the primary:
+
+  * no replica is configured, healthy, or within VALKYRIE_REPLICA_MAX_LAG
+    seconds of replay lag (checked every VALKYRIE_REPLICA_CHECK_SECONDS);
+  * read-your-writes: the client wrote within the last
+    VALKYRIE_READ_YOUR_WRITES_SECONDS. Successful unsafe requests
+    (POST/PUT/PATCH/DELETE) get a `valkyrie_primary_until` cookie and an
+    `X-Valkyrie-Primary-Until` header (`pin_writes` middleware); clients
+    without cookies (API keys) echo the header back;
+  * the request asks for it: `X-Valkyrie-Consistency: strong`, e.g. right
+    after an `ingest_done` event, whose rows were committed by the worker.
+
+Replicas: VALKYRIE_DATABASE_REPLICA_URLS, comma separated. Any URL the
+async engine accepts works, so two local Postgres (or SQLite) databases can
+stand in for a primary/replica pair in tests. The response header
+`X-Valkyrie-DB` names the database that served the read.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import AsyncIterator, List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .db_async import AsyncSessionLocal, create_engine_from_env
+
+logger = logging.getLogger("uvicorn.error")
+
+REPLICA_URLS = [u.strip() for u in os.getenv("VALKYRIE_DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+MAX_LAG = float(os.getenv("VALKYRIE_REPLICA_MAX_LAG", "5"))
+CHECK_INTERVAL = float(os.getenv("VALKYRIE_REPLICA_CHECK_SECONDS", "2"))
+CHECK_TIMEOUT = float(os.getenv("VALKYRIE_REPLICA_CHECK_TIMEOUT", "1"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("VALKYRIE_READ_YOUR_WRITES_SECONDS", "10"))
+
+PIN_COOKIE = "valkyrie_primary_until"
+PIN_HEADER = "x-valkyrie-primary-until"
+CONSISTENCY_HEADER = "x-valkyrie-consistency"
+UNSAFE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+# (pg_last_xact_replay_timestamp alone would report an idle primary as lag).
+# NULL when the WAL receiver is not streaming: a disconnected standby has
+# replayed everything it received and would otherwise look caught up. Reading
+# pg_stat_wal_receiver.status needs pg_read_all_stats (or pg_monitor).
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class Replica:
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.sessions = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+        self.healthy = False  # until the first check says otherwise
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    async def check(self, max_lag: float, timeout: float = CHECK_TIMEOUT):
+        try:
+            async with asyncio.timeout(timeout):
+                async with self.engine.connect() as con:
+                    if self.engine.dialect.name == "postgresql":
+                        lag = (await con.execute(text(LAG_SQL))).scalar()
+                    else:
+                        await con.execute(text("SELECT 1"))
+                        lag = 0.0
+            if lag is None:
+                self.healthy, self.lag, self.error = False, None, "WAL receiver is not streaming"
+            else:
+                self.lag, self.error = float(lag), None
+                self.healthy = self.lag <= max_lag
+        except Exception as exc:
+            self.healthy, self.lag, self.error = False, None, str(exc)[:200] or type(exc).__name__
+        self.checked_at = time.time()
+
+    def stats(self) -> dict:
+        return {"name": self.name, "healthy": self.healthy, "lag_seconds": self.lag, "error": self.error,
+                "checked_at": self.checked_at}
+
+
+class ReplicaRouter:
+    def __init__(self, replica_urls: List[str] = (), max_lag: float = MAX_LAG,
+                 check_interval: float = CHECK_INTERVAL, primary_sessions=AsyncSessionLocal,
+                 engine_factory=create_engine_from_env):
+        self.replicas = [Replica(f"replica-{i + 1}", engine_factory(url)) for i, url in enumerate(replica_urls)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.primary_sessions = primary_sessions
+        self._round_robin = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self.reads = {"primary": 0, **{r.name: 0 for r in self.replicas}}
+        self.fallbacks = 0
+
+    async def check(self):
+        await asyncio.gather(*(r.check(self.max_lag) for r in self.replicas))
+
+    async def _run_checks(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    async def start(self):
+        if self.replicas and self._task is None:
+            await self.check()
+            self._task = asyncio.get_running_loop().create_task(self._run_checks())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for r in self.replicas:
+            await r.engine.dispose()
+
+    def pick(self) -> Optional[Replica]:
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def stats(self) -> dict:
+        return {"replicas": [r.stats() for r in self.replicas], "reads": dict(self.reads),
+                "fallbacks": self.fallbacks, "max_lag_seconds": self.max_lag}
+
+
+replica_router = ReplicaRouter(REPLICA_URLS)
+
+
+def _pinned_to_primary(request: Request) -> bool:
+    if request.headers.get(CONSISTENCY_HEADER, "").lower() == "strong":
+        return True
+    for raw in (request.cookies.get(PIN_COOKIE), request.headers.get(PIN_HEADER)):
+        try:
+            if raw and float(raw) > time.time():
+                return True
+        except ValueError:
+            pass
+    return False
+
+
+async def get_read_db(request: Request, response: Response) -> AsyncIterator[AsyncSession]:
+    """Session for read-only endpoints: a healthy replica, or the primary (see module docstring)."""
+    router = getattr(request.app.state, "replica_router", replica_router)
+    replica = None if _pinned_to_primary(request) else router.pick()
+    if replica is None:
+        if router.replicas:
+            router.fallbacks += 1
+        router.reads["primary"] += 1
+        response.headers["X-Valkyrie-DB"] = "primary"
+        async with router.primary_sessions() as db:
+            yield db
+        return
+    router.reads[replica.name] += 1
+    response.headers["X-Valkyrie-DB"] = replica.name
+    async with replica.sessions() as db:
+        try:
+            yield db
+        except DBAPIError as exc:
+            if exc.connection_invalidated:
+                # Take it out of rotation now instead of at the next health check
+                replica.healthy, replica.error = False, str(exc)[:200]
+            raise
+
+
+async def pin_writes(request: Request, call_next):
+    """HTTP middleware: after a successful write, keep this client's reads on the primary."""
+    response = await call_next(request)
+    if request.method in UNSAFE_METHODS and response.status_code < 400:
+        until = f"{time.time() + READ_YOUR_WRITES_SECONDS:.3f}"
+        response.headers["X-Valkyrie-Primary-Until"] = until
+        response.set_cookie(PIN_COOKIE, until, max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True,
+                            samesite="lax")
+    return response
@@ -0,0 +1,207 @@
+"""Embedding service shared by the ingest worker and /search.
+
+Lookups go memory LRU -> `embedding_cache` table -> model, keyed on
+(model, sha256(text)), so boilerplate chunks and repeated queries are
+embedded once per model. Vectors are stored as raw NumPy bytes
+(VALKYRIE_EMBED_CACHE_DTYPE, float16 by default: half the space, and far more
+precision than cosine ranking needs). Every vector handed out is rounded
+through that dtype (`quantize`), whichever tier served it, so a text always
+gets the same vector.
+
+`await embed(text)` is the request-path entry point: concurrent calls that
+arrive within VALKYRIE_EMBED_BATCH_MS are grouped into one batch, so a burst
+of searches costs one cache round trip and one model call, not N.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import text
+
+from .cache import LRUTTLCache
+from .embeddings import EMBED_DIM, MODEL_NAME, embed_texts
+
+logger = logging.getLogger("uvicorn.error")
+
+CACHE_SIZE = int(os.getenv("VALKYRIE_EMBED_CACHE_SIZE", "50000"))
+CACHE_DTYPE = np.dtype(os.getenv("VALKYRIE_EMBED_CACHE_DTYPE", "float16"))
+BATCH_WINDOW = float(os.getenv("VALKYRIE_EMBED_BATCH_MS", "3")) / 1000
+MAX_BATCH = int(os.getenv("VALKYRIE_EMBED_MAX_BATCH", "128"))
+
+
+def text_hash(value: str) -> bytes:
+    return hashlib.sha256(value.encode("utf-8")).digest()
+
+
+class EmbeddingService:
+    def __init__(self, embed_fn: Callable[[Sequence[str]], np.ndarray] = embed_texts, model: str = MODEL_NAME,
+                 dim: int = EMBED_DIM, engine_factory: Optional[Callable] = None, cache_size: int = CACHE_SIZE,
+                 dtype: np.dtype = CACHE_DTYPE, batch_window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH):
+        self.embed_fn = embed_fn
+        self.model = model
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._engine_factory = engine_factory
+        # Embeddings are deterministic per model: entries never go stale
+        self._memory = LRUTTLCache(max_entries=cache_size, ttl=float("inf"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self.db_hits = 0
+        self.db_misses = 0
+        self.computed = 0
+        self.batches = 0
+
+    def quantize(self, vectors: np.ndarray) -> np.ndarray:
+        """float32 vectors rounded through the storage dtype, as the DB tier returns them."""
+        return np.asarray(vectors).astype(self.dtype).astype(np.float32)
+
+    # -- persistent tier --
+
+    def _load(self, hashes: List[bytes]) -> dict:
+        if self._engine_factory is None or not hashes:
+            return {}
+        try:
+            with self._engine_factory().connect() as con:
+                rows = con.execute(text("""
+                    SELECT text_hash, vector FROM embedding_cache
+                    WHERE model = :m AND text_hash = ANY(:h)
+                """), {"m": self.model, "h": hashes}).all()
+        except Exception as exc:
+            logger.warning("Embedding cache read failed: %s", exc)
+            return {}
+        return {bytes(h): np.frombuffer(bytes(v), dtype=self.dtype).astype(np.float32) for h, v in rows}
+
+    def _save(self, hashes: List[bytes], vectors: np.ndarray):
+        if self._engine_factory is None or not hashes:
+            return
+        try:
+            with self._engine_factory().begin() as con:
+                con.execute(text("""
+                    INSERT INTO embedding_cache (model, text_hash, dtype, vector)
+                    SELECT :m, h, :d, v FROM unnest(CAST(:h AS BYTEA[]), CAST(:v AS BYTEA[])) AS t(h, v)
+                    ON CONFLICT (model, text_hash) DO NOTHING
+                """), {"m": self.model, "d": self.dtype.name, "h": hashes,
+                       "v": [vec.astype(self.dtype).tobytes() for vec in vectors]})
+        except Exception as exc:
+            logger.warning("Embedding cache write failed: %s", exc)
+
+    # -- sync API (worker threads, threadpool) --
+
+    def lookup(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors for `texts` (None where nothing is stored yet)."""
+        hashes = [text_hash(t) for t in texts]
+        return self._lookup_db(hashes, [self._memory.get(h) for h in hashes])
+
+    def _lookup_db(self, hashes: List[bytes], found: List[Optional[np.ndarray]]) -> List[Optional[np.ndarray]]:
+        """Fill the memory misses in `found` from the DB tier (one hit or miss per distinct text)."""
+        missing = list(dict.fromkeys(h for h, v in zip(hashes, found) if v is None))
+        if missing:
+            stored = self._load(missing)
+            self.db_hits += len(stored)
+            self.db_misses += len(missing) - len(stored)
+            for i, h in enumerate(hashes):
+                if found[i] is None and h in stored:
+                    found[i] = stored[h]
+                    self._memory.set(h, stored[h])
+        return found
+
+    def store(self, texts: Sequence[str], vectors: np.ndarray) -> np.ndarray:
+        """Remember freshly computed vectors in both tiers; returns them quantized."""
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.quantize(vectors)
+        for h, v in zip(hashes, vectors):
+            self._memory.set(h, v)
+        self._save(hashes, vectors)
+        return vectors
+
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        return self._embed(texts, self.lookup(texts))
+
+    def _embed_memory_misses(self, texts: Sequence[str]) -> np.ndarray:
+        """embed_many for texts that already missed memory (embed()): starts at the DB tier."""
+        return self._embed(texts, self._lookup_db([text_hash(t) for t in texts], [None] * len(texts)))
+
+    def _embed(self, texts: Sequence[str], found: List[Optional[np.ndarray]]) -> np.ndarray:
+        todo = [i for i, v in enumerate(found) if v is None]
+        if todo:
+            # Identical texts in one batch are computed once
+            unique = list(dict.fromkeys(texts[i] for i in todo))
+            vectors = self.store(unique, self.embed_fn(unique))
+            self.computed += len(unique)
+            by_text = dict(zip(unique, vectors))
+            for i in todo:
+                found[i] = by_text[texts[i]]
+        if not found:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack(found).astype(np.float32, copy=False)
+
+    # -- async API (request path) --
+
+    async def embed(self, value: str) -> np.ndarray:
+        """Embed one text, batched with whatever else arrives in the window."""
+        cached = self._memory.get(text_hash(value))
+        if cached is not None:
+            return cached
+        if self._batcher is None or self._batcher.done():
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.get_running_loop().create_task(self._run_batches())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((value, future))
+        return await future
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batches += 1
+            try:
+                vectors = await asyncio.to_thread(self._embed_memory_misses, [t for t, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    async def close(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "memory": self._memory.stats(),
+            "db_hits": self.db_hits,
+            "db_misses": self.db_misses,
+            "computed": self.computed,
+            "batches": self.batches,
+        }
+
+
+def _engine():
+    from .db import engine
+    return engine
+
+
+embedding_service = EmbeddingService(engine_factory=_engine)
@@ -0,0 +1,43 @@
+"""Deterministic text embeddings for chunks and queries.
+
+Feature hashing of word unigrams and bigrams into a fixed number of buckets,
+L2-normalised. The same text always maps to the same vector, with no model
+download and no GPU, which is what a self-hosted box (or a Raspberry Pi)
+can afford. VALKYRIE_EMBED_DIM must match the chunks.embedding column.
+"""
+import hashlib
+import os
+import re
+from typing import List, Sequence
+
+import numpy as np
+
+EMBED_DIM = int(os.getenv("VALKYRIE_EMBED_DIM", "384"))
+MODEL_NAME = f"hash-bigram-{EMBED_DIM}"
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def _bucket(feature: str, dim: int):
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dim, 1.0 if (h >> 63) & 1 else -1.0
+
+
+def embed_texts(texts: Sequence[str], dim: int = EMBED_DIM) -> np.ndarray:
+    """Embed a batch of texts; returns a (len(texts), dim) float32 array."""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = _TOKEN.findall(text.lower())
+        features: List[str] = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            idx, sign = _bucket(feature, dim)
+            out[row, idx] += sign
+        norm = np.linalg.norm(out[row])
+        if norm:
+            out[row] /= norm
+    return out
+
+
+def to_pgvector(vector: np.ndarray) -> str:
+    """Text form accepted by pgvector (`[0.1,0.2,...]`), for COPY and literals."""
+    return "[" + ",".join(f"{x:.6g}" for x in vector.tolist()) + "]"
@@ -0,0 +1,194 @@
+"""Event bus behind broadcast_event.
+
+`local` (default) hands events straight to this process's EventBroadcaster,
+which is all a single uvicorn worker needs. `redis` publishes to a Redis
+channel instead and runs one subscriber task per worker that feeds its local
+broadcaster, so /ws/events clients see every event no matter which worker
+(or RQ job) produced it. Select with VALKYRIE_EVENT_BUS=redis.
+
+Events published within `VALKYRIE_EVENT_BATCH_MS` are sent as one Redis
+message (a JSON list), which keeps ingest-progress bursts to a handful of
+PUBLISH round trips.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import List, Optional
+
+from .events import EventBroadcaster
+
+logger = logging.getLogger("uvicorn.error")
+
+EVENTS_CHANNEL = os.getenv("VALKYRIE_EVENTS_CHANNEL", "valkyrie:events")
+BATCH_WINDOW = float(os.getenv("VALKYRIE_EVENT_BATCH_MS", "5")) / 1000
+MAX_BATCH = int(os.getenv("VALKYRIE_EVENT_MAX_BATCH", "256"))
+
+
+def _encode(events: List[dict]) -> str:
+    return json.dumps(events, default=str, separators=(",", ":"))
+
+
+def _decode(data) -> List[dict]:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    decoded = json.loads(data)
+    return decoded if isinstance(decoded, list) else [decoded]
+
+
+class LocalEventBus:
+    """Single-process bus: publish goes straight to the local broadcaster."""
+
+    def __init__(self, broadcaster: EventBroadcaster):
+        self.broadcaster = broadcaster
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: dict):
+        self.broadcaster.publish(event)
+
+
+class RedisEventBus:
+    """Cross-worker bus over Redis pub/sub (one subscriber task per worker)."""
+
+    def __init__(self, broadcaster: EventBroadcaster, client=None, redis_url: Optional[str] = None,
+                 channel: str = EVENTS_CHANNEL, batch_window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH):
+        if client is None:
+            import redis.asyncio as aioredis
+            client = aioredis.from_url(redis_url or os.getenv("VALKYRIE_REDIS_URL", "redis://localhost:6379/0"))
+        self.broadcaster = broadcaster
+        self.client = client
+        self.channel = channel
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._outbox: List[dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._subscriber: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self.messages_published = 0
+        self.messages_received = 0
+
+    async def start(self):
+        self._subscriber = asyncio.get_running_loop().create_task(self._subscribe_loop())
+        # Don't report startup done before SUBSCRIBE went through, or early
+        # events published by this worker would miss its own clients.
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("Redis event bus not subscribed yet; continuing startup")
+
+    async def stop(self):
+        # The pending delayed flush would outlive the loop; send its batch now
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+            try:
+                await self._subscriber
+            except asyncio.CancelledError:
+                pass
+
+    async def publish(self, event: dict):
+        self._outbox.append(event)
+        if len(self._outbox) >= self.max_batch:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.batch_window)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self._outbox:
+            return
+        batch, self._outbox = self._outbox, []
+        try:
+            await self.client.publish(self.channel, _encode(batch))
+            self.messages_published += 1
+        except Exception as exc:
+            # Best-effort like the WebSocket sends: at least serve this worker.
+            logger.warning("Redis publish failed, delivering %d events locally: %s", len(batch), exc)
+            for event in batch:
+                self.broadcaster.publish(event)
+
+    async def _subscribe_loop(self):
+        backoff = 0.5
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                self._ready.set()
+                backoff = 0.5
+                while True:
+                    msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if msg is None or msg.get("type") != "message":
+                        continue
+                    self.messages_received += 1
+                    for event in _decode(msg["data"]):
+                        self.broadcaster.publish(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Redis event subscriber error, retrying in %.1fs: %s", backoff, exc)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+class EventPublisher:
+    """Synchronous publisher for RQ jobs (valkyrie-worker) - no HTTP hop.
+
+    Events are buffered and sent as one message per `flush()` or every
+    `max_batch` events; call flush() at stage boundaries and job end.
+    """
+
+    def __init__(self, client=None, redis_url: Optional[str] = None,
+                 channel: str = EVENTS_CHANNEL, max_batch: int = MAX_BATCH):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(redis_url or os.getenv("VALKYRIE_REDIS_URL", "redis://localhost:6379/0"))
+        self.client = client
+        self.channel = channel
+        self.max_batch = max_batch
+        self._outbox: List[dict] = []
+
+    def publish(self, event: dict):
+        self._outbox.append(event)
+        if len(self._outbox) >= self.max_batch:
+            self.flush()
+
+    def flush(self):
+        if self._outbox:
+            batch, self._outbox = self._outbox, []
+            self.client.publish(self.channel, _encode(batch))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def create_event_bus(broadcaster: EventBroadcaster):
+    kind = os.getenv("VALKYRIE_EVENT_BUS", "local").lower()
+    if kind == "redis":
+        return RedisEventBus(broadcaster)
+    if kind != "local":
+        logger.warning("Unknown VALKYRIE_EVENT_BUS=%r, using local", kind)
+    return LocalEventBus(broadcaster)
@@ -0,0 +1,162 @@
+"""In-process WebSocket fan-out for /ws/events.
+
+Each event is serialized once; every connection owns a bounded queue and a
+sender task, so a slow client only ever delays itself. When a queue is full
+the oldest pending event is dropped, except that progress events for the same
+job coalesce in place (only the latest percentage is worth sending).
+
+Clients may subscribe to project topics; events without a project_id are
+delivered to everyone.
+"""
+import asyncio
+import itertools
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Set
+
+DEFAULT_QUEUE_SIZE = int(os.getenv("VALKYRIE_WS_QUEUE_SIZE", "256"))
+
+
+def event_topic(event: dict) -> Optional[str]:
+    project_id = event.get("project_id")
+    return None if project_id is None else f"project:{project_id}"
+
+
+def coalesce_key(event: dict) -> Optional[Hashable]:
+    """Events sharing a key replace each other while still queued."""
+    kind = event.get("type") or ""
+    if "progress" in kind and event.get("job_id") is not None:
+        return (kind, event["job_id"])
+    return None
+
+
+class Subscriber:
+    """One WebSocket connection: bounded pending queue + its own sender task."""
+
+    _seq = itertools.count()
+
+    def __init__(self, ws, topics: Optional[Set[str]], max_queue: int):
+        self.ws = ws
+        self.topics = topics
+        self.max_queue = max_queue
+        self._pending: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+
+    def offer(self, payload: str, key: Optional[Hashable]):
+        if key is not None and key in self._pending:
+            self._pending[key] = payload
+            self.coalesced += 1
+            return
+        if len(self._pending) >= self.max_queue:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        self._pending[key if key is not None else next(self._seq)] = payload
+        self._wakeup.set()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def run(self, on_dead):
+        try:
+            while not self.closed:
+                if not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                _, payload = self._pending.popitem(last=False)
+                await self.ws.send_text(payload)
+                self.sent += 1
+        except Exception:
+            # Connection went away mid-send; the receive loop will notice too.
+            on_dead(self)
+
+
+class EventBroadcaster:
+    def __init__(self, max_queue: int = DEFAULT_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._everything: Set[Subscriber] = set()
+        self._by_topic: Dict[str, Set[Subscriber]] = {}
+        self.published = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def subscribe(self, ws, project_ids: Optional[Iterable] = None) -> Subscriber:
+        topics = {f"project:{p}" for p in project_ids} if project_ids else None
+        sub = Subscriber(ws, topics, self.max_queue)
+        if topics is None:
+            self._everything.add(sub)
+        else:
+            for topic in topics:
+                self._by_topic.setdefault(topic, set()).add(sub)
+        sub.task = asyncio.get_running_loop().create_task(sub.run(self._forget))
+        return sub
+
+    def _forget(self, sub: Subscriber):
+        if sub.closed:
+            return
+        sub.closed = True
+        self.dropped += sub.dropped
+        self.coalesced += sub.coalesced
+        self._everything.discard(sub)
+        for topic in sub.topics or ():
+            subs = self._by_topic.get(topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_topic[topic]
+
+    async def unsubscribe(self, sub: Subscriber):
+        self._forget(sub)
+        if sub.task is not None and sub.task is not asyncio.current_task():
+            sub.task.cancel()
+            try:
+                await sub.task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def publish(self, event: dict) -> int:
+        """Queue an event for every interested connection; never awaits a socket."""
+        payload = json.dumps(event, default=str, separators=(",", ":"))
+        return self.publish_raw(payload, event_topic(event), coalesce_key(event))
+
+    def publish_raw(self, payload: str, topic: Optional[str], key: Optional[Hashable] = None) -> int:
+        targets = list(self._everything)
+        if topic is None:
+            for subs in self._by_topic.values():
+                targets.extend(subs)
+            targets = set(targets)
+        else:
+            targets.extend(self._by_topic.get(topic, ()))
+        for sub in targets:
+            sub.offer(payload, key)
+        self.published += 1
+        return len(targets)
+
+    async def close(self):
+        for sub in list(self.subscribers()):
+            await self.unsubscribe(sub)
+
+    def subscribers(self) -> Set[Subscriber]:
+        subs = set(self._everything)
+        for topic_subs in self._by_topic.values():
+            subs |= topic_subs
+        return subs
+
+    def stats(self) -> dict:
+        subs = self.subscribers()
+        return {
+            "connections": len(subs),
+            "topics": len(self._by_topic),
+            "queued": sum(s.depth for s in subs),
+            "max_queue_depth": max((s.depth for s in subs), default=0),
+            "published": self.published,
+            "dropped": self.dropped + sum(s.dropped for s in subs),
+            "coalesced": self.coalesced + sum(s.coalesced for s in subs),
+        }
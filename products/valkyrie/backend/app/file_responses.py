@@ -0,0 +1,173 @@
+"""Download responses: HTTP Range / If-Range, strong ETags, 304s, streamed zips.
+
+RangedFileResponse hands the byte range to the server as a zero-copy
+`http.response.zerocopysend` (sendfile) when the ASGI server offers that
+extension. Otherwise it sends slices of a memory-mapped file: one copy per
+chunk into the ASGI message, no file-object read buffering, and memory use
+independent of file size.
+
+zip_stream builds an archive while it is being sent: entries are written in
+stored mode by default (uploads are mostly already compressed), with data
+descriptors so no seeking is needed.
+"""
+import mmap
+import os
+import zipfile
+from email.utils import formatdate
+from typing import Iterable, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.responses import Response
+
+SEND_CHUNK = 1024 * 1024
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into an inclusive (start, end).
+
+    Returns None when the header is absent or asks for several ranges (we
+    answer those with the full body, which RFC 9110 allows). Raises
+    ValueError for a range that cannot be satisfied.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError("empty suffix range")
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError("malformed range")
+    end = min(end, size - 1)
+    if start < 0 or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [c.strip() for c in header.split(",")]
+    return any(c.removeprefix("W/") == etag for c in candidates)
+
+
+class RangedFileResponse(Response):
+    def __init__(self, path: str, request_headers, checksum: str, media_type: str = "application/octet-stream",
+                 filename: Optional[str] = None, method: str = "GET"):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.send_body = method != "HEAD"
+        etag = f'"{checksum}"'
+        headers = {
+            "etag": etag,
+            "accept-ranges": "bytes",
+            "last-modified": formatdate(stat.st_mtime, usegmt=True),
+            # Content-addressed: the bytes behind this ETag never change
+            "cache-control": "private, max-age=0, must-revalidate",
+        }
+        if filename:
+            headers["content-disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+        self.range = None
+        if _etag_matches(request_headers.get("if-none-match"), etag):
+            status = 304
+        else:
+            status = 200
+            if_range = request_headers.get("if-range")
+            if if_range is None or if_range.strip() == etag:
+                try:
+                    self.range = parse_range(request_headers.get("range"), self.size)
+                except ValueError:
+                    status = 416
+                    headers["content-range"] = f"bytes */{self.size}"
+            if self.range is not None:
+                status = 206
+                start, end = self.range
+                headers["content-range"] = f"bytes {start}-{end}/{self.size}"
+
+        super().__init__(status_code=status, headers=headers, media_type=media_type if status < 300 else None)
+        if status in (200, 206):
+            start, end = self.range or (0, self.size - 1)
+            self.headers["content-length"] = str(end - start + 1)
+        else:
+            self.headers["content-length"] = "0"
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.status_code not in (200, 206) or self.size == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        start, end = self.range or (0, self.size - 1)
+        count = end - start + 1
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": f.fileno(), "offset": start, "count": count})
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    pos = start
+                    while pos <= end:
+                        stop = min(pos + SEND_CHUNK, end + 1)
+                        await send({"type": "http.response.body", "body": bytes(view[pos:stop]),
+                                    "more_body": stop <= end})
+                        pos = stop
+                finally:
+                    view.release()
+
+
+class _Sink:
+    """Write-only, non-seekable file object that zipfile streams into."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def zip_stream(entries: Iterable[Tuple[str, str]], compress: bool = False) -> Iterator[bytes]:
+    """Yield a zip archive of (arcname, path) entries chunk by chunk.
+
+    Memory stays at one read chunk (plus the deflate window when compressing)
+    no matter how many or how large the files are.
+    """
+    sink = _Sink()
+    method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(sink, mode="w", compression=method, allowZip64=True) as zf:
+        for arcname, path in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = method
+            with open(path, "rb") as src, zf.open(info, mode="w", force_zip64=True) as dst:
+                while True:
+                    chunk = src.read(SEND_CHUNK)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
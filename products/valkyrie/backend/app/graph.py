@@ -0,0 +1,245 @@
+"""Knowledge-graph neighbourhoods for /search/graph (Neo4j, or Redis as fallback).
+
+subgraph() expands several seed entities at once, breadth-first, up to
+`depth` hops and at most `fanout` neighbours per node (heaviest relations
+first), and returns one deduplicated node/edge set.
+
+Adjacency lists are cached per (project, entity) in an LRUTTLCache, so
+expanding the hot hub entities of a project costs no backend round trip.
+Whatever the cache cannot answer is fetched in one go:
+
+  * Neo4j: a single parameterised Cypher query walks every hop server-side;
+  * Redis: one pipeline (ZREVRANGE per frontier node) per hop, plus one
+    HMGET for labels, so depth 2 is three round trips regardless of fan-out.
+
+Storage model, shared with the graph writer:
+  Neo4j  (:Entity {project_id, name, label})-[:RELATED {kind, weight}]-(:Entity)
+  Redis  valkyrie:graph:<project>:adj:<name>  ZSET  member=json([neighbour, kind]) score=weight
+         valkyrie:graph:<project>:labels       HASH  name -> label
+"""
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import LRUTTLCache
+
+logger = logging.getLogger("uvicorn.error")
+
+MAX_DEPTH = 3
+DEFAULT_FANOUT = int(os.getenv("VALKYRIE_GRAPH_FANOUT", "25"))
+MAX_FANOUT = int(os.getenv("VALKYRIE_GRAPH_MAX_FANOUT", "200"))
+REDIS_PREFIX = os.getenv("VALKYRIE_GRAPH_REDIS_PREFIX", "valkyrie:graph:")
+
+# (neighbour, neighbour label or None, relation kind, weight)
+Adjacency = List[Tuple[str, Optional[str], str, float]]
+
+
+def adjacency_key(project_id: int, name: str) -> str:
+    return f"{REDIS_PREFIX}{project_id}:adj:{name}"
+
+
+def labels_key(project_id: int) -> str:
+    return f"{REDIS_PREFIX}{project_id}:labels"
+
+
+class Neo4jGraph:
+    name = "neo4j"
+
+    def __init__(self, driver, database: Optional[str] = None):
+        self.driver = driver
+        self.database = database
+
+    @staticmethod
+    def expand_query(depth: int) -> str:
+        """Cypher that expands `depth` hops; the hop count is structural, everything else a parameter."""
+        hop = """
+            CALL {
+                WITH frontier
+                UNWIND frontier AS a
+                CALL {
+                    WITH a
+                    MATCH (a)-[r:RELATED]-(b:Entity {project_id: $project_id})
+                    RETURN r, b ORDER BY coalesce(r.weight, 1.0) DESC LIMIT $fanout
+                }
+                RETURN collect({source: a.name, target: b.name, label: b.label,
+                                kind: r.kind, weight: coalesce(r.weight, 1.0)}) AS hop_edges,
+                       collect(DISTINCT b) AS reached
+            }
+            WITH edges + hop_edges AS edges, expanded + [n IN frontier | n.name] AS expanded,
+                 seen + [n IN reached WHERE NOT n IN seen] AS seen,
+                 [n IN reached WHERE NOT n IN seen] AS frontier
+        """
+        return (
+            """
+            MATCH (s:Entity {project_id: $project_id}) WHERE s.name IN $names
+            WITH collect(s) AS frontier, collect(s) AS seen, [] AS edges, [] AS expanded
+            """
+            + hop * depth
+            + """
+            RETURN edges, expanded, [n IN seen | {name: n.name, label: n.label}] AS nodes
+            """
+        )
+
+    def expand(self, project_id: int, names: List[str], depth: int, fanout: int):
+        with self.driver.session(database=self.database) as session:
+            record = session.run(self.expand_query(depth), project_id=project_id, names=names,
+                                 fanout=fanout).single()
+        # Seeds the graph does not know are "expanded" to nothing, so they get cached too
+        adjacency: Dict[str, Adjacency] = {name: [] for name in names}
+        if record is None:
+            return adjacency, {}
+        adjacency.update({name: [] for name in record["expanded"]})
+        for e in record["edges"]:
+            adjacency.setdefault(e["source"], []).append((e["target"], e["label"], e["kind"], float(e["weight"])))
+        labels = {n["name"]: n["label"] for n in record["nodes"]}
+        return adjacency, labels
+
+
+class RedisGraph:
+    name = "redis"
+
+    def __init__(self, client):
+        self.client = client
+
+    def expand(self, project_id: int, names: List[str], depth: int, fanout: int):
+        adjacency: Dict[str, Adjacency] = {}
+        seen = set(names)
+        frontier = list(names)
+        for _ in range(depth):
+            if not frontier:
+                break
+            pipe = self.client.pipeline(transaction=False)
+            for name in frontier:
+                pipe.zrevrange(adjacency_key(project_id, name), 0, fanout - 1, withscores=True)
+            replies = pipe.execute()
+            next_frontier = []
+            for name, members in zip(frontier, replies):
+                edges = adjacency.setdefault(name, [])
+                for member, weight in members:
+                    target, kind = json.loads(member)
+                    edges.append((target, None, kind, float(weight)))
+                    if target not in seen:
+                        seen.add(target)
+                        next_frontier.append(target)
+            frontier = next_frontier
+        ordered = sorted(seen)
+        labels = dict(zip(ordered, self._decode(self.client.hmget(labels_key(project_id), ordered))))
+        for name, edges in adjacency.items():
+            adjacency[name] = [(t, labels.get(t), kind, w) for t, _, kind, w in edges]
+        return adjacency, {n: l for n, l in labels.items() if l is not None}
+
+    @staticmethod
+    def _decode(values):
+        return [v.decode("utf-8") if isinstance(v, bytes) else v for v in values]
+
+
+def _bfs(seeds: List[str], depth: int, fanout: int, lookup) -> Optional[dict]:
+    """Breadth-first walk over lookup(name) -> (adjacency, label) or None (unknown to the source).
+
+    Nodes on the last ring are reached but not expanded, so only levels
+    0..depth-1 need adjacency. Returns None as soon as lookup misses.
+    """
+    nodes: Dict[str, dict] = {}
+    edges: Dict[tuple, dict] = {}
+    frontier = []
+    for seed in seeds:
+        hit = lookup(seed)
+        if hit is None:
+            return None
+        if hit[1] is not None or hit[0]:  # skip seeds the graph does not know
+            nodes[seed] = {"name": seed, "label": hit[1], "depth": 0}
+            frontier.append(seed)
+    for level in range(1, depth + 1):
+        next_frontier = []
+        for name in frontier:
+            hit = lookup(name)
+            if hit is None:
+                return None
+            for target, label, kind, weight in hit[0][:fanout]:
+                key = (min(name, target), max(name, target), kind)
+                edges.setdefault(key, {"source": name, "target": target, "kind": kind, "weight": weight})
+                if target not in nodes:
+                    nodes[target] = {"name": target, "label": label, "depth": level}
+                    next_frontier.append(target)
+        frontier = next_frontier
+    return {"nodes": list(nodes.values()), "edges": list(edges.values())}
+
+
+class GraphService:
+    def __init__(self, backend, cache_size: int = 20000, ttl: float = 60.0):
+        self.backend = backend
+        # (project_id, entity) -> (fan-out it was fetched with, adjacency, label)
+        self.adjacency = LRUTTLCache(max_entries=cache_size, ttl=ttl)
+        self.backend_calls = 0
+
+    def _from_cache(self, project_id: int, fanout: int):
+        def lookup(name):
+            entry = self.adjacency.get((project_id, name))
+            if entry is None:
+                return None
+            fetched_with, edges, label = entry
+            # A list cut at a smaller fan-out cannot answer a wider request
+            if fetched_with < fanout and len(edges) >= fetched_with:
+                return None
+            return edges, label
+        return lookup
+
+    def subgraph(self, project_id: int, seeds: Iterable[str], depth: int = 1, fanout: int = DEFAULT_FANOUT) -> dict:
+        if not 1 <= depth <= MAX_DEPTH:
+            raise ValueError(f"depth must be between 1 and {MAX_DEPTH}")
+        if not 1 <= fanout <= MAX_FANOUT:
+            raise ValueError(f"fanout must be between 1 and {MAX_FANOUT}")
+        seeds = list(dict.fromkeys(seeds))
+        result = _bfs(seeds, depth, fanout, self._from_cache(project_id, fanout))
+        if result is not None:
+            return {**result, "backend": self.backend.name, "cached": True}
+
+        self.backend_calls += 1
+        adjacency, labels = self.backend.expand(project_id, seeds, depth, fanout)
+        for name, edges in adjacency.items():
+            self.adjacency.set((project_id, name), (fanout, edges, labels.get(name)))
+        result = _bfs(seeds, depth, fanout,
+                      lambda name: (adjacency.get(name, []), labels.get(name)))
+        return {**result, "backend": self.backend.name, "cached": False}
+
+    def invalidate_project(self, project_id: int) -> int:
+        return self.adjacency.pop_where(lambda key, _: key[0] == project_id)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, "adjacency_cache": self.adjacency.stats(),
+                "backend_calls": self.backend_calls}
+
+
+def create_graph_service() -> GraphService:
+    """VALKYRIE_GRAPH_BACKEND=neo4j|redis; defaults to Neo4j when VALKYRIE_NEO4J_URL is set."""
+    kind = os.getenv("VALKYRIE_GRAPH_BACKEND", "neo4j" if os.getenv("VALKYRIE_NEO4J_URL") else "redis").lower()
+    cache_size = int(os.getenv("VALKYRIE_GRAPH_CACHE_SIZE", "20000"))
+    ttl = float(os.getenv("VALKYRIE_GRAPH_CACHE_TTL", "60"))
+    if kind == "neo4j":
+        try:
+            from neo4j import GraphDatabase
+        except ImportError:
+            logger.warning("neo4j driver not installed, using the Redis graph")
+        else:
+            driver = GraphDatabase.driver(
+                os.getenv("VALKYRIE_NEO4J_URL", "bolt://localhost:7687"),
+                auth=(os.getenv("VALKYRIE_NEO4J_USER", "neo4j"), os.getenv("VALKYRIE_NEO4J_PASSWORD", "")),
+            )
+            return GraphService(Neo4jGraph(driver), cache_size=cache_size, ttl=ttl)
+    elif kind != "redis":
+        logger.warning("Unknown VALKYRIE_GRAPH_BACKEND=%r, using redis", kind)
+    import redis
+    client = redis.Redis.from_url(os.getenv("VALKYRIE_REDIS_URL", "redis://localhost:6379/0"))
+    return GraphService(RedisGraph(client), cache_size=cache_size, ttl=ttl)
+
+
+_graph_service: Optional[GraphService] = None
+
+
+def get_graph_service() -> GraphService:
+    """Built on first use, so API workers that never serve /search/graph open no driver."""
+    global _graph_service
+    if _graph_service is None:
+        _graph_service = create_graph_service()
+    return _graph_service
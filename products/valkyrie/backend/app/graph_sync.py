@@ -0,0 +1,270 @@
+"""Bulk sync of entities/relations from Postgres into the graph backend.
+
+GraphWriter buffers entities and relations and flushes them in batches of
+VALKYRIE_GRAPH_SYNC_BATCH rows:
+
+  * Neo4j: one `UNWIND $rows AS row MERGE ...` statement per batch, run with
+    session.execute_write (the driver retries transient errors);
+  * Redis: one non-transactional pipeline per batch (HSET labels, ZADD both
+    directions of every relation).
+
+Writes are idempotent: nodes are keyed on (project_id, name), relationships
+on (endpoints, kind), and weights are *set* to the co-occurrence count held
+in Postgres rather than incremented, so a batch that failed half-way (or a
+job that ran twice) is simply written again. A failed flush is retried
+VALKYRIE_GRAPH_SYNC_RETRIES times with exponential backoff before the
+buffer's error is raised. Entities are always flushed before relations, so
+relation MATCHes find their endpoints.
+
+The storage model is the one graph.py reads. API workers keep adjacency
+lists cached for VALKYRIE_GRAPH_CACHE_TTL seconds, which bounds how long a
+sync takes to show up in /search/graph.
+"""
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+from .graph import REDIS_PREFIX, adjacency_key, labels_key
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("VALKYRIE_GRAPH_SYNC_BATCH", "2000"))
+RETRIES = int(os.getenv("VALKYRIE_GRAPH_SYNC_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("VALKYRIE_GRAPH_SYNC_BACKOFF", "0.5"))
+
+
+class Neo4jGraphWriter:
+    name = "neo4j"
+
+    ENTITIES = """
+        UNWIND $rows AS row
+        MERGE (e:Entity {project_id: $project_id, name: row.name})
+        SET e.label = row.label
+    """
+    RELATIONS = """
+        UNWIND $rows AS row
+        MATCH (a:Entity {project_id: $project_id, name: row.source})
+        MATCH (b:Entity {project_id: $project_id, name: row.target})
+        MERGE (a)-[r:RELATED {kind: row.kind}]-(b)
+        SET r.weight = row.weight
+    """
+
+    def __init__(self, driver, database: Optional[str] = None):
+        self.driver = driver
+        self.database = database
+        self._schema_ready = False
+
+    def _write(self, query: str, **params):
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(lambda tx: tx.run(query, **params).consume())
+
+    def ensure_schema(self):
+        """Without the uniqueness constraint every MERGE is a label scan."""
+        if not self._schema_ready:
+            self._write("""
+                CREATE CONSTRAINT entity_project_name IF NOT EXISTS
+                FOR (e:Entity) REQUIRE (e.project_id, e.name) IS UNIQUE
+            """)
+            self._schema_ready = True
+
+    def write_entities(self, project_id: int, rows: List[dict]):
+        self.ensure_schema()
+        self._write(self.ENTITIES, project_id=project_id, rows=rows)
+
+    def write_relations(self, project_id: int, rows: List[dict]):
+        self._write(self.RELATIONS, project_id=project_id, rows=rows)
+
+    def reset(self, project_id: int, batch_size: int = 10000):
+        # Batched so a large project does not need one huge transaction
+        while True:
+            with self.driver.session(database=self.database) as session:
+                deleted = session.execute_write(lambda tx: tx.run("""
+                    MATCH (e:Entity {project_id: $project_id})
+                    WITH e LIMIT $n DETACH DELETE e RETURN count(*) AS deleted
+                """, project_id=project_id, n=batch_size).single()["deleted"])
+            if deleted < batch_size:
+                return
+
+
+class RedisGraphWriter:
+    name = "redis"
+
+    def __init__(self, client):
+        self.client = client
+
+    def write_entities(self, project_id: int, rows: List[dict]):
+        labels = {r["name"]: r["label"] for r in rows if r["label"] is not None}
+        if labels:
+            self.client.hset(labels_key(project_id), mapping=labels)
+
+    def write_relations(self, project_id: int, rows: List[dict]):
+        members: Dict[str, dict] = {}
+        for r in rows:
+            members.setdefault(adjacency_key(project_id, r["source"]), {})[json.dumps([r["target"], r["kind"]])] = r["weight"]
+            members.setdefault(adjacency_key(project_id, r["target"]), {})[json.dumps([r["source"], r["kind"]])] = r["weight"]
+        pipe = self.client.pipeline(transaction=False)
+        for key, mapping in members.items():
+            pipe.zadd(key, mapping)
+        pipe.execute()
+
+    def reset(self, project_id: int):
+        keys = list(self.client.scan_iter(match=f"{REDIS_PREFIX}{project_id}:*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self.client.delete(*keys[start:start + 1000])
+
+
+class GraphWriter:
+    """Buffers one project's entities and relations and writes them in batches."""
+
+    def __init__(self, backend, project_id: int, batch_size: int = BATCH_SIZE, retries: int = RETRIES,
+                 backoff: float = RETRY_BACKOFF, sleep: Callable[[float], None] = time.sleep):
+        self.backend = backend
+        self.project_id = project_id
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self._sleep = sleep
+        self._entities: List[dict] = []
+        self._relations: List[dict] = []
+        self.entities = 0
+        self.relations = 0
+        self.batches = 0
+        self.retried = 0
+
+    def add_entity(self, name: str, label: Optional[str]):
+        self._entities.append({"name": name, "label": label})
+        if len(self._entities) >= self.batch_size:
+            self._flush_entities()
+
+    def add_relation(self, source: str, target: str, kind: str, weight: float):
+        self._relations.append({"source": source, "target": target, "kind": kind, "weight": float(weight)})
+        if len(self._relations) >= self.batch_size:
+            self.flush()
+
+    def _with_retry(self, write, rows: List[dict]):
+        for attempt in range(self.retries + 1):
+            try:
+                write(self.project_id, rows)
+                self.batches += 1
+                return
+            except Exception as exc:
+                if attempt == self.retries:
+                    raise
+                self.retried += 1
+                delay = self.backoff * 2 ** attempt
+                logger.warning("Graph %s write of %d rows failed (%s), retrying in %.1fs",
+                               self.backend.name, len(rows), exc, delay)
+                self._sleep(delay)
+
+    def _flush_entities(self):
+        if self._entities:
+            rows, self._entities = self._entities, []
+            self._with_retry(self.backend.write_entities, rows)
+            self.entities += len(rows)
+
+    def flush(self):
+        self._flush_entities()
+        if self._relations:
+            rows, self._relations = self._relations, []
+            self._with_retry(self.backend.write_relations, rows)
+            self.relations += len(rows)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, "entities": self.entities, "relations": self.relations,
+                "batches": self.batches, "retries": self.retried}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
+
+
+def create_graph_writer_backend():
+    """Same backend selection as graph.create_graph_service()."""
+    kind = os.getenv("VALKYRIE_GRAPH_BACKEND", "neo4j" if os.getenv("VALKYRIE_NEO4J_URL") else "redis").lower()
+    if kind == "neo4j":
+        try:
+            from neo4j import GraphDatabase
+        except ImportError:
+            logger.warning("neo4j driver not installed, syncing the Redis graph")
+        else:
+            driver = GraphDatabase.driver(
+                os.getenv("VALKYRIE_NEO4J_URL", "bolt://localhost:7687"),
+                auth=(os.getenv("VALKYRIE_NEO4J_USER", "neo4j"), os.getenv("VALKYRIE_NEO4J_PASSWORD", "")),
+            )
+            return Neo4jGraphWriter(driver)
+    import redis
+    return RedisGraphWriter(redis.Redis.from_url(os.getenv("VALKYRIE_REDIS_URL", "redis://localhost:6379/0")))
+
+
+# --------------------------------------------------------------- replay ---
+
+ENTITIES_SQL = "SELECT name, label FROM entities WHERE project_id = :p"
+RELATIONS_SQL = """
+    SELECT s.name AS source, t.name AS target, r.kind, count(*) AS weight
+    FROM relations r
+    JOIN entities s ON s.id = r.source_entity_id
+    JOIN entities t ON t.id = r.target_entity_id
+    WHERE r.project_id = :p {scope}
+    GROUP BY s.name, t.name, r.kind
+"""
+# Pairs touched by one document; their weight is still counted project-wide
+DOCUMENT_SCOPE = """
+    AND (r.source_entity_id, r.target_entity_id) IN (
+        SELECT r2.source_entity_id, r2.target_entity_id
+        FROM relations r2 JOIN chunks c ON c.id = r2.chunk_id
+        WHERE c.document_id = :d
+    )
+"""
+
+
+def _replay(con, writer: GraphWriter, params: dict, entities_sql: str, relations_sql: str):
+    stream = con.execution_options(stream_results=True, yield_per=writer.batch_size)
+    for name, label in stream.execute(text(entities_sql), params):
+        writer.add_entity(name, label)
+    writer.flush()
+    for source, target, kind, weight in stream.execute(text(relations_sql), params):
+        writer.add_relation(source, target, kind, weight)
+    writer.flush()
+
+
+def sync_document_graph(document_id: int, project_id: int, backend=None, engine=None) -> dict:
+    """Upsert the entities and relations of one freshly ingested document.
+
+    Relations that disappeared with deleted chunks keep their old weight
+    until the next sync_project_graph(project_id, reset=True).
+    """
+    if engine is None:
+        from .db import engine
+    writer = GraphWriter(backend or create_graph_writer_backend(), project_id)
+    started = time.monotonic()
+    with engine.connect() as con:
+        _replay(con, writer, {"p": project_id, "d": document_id}, """
+            SELECT DISTINCT e.name, e.label FROM entities e
+            JOIN chunk_entities ce ON ce.entity_id = e.id
+            JOIN chunks c ON c.id = ce.chunk_id
+            WHERE c.document_id = :d AND e.project_id = :p
+        """, RELATIONS_SQL.format(scope=DOCUMENT_SCOPE))
+    return {**writer.stats(), "seconds": round(time.monotonic() - started, 3)}
+
+
+def sync_project_graph(project_id: int, reset: bool = False, backend=None, engine=None) -> dict:
+    """RQ task: replay all of a project's entities/relations into the graph."""
+    if engine is None:
+        from .db import engine
+    backend = backend or create_graph_writer_backend()
+    started = time.monotonic()
+    if reset:
+        backend.reset(project_id)
+    writer = GraphWriter(backend, project_id)
+    with engine.connect() as con:
+        _replay(con, writer, {"p": project_id}, ENTITIES_SQL, RELATIONS_SQL.format(scope=""))
+    result = {**writer.stats(), "seconds": round(time.monotonic() - started, 3)}
+    logger.info("Graph sync of project %s: %s", project_id, result)
+    return result
@@ -0,0 +1,582 @@
+"""Staged ingest pipeline run by the RQ worker (`run_ingest_job`).
+
+    extract -> chunk -> NER -> embed -> persist
+
+Each stage runs in its own thread and hands work to the next through a
+bounded queue, so reading the next part of a document, entity extraction,
+embedding and database writes overlap instead of running back to back, and
+a slow stage applies backpressure instead of buffering the whole corpus.
+NER (spaCy) and embedding run batched on a process pool; persistence uses
+COPY. Per-stage throughput and queue depth are published as
+`ingest_progress` events on the event bus, which /ws/events relays.
+"""
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from sqlalchemy import text
+
+from .embedding_service import embedding_service
+from .embeddings import EMBED_DIM, embed_texts, to_pgvector
+from .event_bus import EventPublisher
+from .graph_sync import sync_document_graph
+from .metrics import IngestMetrics
+from .search_cache import bump_generation
+
+logger = logging.getLogger(__name__)
+
+CHUNK_CHARS = int(os.getenv("VALKYRIE_CHUNK_CHARS", "1200"))
+CHUNK_OVERLAP = int(os.getenv("VALKYRIE_CHUNK_OVERLAP", "200"))
+BATCH_SIZE = int(os.getenv("VALKYRIE_INGEST_BATCH", "64"))
+QUEUE_DEPTH = int(os.getenv("VALKYRIE_INGEST_QUEUE_DEPTH", "8"))
+POOL_SIZE = int(os.getenv("VALKYRIE_INGEST_PROCESSES", str(max(1, (os.cpu_count() or 2) - 1))))
+PROGRESS_INTERVAL = float(os.getenv("VALKYRIE_INGEST_PROGRESS_SECONDS", "1"))
+SPACY_MODEL = os.getenv("VALKYRIE_SPACY_MODEL", "en_core_web_sm")
+GRAPH_SYNC = os.getenv("VALKYRIE_GRAPH_SYNC", "on").lower() not in ("0", "off", "false", "no")
+# Per-stage timings per job, summed in Redis for GET /metrics (metrics.py)
+INGEST_METRICS = os.getenv("VALKYRIE_INGEST_METRICS", "redis").lower() != "off"
+
+_DONE = object()
+
+
+# ---------------------------------------------------------------- stages ---
+
+def extract_blocks(path: str, read_size: int = 1024 * 1024) -> Iterator[str]:
+    """Stream paragraphs (blank-line separated) without loading the whole file."""
+    pending = ""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            data = f.read(read_size)
+            if not data:
+                break
+            pending += data
+            *blocks, pending = re.split(r"\n\s*\n", pending)
+            for block in blocks:
+                if block.strip():
+                    yield block.strip()
+    if pending.strip():
+        yield pending.strip()
+
+
+def _is_boundary(piece: str) -> bool:
+    """Content-defined cut point: about one paragraph in four ends a chunk."""
+    return hashlib.blake2b(piece.encode("utf-8"), digest_size=1).digest()[0] % 4 == 0
+
+
+def _pieces(block: str, size: int) -> Iterator[str]:
+    """Split a paragraph longer than `size` on whitespace."""
+    while len(block) > size:
+        cut = block.rfind(" ", 0, size)
+        cut = cut if cut > size // 2 else size
+        yield block[:cut]
+        block = block[cut:].lstrip()
+    if block:
+        yield block
+
+
+def chunk_blocks(blocks: Iterable[str], size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> Iterator[dict]:
+    """Pack paragraphs into chunks of at most size chars plus an overlap tail.
+
+    A chunk is at most size + overlap + 2 chars: the tail of the previous
+    chunk, the paragraph separator, and up to `size` chars of new text.
+
+    Chunks end at content-defined paragraphs (once past a quarter of `size`)
+    rather than wherever the running length happens to hit the limit, so an
+    edit only changes the chunks around it; boundaries after it line up with
+    the previous revision again and those chunks keep their content hash.
+    """
+    ord_ = 0
+    buf, fresh = "", False
+
+    def emit():
+        nonlocal ord_, buf, fresh
+        chunk = {"ord": ord_, "text": buf, "content_hash": content_hash(buf)}
+        ord_ += 1
+        buf, fresh = (buf[-overlap:] if overlap else ""), False
+        return chunk
+
+    for block in blocks:
+        for piece in _pieces(block, size):
+            if fresh and len(buf) + len(piece) > size:
+                yield emit()
+            buf = (buf + "\n\n" + piece) if buf else piece
+            fresh = True
+            if len(buf) >= size // 4 and _is_boundary(piece):
+                yield emit()
+    if fresh:
+        yield emit()
+
+
+def content_hash(chunk_text: str) -> str:
+    return hashlib.sha256(chunk_text.encode("utf-8")).hexdigest()
+
+
+_nlp = None
+_CAPITALIZED = re.compile(r"\b([A-Z][\w&.-]*(?:\s+[A-Z][\w&.-]*)*)\b")
+
+
+def _init_ner():
+    """Process-pool initializer: load spaCy once per worker process."""
+    global _nlp
+    try:
+        import spacy
+        _nlp = spacy.load(SPACY_MODEL, disable=["lemmatizer", "textcat"])
+    except Exception as exc:  # spaCy or the model is optional
+        logger.warning("spaCy model %s unavailable, using capitalized-phrase NER: %s", SPACY_MODEL, exc)
+        _nlp = None
+
+
+def ner_batch(texts: List[str]) -> List[List[tuple]]:
+    """Entities per text as (name, label) tuples, deduplicated, in order."""
+    results = []
+    if _nlp is not None:
+        for doc in _nlp.pipe(texts, batch_size=len(texts)):
+            results.append(list(dict.fromkeys((e.text.strip(), e.label_) for e in doc.ents if e.text.strip())))
+    else:
+        for t in texts:
+            found = (m.group(1) for m in _CAPITALIZED.finditer(t))
+            results.append(list(dict.fromkeys((name, "ENTITY") for name in found if len(name) > 2)))
+    return results
+
+
+def embed_batch(texts: List[str]) -> tuple:
+    """Vectors (for the embedding cache) and their pgvector text form (for COPY).
+
+    Quantized like cached vectors, so a chunk stores the same vector whether it
+    was embedded now or served from the cache.
+    """
+    vectors = embedding_service.quantize(embed_texts(texts))
+    return vectors, [to_pgvector(v) for v in vectors]
+
+
+# -------------------------------------------------------------- plumbing ---
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        # waiting on the upstream queue (starved) / on a full downstream queue (backpressure)
+        self.wait_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.inbox: Optional[queue.Queue] = None
+
+    def snapshot(self) -> dict:
+        elapsed = max((self.finished or time.monotonic()) - self.started, 1e-9)
+        return {
+            "items": self.items,
+            "items_per_sec": round(self.items / elapsed, 2),
+            "queue_depth": self.inbox.qsize() if self.inbox is not None else 0,
+            "busy_seconds": round(max(elapsed - self.wait_seconds - self.blocked_seconds, 0.0), 4),
+            "wait_seconds": round(self.wait_seconds, 4),
+            "blocked_seconds": round(self.blocked_seconds, 4),
+        }
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _drain(q: queue.Queue, stats: Optional[StageStats] = None) -> Iterator:
+    while True:
+        waited = time.monotonic()
+        item = q.get()
+        if stats is not None:
+            stats.wait_seconds += time.monotonic() - waited
+        if item is _DONE:
+            return
+        yield item
+
+
+def _ordered_pool_map(pool, fn, batches: Iterable[list], in_flight: int,
+                      needs: Callable[[dict], bool] = lambda c: "id" not in c) -> Iterator[tuple]:
+    """Like pool.map but bounded: keeps at most `in_flight` batches submitted.
+
+    Yields (batch, changed, results): only chunks for which `needs` holds
+    (by default, chunks without a stored row) are sent to `fn`.
+    """
+    pending = deque()
+    for batch in batches:
+        changed = [c for c in batch if needs(c)]
+        fut = pool.submit(fn, [c["text"] for c in changed]) if changed else None
+        pending.append((batch, changed, fut))
+        if len(pending) >= in_flight:
+            done_batch, changed, fut = pending.popleft()
+            yield done_batch, changed, fut.result() if fut else fn([])
+    while pending:
+        done_batch, changed, fut = pending.popleft()
+        yield done_batch, changed, fut.result() if fut else fn([])
+
+
+class Pipeline:
+    """Wires stage threads together with bounded queues and reports progress."""
+
+    def __init__(self, progress: Callable[[dict], None], queue_depth: int = QUEUE_DEPTH):
+        self.progress = progress
+        self.queue_depth = queue_depth
+        self.stats: dict = {}
+        self._threads: List[threading.Thread] = []
+        self._error: Optional[BaseException] = None
+        self._abort = threading.Event()
+
+    def stage(self, name: str, work: Callable[[Iterator], Iterator], upstream: Optional[queue.Queue]) -> queue.Queue:
+        """Run work(items) in a thread; its yielded results feed the returned queue."""
+        stats = self.stats[name] = StageStats(name)
+        stats.inbox = upstream
+        out: queue.Queue = queue.Queue(maxsize=self.queue_depth)
+
+        def run():
+            try:
+                items = _drain(upstream, stats) if upstream is not None else iter(())
+                it = work(items)
+                while True:
+                    try:
+                        result = next(it)
+                    except StopIteration:
+                        break
+                    stats.items += len(result) if isinstance(result, list) else 1
+                    blocked = time.monotonic()
+                    while not self._abort.is_set():
+                        try:
+                            out.put(result, timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+                    stats.blocked_seconds += time.monotonic() - blocked
+                    if self._abort.is_set():
+                        return
+            except BaseException as exc:
+                self._error = self._error or exc
+                self._abort.set()
+                # Unblock downstream consumers
+                while upstream is not None and not upstream.empty():
+                    upstream.get_nowait()
+            finally:
+                stats.finished = time.monotonic()
+                while True:
+                    try:
+                        out.put(_DONE, timeout=0.5)
+                        break
+                    except queue.Full:
+                        if self._abort.is_set():
+                            # Downstream may be gone; make room for the sentinel
+                            try:
+                                out.get_nowait()
+                            except queue.Empty:
+                                pass
+
+        thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+        self._threads.append(thread)
+        return out
+
+    def run(self, sink: queue.Queue):
+        """Start every stage, consume the last stage's output, report progress."""
+        for t in self._threads:
+            t.start()
+        last = 0.0
+        while True:
+            try:
+                item = sink.get(timeout=0.1)
+            except queue.Empty:
+                item = None
+            if item is _DONE:
+                break
+            if time.monotonic() - last >= PROGRESS_INTERVAL:
+                self.progress(self.snapshot())
+                last = time.monotonic()
+        for t in self._threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
+        self.progress(self.snapshot())
+
+    def snapshot(self) -> dict:
+        return {name: s.snapshot() for name, s in self.stats.items()}
+
+
+# ----------------------------------------------------------- persistence ---
+
+def _engine():
+    # app.db comes with the deployment; importing it lazily keeps the pure
+    # stages (extract, chunk, pipeline) importable and testable without it
+    from .db import engine
+    return engine
+
+
+class ChunkWriter:
+    """Bulk-writes chunks, entities, mentions and relations for one document.
+
+    Re-ingest is incremental: chunks whose content hash is already stored for
+    the document keep their row, vector, mentions and relations (only their
+    position is updated), new chunks are inserted, and chunks that are gone
+    are deleted at finish(). Everything happens on one connection in one
+    transaction, so a failed job leaves the previous version intact.
+    """
+
+    def __init__(self, document_id: int, project_id: int):
+        self.document_id = document_id
+        self.project_id = project_id
+        self.con = _engine().connect()
+        self.tx = self.con.begin()
+        self.raw = self.con.connection.driver_connection
+        self.chunks = 0
+        self.reused = 0
+        self.entities = 0
+        self.relations = 0
+        self.deleted = 0
+        self._moved: List[tuple] = []
+        self._existing: dict = {}
+        rows = self.con.execute(text("""
+            SELECT id, ord, content_hash FROM chunks WHERE document_id = :d ORDER BY ord
+        """), {"d": document_id})
+        for chunk_id, ord_, digest in rows:
+            self._existing.setdefault(digest, deque()).append((chunk_id, ord_))
+
+    def match(self, batch: List[dict]) -> List[dict]:
+        """Attach the stored row id to every chunk whose content is unchanged.
+
+        Called from the chunk stage, so unchanged chunks skip NER and embedding.
+        """
+        for c in batch:
+            stored = self._existing.get(c["content_hash"])
+            if stored:
+                c["id"], c["stored_ord"] = stored.popleft()
+        return batch
+
+    def write(self, batch: List[dict]):
+        new = [c for c in batch if "id" not in c]
+        for c in batch:
+            if "id" in c and c["stored_ord"] != c["ord"]:
+                self._moved.append((c["id"], c["ord"]))
+        self.reused += len(batch) - len(new)
+        if not new:
+            return
+        ids = [r[0] for r in self.con.execute(
+            text("SELECT nextval('chunks_id_seq') FROM generate_series(1, :n)"), {"n": len(new)}
+        )]
+        for chunk, chunk_id in zip(new, ids):
+            chunk["id"] = chunk_id
+        with self.raw.cursor() as cur:
+            with cur.copy("""
+                COPY chunks (id, document_id, project_id, ord, text, content_hash, embedding) FROM STDIN
+            """) as cp:
+                for c in new:
+                    cp.write_row((c["id"], self.document_id, self.project_id, c["ord"], c["text"],
+                                  c["content_hash"], c["embedding"]))
+        self.chunks += len(new)
+        self._write_entities(new)
+
+    def _write_entities(self, batch: List[dict]):
+        mentions = [(c["id"], name, label) for c in batch for name, label in c["entities"]]
+        if not mentions:
+            return
+        with self.raw.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS ingest_mentions (chunk_id BIGINT, name TEXT, label TEXT)
+                ON COMMIT DELETE ROWS
+            """)
+            cur.execute("TRUNCATE ingest_mentions")
+            with cur.copy("COPY ingest_mentions (chunk_id, name, label) FROM STDIN") as cp:
+                for row in mentions:
+                    cp.write_row(row)
+            cur.execute("""
+                INSERT INTO entities (project_id, name, label)
+                SELECT DISTINCT %s, name, label FROM ingest_mentions
+                ON CONFLICT (project_id, name, label) DO NOTHING
+            """, (self.project_id,))
+            cur.execute("""
+                INSERT INTO chunk_entities (chunk_id, entity_id)
+                SELECT DISTINCT m.chunk_id, e.id FROM ingest_mentions m
+                JOIN entities e ON e.project_id = %s AND e.name = m.name AND e.label = m.label
+                ON CONFLICT DO NOTHING
+            """, (self.project_id,))
+            self.entities += len(mentions)
+            # Entities mentioned in the same chunk are related (co-occurrence)
+            cur.execute("""
+                INSERT INTO relations (project_id, source_entity_id, target_entity_id, kind, chunk_id)
+                SELECT %s, a.entity_id, b.entity_id, 'co_occurs', a.chunk_id
+                FROM chunk_entities a JOIN chunk_entities b
+                  ON a.chunk_id = b.chunk_id AND a.entity_id < b.entity_id
+                WHERE a.chunk_id = ANY(%s)
+                ON CONFLICT DO NOTHING
+            """, (self.project_id, [c["id"] for c in batch]))
+            self.relations += cur.rowcount
+
+    def _finish_revision(self):
+        """Renumber kept chunks and delete the ones this revision no longer has."""
+        if self._moved:
+            self.con.execute(text("""
+                UPDATE chunks c SET ord = m.ord
+                FROM unnest(CAST(:ids AS BIGINT[]), CAST(:ords AS INTEGER[])) AS m(id, ord)
+                WHERE c.id = m.id
+            """), {"ids": [m[0] for m in self._moved], "ords": [m[1] for m in self._moved]})
+        gone = [chunk_id for stored in self._existing.values() for chunk_id, _ in stored]
+        if not gone:
+            return
+        # Mentions and relations of deleted chunks cascade; drop entities left without any
+        orphans = [r[0] for r in self.con.execute(text("""
+            SELECT DISTINCT entity_id FROM chunk_entities WHERE chunk_id = ANY(:ids)
+        """), {"ids": gone})]
+        self.con.execute(text("DELETE FROM chunks WHERE id = ANY(:ids)"), {"ids": gone})
+        if orphans:
+            self.con.execute(text("""
+                DELETE FROM entities e WHERE e.id = ANY(:ids)
+                  AND NOT EXISTS (SELECT 1 FROM chunk_entities ce WHERE ce.entity_id = e.id)
+            """), {"ids": orphans})
+        self.deleted = len(gone)
+
+    @property
+    def moved(self) -> int:
+        return len(self._moved)
+
+    def finish(self):
+        self._finish_revision()
+        if self.chunks or self.deleted or self.moved:
+            # New search-cache keys for this project from the moment this commits
+            bump_generation(self.con, self.project_id)
+        self.tx.commit()
+        self.con.close()
+
+    def abort(self):
+        self.tx.rollback()
+        self.con.close()
+
+
+# -------------------------------------------------------------- RQ entry ---
+
+def ingest_document(path: str, document_id: int, project_id: int, progress: Callable[[dict], None],
+                    pool_size: int = POOL_SIZE, batch_size: int = BATCH_SIZE) -> dict:
+    pipeline = Pipeline(progress)
+    writer = ChunkWriter(document_id, project_id)
+    try:
+        with ProcessPoolExecutor(max_workers=pool_size, initializer=_init_ner) as pool:
+            extracted = pipeline.stage("extract", lambda _: extract_blocks(path), None)
+
+            def chunk(blocks):
+                return (writer.match(batch) for batch in _batched(chunk_blocks(blocks), batch_size))
+
+            def ner(batches):
+                for batch, changed, ents in _ordered_pool_map(pool, ner_batch, batches, pool_size):
+                    for c, e in zip(changed, ents):
+                        c["entities"] = e
+                    yield batch
+
+            def cached_embeddings(batches):
+                for batch in batches:
+                    changed = [c for c in batch if "id" not in c]
+                    for c, v in zip(changed, embedding_service.lookup([c["text"] for c in changed])):
+                        if v is not None:
+                            c["embedding"] = to_pgvector(v)
+                    yield batch
+
+            def embed(batches):
+                for batch, changed, (vectors, literals) in _ordered_pool_map(
+                        pool, embed_batch, cached_embeddings(batches), pool_size,
+                        needs=lambda c: "id" not in c and "embedding" not in c):
+                    for c, v in zip(changed, literals):
+                        c["embedding"] = v
+                    if changed:
+                        embedding_service.store([c["text"] for c in changed], vectors)
+                    yield batch
+
+            def persist(batches):
+                for batch in batches:
+                    writer.write(batch)
+                    yield batch
+
+            chunked = pipeline.stage("chunk", chunk, extracted)
+            recognized = pipeline.stage("ner", ner, chunked)
+            embedded = pipeline.stage("embed", embed, recognized)
+            persisted = pipeline.stage("persist", persist, embedded)
+            pipeline.run(persisted)
+        writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+    return {"chunks": writer.chunks, "chunks_reused": writer.reused, "chunks_deleted": writer.deleted,
+            "chunks_moved": writer.moved, "entity_mentions": writer.entities, "relations": writer.relations, "stages": pipeline.snapshot()}
+
+
+def _record_metrics(client, status: str, started: float, stages: Optional[dict] = None):
+    if not INGEST_METRICS:
+        return
+    try:
+        IngestMetrics(client).record_job(status, time.monotonic() - started, stages)
+    except Exception:
+        logger.warning("Could not record ingest metrics", exc_info=True)
+
+
+def run_ingest_job(job_id: int) -> dict:
+    """RQ task: ingest the document behind an ingest_jobs row."""
+    started = time.monotonic()
+    engine = _engine()
+    with engine.begin() as con:
+        job = con.execute(text("""
+            UPDATE ingest_jobs SET status = 'running', started_at = now()
+            WHERE id = :j RETURNING document_id
+        """), {"j": job_id}).mappings().first()
+        if job is None:
+            raise ValueError(f"ingest job {job_id} not found")
+        doc = con.execute(text("""
+            SELECT id, project_id, storage_path FROM documents WHERE id = :d
+        """), {"d": job["document_id"]}).mappings().first()
+        if doc is None:
+            # Deleted between enqueue and pickup: fail the job instead of
+            # leaving it 'running' forever
+            error = f"document {job['document_id']} not found"
+            con.execute(text("""
+                UPDATE ingest_jobs SET status = 'failed', error = :e, finished_at = now() WHERE id = :j
+            """), {"e": error, "j": job_id})
+            logger.warning("Ingest job %s failed: %s", job_id, error)
+            return {"status": "failed", "error": error}
+
+    base = {"type": "ingest_progress", "job_id": job_id, "document_id": doc["id"], "project_id": doc["project_id"]}
+    with EventPublisher() as events:
+        def progress(stages):
+            events.publish({**base, "stages": stages})
+            events.flush()
+
+        try:
+            result = ingest_document(doc["storage_path"], doc["id"], doc["project_id"], progress)
+        except Exception as exc:
+            with engine.begin() as con:
+                con.execute(text("""
+                    UPDATE ingest_jobs SET status = 'failed', error = :e, finished_at = now() WHERE id = :j
+                """), {"e": str(exc)[:2000], "j": job_id})
+            events.publish({**base, "type": "ingest_failed", "error": str(exc)[:200]})
+            _record_metrics(events.client, "failed", started)
+            raise
+        with engine.begin() as con:
+            con.execute(text("""
+                UPDATE ingest_jobs SET status = 'done', finished_at = now() WHERE id = :j
+            """), {"j": job_id})
+        if GRAPH_SYNC and (result["chunks"] or result["chunks_deleted"] or result["chunks_moved"]):
+            # Deletes and renumbers change the graph too (removed content must
+            # lose its nodes). The graph is a derived view: a sync failure must
+            # not fail the ingest, sync_project_graph(project_id) repairs it later
+            try:
+                result["graph"] = sync_document_graph(doc["id"], doc["project_id"], engine=engine)
+            except Exception:
+                logger.exception("Graph sync for document %s failed", doc["id"])
+        events.publish({**base, "type": "ingest_done", "chunks": result["chunks"],
+                          "chunks_reused": result["chunks_reused"], "stages": result["stages"]})
+        _record_metrics(events.client, "done", started, result["stages"])
+    return result
+
+
+__all__ = ["run_ingest_job", "ingest_document", "EMBED_DIM"]
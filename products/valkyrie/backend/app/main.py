@@ -1,14 +1,17 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from sqlalchemy import text
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from .db import engine
+from .db_async import async_engine, pool_stats
+from .db_replicas import pin_writes, replica_router
 from .models import Base
+from .auth import acl_cache_stats, get_current_user, principal_cache_stats
+from . import metrics, seeding, vector_index
 from .routers import health
 from .routers.ingest import router as ingest_router
 from .routers.download import router as download_router
 from .routers.list import router as list_router
 from .routers.auth import router as auth_router
-from .routers.users import router as users_router
+from .routers.users import router as users_router, storage_monitor
 
 import logging
 logger = logging.getLogger("uvicorn.error")
@@ -26,8 +29,22 @@ from sqlalchemy.exc import ProgrammingError, SQLAlchemyError
 # Add WebSocket, CORS and typing imports
 from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Set
+from .events import EventBroadcaster
+from .event_bus import create_event_bus
 import asyncio
+import importlib
+import os
+import sys
+import time
+
+# Subsystems the request path imports on first use (search embeddings, numpy).
+# VALKYRIE_WARMUP=1 loads them in the background VALKYRIE_WARMUP_DELAY seconds
+# after startup, once the worker already answers /health, so the first search
+# does not pay for them either. scripts/import_budget.py keeps them out of
+# the import of this module.
+WARMUP = os.getenv("VALKYRIE_WARMUP", "0").lower() in ("1", "true", "yes")
+WARMUP_DELAY = float(os.getenv("VALKYRIE_WARMUP_DELAY", "2"))
+WARMUP_MODULES = (f"{__package__}.embeddings", f"{__package__}.embedding_service")
 
 app = FastAPI(title="Odin Valkyrie", version="0.1")
 
@@ -52,41 +69,47 @@ async def global_exception_handler(request: Request, exc: Exception):
 @app.on_event("startup")
 def startup():
     try:
-        Base.metadata.create_all(bind=engine)
-
-        with engine.begin() as con:
-            # Users (api_key is UNIQUE)
-            con.execute(text("""
-                INSERT INTO users (name, api_key, role)
-                VALUES (:n, :k, :r)
-                ON CONFLICT (api_key) DO NOTHING
-            """), [{"n":"CEO","k":"ceo-key-123","r":"ceo"},
-                   {"n":"Alice","k":"alice-key-123","r":"editor"},
-                   {"n":"Intern","k":"intern-key-123","r":"intern"}])
-
-            # Projects (name is UNIQUE)
-            con.execute(text("""
-                INSERT INTO projects (name)
-                VALUES (:n)
-                ON CONFLICT (name) DO NOTHING
-            """), [{"n":"Apollo"}, {"n":"Zephyr"}])
-
-            # Project membership (avoid dup with NOT EXISTS)
-            con.execute(text("""
-                INSERT INTO project_membership (user_id, project_id)
-                SELECT u.id, p.id
-                FROM users u, projects p
-                WHERE u.name = :uname AND p.name = :pname
-                  AND NOT EXISTS (
-                    SELECT 1 FROM project_membership pm
-                    WHERE pm.user_id = u.id AND pm.project_id = p.id
-                  )
-            """), [{"uname":"Alice","pname":"Apollo"},
-                   {"uname":"Intern","pname":"Zephyr"}])
+        # Skips DDL and seeding when the schema is at the migrations head and
+        # the default rows exist; otherwise one worker at a time does it
+        seeding.bootstrap(engine, Base.metadata)
     except Exception as exc:
         logger.exception("Exception during startup: %s", exc)
         raise
 
+@app.get("/api/auth/cache-stats")
+def auth_cache_stats(user=Depends(get_current_user)):
+    """Auth cache counters (every hit is a users/project_membership query saved)."""
+    if user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"principals": principal_cache_stats(), "project_acl": acl_cache_stats()}
+
+@app.get("/api/admin/db-pool")
+def db_pool_stats(user=Depends(get_current_user)):
+    """Async engine pool usage in this worker (checked_out near size+overflow = saturated)."""
+    if user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"primary": pool_stats(), **replica_router.stats()}
+
+# ANN index builds run CONCURRENTLY on a background thread (vector_index.py)
+index_builder = vector_index.IndexBuilder(lambda: engine)
+
+@app.get("/api/admin/vector-indexes")
+def list_vector_indexes(user=Depends(get_current_user)):
+    if user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"indexes": vector_index.list_indexes(engine), "build": index_builder.status}
+
+@app.post("/api/admin/vector-indexes/{project_id}", status_code=202)
+def build_vector_index(project_id: int, method: str = vector_index.DEFAULT_METHOD, rebuild: bool = False,
+                       user=Depends(get_current_user)):
+    if user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if method not in vector_index.METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(vector_index.METHODS)}")
+    if not index_builder.start(project_id, method, rebuild_existing=rebuild):
+        raise HTTPException(status_code=409, detail="An index build is already running")
+    return index_builder.status
+
 # Simple CORS for dev (adjust origins for production)
 app.add_middleware(
 	CORSMiddleware,
@@ -96,15 +119,57 @@ app.add_middleware(
 	allow_headers=["*"],
 )
 
-# In-process WebSocket broadcaster (dev only; use Redis/pubsub for multi-worker)
-_active_ws: Set[WebSocket] = set()
-_ws_lock = asyncio.Lock()
+# Reads right after a client's own write stay on the primary (db_replicas.py)
+app.middleware("http")(pin_writes)
+# Per-route latency, SQL count and DB time, slow-request SQL log (metrics.py);
+# added last so it is the outermost middleware and times the others too
+app.middleware("http")(metrics.record_requests)
+metrics.instrument_engine(engine, "primary")
+metrics.instrument_engine(async_engine, "primary-async")
+for replica in replica_router.replicas:
+    metrics.instrument_engine(replica.engine, replica.name)
+
+# WebSocket fan-out: per-connection queues in this worker (events.py), fed by
+# the event bus (event_bus.py; VALKYRIE_EVENT_BUS=redis for multi-worker)
+broadcaster = EventBroadcaster()
+event_bus = create_event_bus(broadcaster)
+metrics.watch_broadcaster(broadcaster)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request):
+	"""Prometheus scrape endpoint (this worker, plus ingest counters shared via Redis)."""
+	token = os.getenv("VALKYRIE_METRICS_TOKEN")
+	if token and request.headers.get("authorization") != f"Bearer {token}":
+		raise HTTPException(status_code=401, detail="Unauthorized")
+	return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.on_event("startup")
+async def start_event_bus():
+	await event_bus.start()
+	# storage accounting for /api/storage-info runs beside the request path
+	storage_monitor.start()
+	# replica health/lag checks for get_read_db (no-op without VALKYRIE_DATABASE_REPLICA_URLS)
+	await replica_router.start()
+	if WARMUP:
+		asyncio.get_running_loop().create_task(warm_up())
+
+async def warm_up():
+	await asyncio.sleep(WARMUP_DELAY)
+	started = time.monotonic()
+	for name in WARMUP_MODULES:
+		try:
+			# imports hold the import lock, not the event loop
+			await asyncio.to_thread(importlib.import_module, name)
+		except Exception as exc:
+			logger.warning("Warm-up import of %s failed: %s", name, exc)
+	logger.info("Warm-up loaded %s in %.0f ms", ", ".join(WARMUP_MODULES), (time.monotonic() - started) * 1000)
 
 @app.websocket("/ws/events")
 async def ws_events(ws: WebSocket):
 	await ws.accept()
-	async with _ws_lock:
-		_active_ws.add(ws)
+	# Optional topic filter: /ws/events?project_id=1&project_id=2
+	project_ids = ws.query_params.getlist("project_id")
+	sub = broadcaster.subscribe(ws, project_ids or None)
 	try:
 		while True:
 			# keep the connection alive; ignore incoming messages
@@ -112,36 +177,31 @@ async def ws_events(ws: WebSocket):
 	except WebSocketDisconnect:
 		pass
 	finally:
-		async with _ws_lock:
-			_active_ws.discard(ws)
+		await broadcaster.unsubscribe(sub)
 
 async def broadcast_event(event: dict):
-	"""Send JSON event to all connected WS clients (best-effort)."""
-	dead = []
-	async with _ws_lock:
-		conns = list(_active_ws)
-	for ws in conns:
-		try:
-			await ws.send_json(event)
-		except Exception:
-			dead.append(ws)
-	if dead:
-		async with _ws_lock:
-			for ws in dead:
-				_active_ws.discard(ws)
+	"""Publish a JSON event to WS clients on every worker (best-effort, never blocks on a socket)."""
+	await event_bus.publish(event)
 
 @app.on_event("shutdown")
 async def shutdown():
-	# clean up any in-memory websockets (no-op for most setups)
-	async with _ws_lock:
-		_active_ws.clear()
+	# flush pending events, then stop per-connection sender tasks
+	await event_bus.stop()
+	await broadcaster.close()
+	await storage_monitor.stop()
+	# only loaded if a search (or the warm-up) needed it
+	loaded = sys.modules.get(f"{__package__}.embedding_service")
+	if loaded is not None:
+		await loaded.embedding_service.close()
+	await replica_router.stop()
+	await async_engine.dispose()
 
 # Router includes:
 # keep health as-is (health endpoints usually are non-/api), expose the API routers under /api
 app.include_router(health.router)
 app.include_router(auth_router, prefix="/api")
 app.include_router(ingest_router, prefix="/api")
-app.include_router(list_router, prefix="/api")
+app.include_router(list_router)  # list.router carries its own /api prefix
 app.include_router(download_router, prefix="/api")
 app.include_router(users_router, prefix="/api")
 # Only include search router if it imported successfully and is a router instance
@@ -0,0 +1,399 @@
+"""Request, database and ingest metrics, exported on GET /metrics.
+
+Prometheus text format, rendered by the small registry below (counters,
+gauges, histograms; one lock per metric). Every uvicorn worker keeps its own
+registry, so scrape each worker (or run one per scrape target), the way
+/api/admin/db-pool reports per worker.
+
+  * `record_requests` (HTTP middleware): latency per route template, and per
+    request the number of SQL statements and the time spent in them. The
+    counts come from cursor events on every instrumented engine
+    (`instrument_engine`), attributed to the request through a ContextVar,
+    which follows the request into threadpool endpoints and the async
+    engine's greenlets.
+  * Requests slower than VALKYRIE_SLOW_REQUEST_MS log their statements,
+    grouped by SQL text with count and total time, so an N+1 pattern (one
+    `user_can_read_project` query per project) shows up as one line with a
+    large count.
+  * WebSocket connections and broadcast queue depth are read from the
+    EventBroadcaster at scrape time (`watch_broadcaster`).
+  * Ingest: RQ runs each job in a forked work horse, so the worker adds its
+    per-stage timings to a Redis hash (`IngestMetrics.record_job`) and
+    /metrics on any API worker renders that hash.
+"""
+import bisect
+import contextvars
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger("uvicorn.error")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+JOB_BUCKETS = (1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+SLOW_REQUEST_MS = float(os.getenv("VALKYRIE_SLOW_REQUEST_MS", "500"))
+# Statements kept per request for the slow-request log
+MAX_STATEMENTS = int(os.getenv("VALKYRIE_SLOW_REQUEST_MAX_STATEMENTS", "500"))
+INGEST_METRICS_KEY = os.getenv("VALKYRIE_INGEST_METRICS_KEY", "valkyrie:metrics:ingest")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+# ------------------------------------------------------------- registry ---
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn  # read at scrape time instead of being updated
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def _pairs(self, labels: tuple) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labels}")
+        return tuple(zip(self.labelnames, labels))
+
+    def samples(self) -> Iterator[tuple]:
+        if self.fn is not None:
+            yield self.name, (), self.fn()
+            return
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield self.name, self._pairs(labels), value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{_labels(pairs)} {_number(value)}" for name, pairs, value in self.samples()]
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                # per-bucket counts (non-cumulative), then the sum
+                row = self._values[labels] = [0] * len(self.buckets) + [0.0]
+            row[bisect.bisect_left(self.buckets, value)] += 1
+            row[-1] += value
+
+    def samples(self) -> Iterator[tuple]:
+        with self._lock:
+            items = sorted((labels, list(row)) for labels, row in self._values.items())
+        for labels, row in items:
+            pairs = self._pairs(labels)
+            total = 0
+            for bound, count in zip(self.buckets, row):
+                total += count
+                yield f"{self.name}_bucket", pairs + (("le", _number(bound)),), total
+            yield f"{self.name}_sum", pairs, row[-1]
+            yield f"{self.name}_count", pairs, total
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines += metric.render()
+            except Exception as exc:
+                # a broken scrape-time callback must not take down the whole scrape
+                logger.warning("Metric %s failed to render: %s", metric.name, exc)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "valkyrie_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")))
+REQUEST_SECONDS = registry.register(Histogram(
+    "valkyrie_http_request_duration_seconds", "Time to response headers per route.", ("method", "route")))
+REQUEST_DB_SECONDS = registry.register(Histogram(
+    "valkyrie_http_request_db_seconds", "Time spent in SQL statements per request.", ("method", "route")))
+REQUEST_QUERIES = registry.register(Histogram(
+    "valkyrie_http_request_db_queries", "SQL statements executed per request.", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS))
+DB_STATEMENTS = registry.register(Counter(
+    "valkyrie_db_statements_total", "SQL statements by engine.", ("db",)))
+DB_SECONDS = registry.register(Counter(
+    "valkyrie_db_statement_seconds_total", "Time spent in SQL statements by engine.", ("db",)))
+SLOW_REQUESTS = registry.register(Counter(
+    "valkyrie_http_slow_requests_total", "Requests slower than VALKYRIE_SLOW_REQUEST_MS.", ("method", "route")))
+
+
+# After a failed Redis read, scrapes skip the ingest counters for this long
+# instead of waiting on the connection every time
+INGEST_RETRY_SECONDS = float(os.getenv("VALKYRIE_INGEST_METRICS_RETRY_SECONDS", "30"))
+_ingest_unavailable_until = 0.0
+
+
+def render() -> str:
+    """Text for GET /metrics: this worker's registry plus the shared ingest counters."""
+    global _ingest_unavailable_until
+    text = registry.render()
+    ingest = get_ingest_metrics()
+    if ingest is not None and time.monotonic() >= _ingest_unavailable_until:
+        try:
+            text += ingest.render()
+        except Exception as exc:
+            _ingest_unavailable_until = time.monotonic() + INGEST_RETRY_SECONDS
+            logger.warning("Ingest metrics unavailable for %.0fs: %s", INGEST_RETRY_SECONDS, exc)
+    return text
+
+
+# ------------------------------------------------------ request context ---
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements: List[Tuple[str, float]] = []
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "valkyrie_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._valkyrie_started = time.perf_counter()
+
+
+def _make_after_cursor_execute(db: str):
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_valkyrie_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        DB_STATEMENTS.inc(db)
+        DB_SECONDS.inc(db, amount=elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            if len(stats.statements) < MAX_STATEMENTS:
+                stats.statements.append((statement, elapsed))
+    return after
+
+
+_instrumented: set = set()
+
+
+def instrument_engine(engine, db: str = "primary"):
+    """Count and time every statement on `engine` (sync or async), once per engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if id(sync_engine) in _instrumented:
+        return
+    _instrumented.add(id(sync_engine))
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _make_after_cursor_execute(db))
+
+
+def _route(request) -> str:
+    # The template (/api/documents/{doc_id}), not the raw path: one series per route
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+async def record_requests(request, call_next):
+    """HTTP middleware: latency, DB time and statement count per route; logs slow requests."""
+    stats = RequestStats()
+    token = _current.set(stats)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        method, route = request.method, _route(request)
+        REQUESTS.inc(method, route, str(status))
+        REQUEST_SECONDS.observe(elapsed, method, route)
+        REQUEST_DB_SECONDS.observe(stats.db_seconds, method, route)
+        REQUEST_QUERIES.observe(stats.queries, method, route)
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            SLOW_REQUESTS.inc(method, route)
+            log_slow_request(method, request.url.path, route, status, elapsed, stats)
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def summarize_statements(statements: Sequence[Tuple[str, float]], width: int = 200) -> List[dict]:
+    """Group statements by SQL text, slowest total first (repeats = N+1 candidates)."""
+    groups: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+    for sql, seconds in statements:
+        group = groups[_WHITESPACE.sub(" ", sql).strip()[:width]]
+        group[0] += 1
+        group[1] += seconds
+    return [{"sql": sql, "count": count, "seconds": seconds}
+            for sql, (count, seconds) in sorted(groups.items(), key=lambda kv: -kv[1][1])]
+
+
+def log_slow_request(method: str, path: str, route: str, status: int, elapsed: float, stats: RequestStats):
+    lines = [f"  {g['count']:4d}x {g['seconds'] * 1000:9.1f} ms  {g['sql']}"
+             for g in summarize_statements(stats.statements)]
+    more = stats.queries - len(stats.statements)
+    if more > 0:
+        lines.append(f"  ... {more} more statements not recorded")
+    logger.warning("Slow request %s %s (%s) -> %s in %.0f ms: %d SQL statements, %.0f ms in the database\n%s",
+                   method, path, route, status, elapsed * 1000, stats.queries, stats.db_seconds * 1000,
+                   "\n".join(lines))
+
+
+# ------------------------------------------------------------ websockets ---
+
+def watch_broadcaster(broadcaster):
+    """WebSocket and fan-out queue gauges, read from broadcaster.stats() per scrape."""
+    def stat(key):
+        return lambda: broadcaster.stats()[key]
+
+    registry.register(Gauge("valkyrie_ws_connections", "Open /ws/events connections.", fn=stat("connections")))
+    registry.register(Gauge("valkyrie_ws_queued_events", "Events queued for WebSocket clients.", fn=stat("queued")))
+    registry.register(Gauge("valkyrie_ws_max_queue_depth", "Deepest per-connection send queue.",
+                            fn=stat("max_queue_depth")))
+    registry.register(Counter("valkyrie_ws_events_published_total", "Events handed to the broadcaster.",
+                              fn=stat("published")))
+    registry.register(Counter("valkyrie_ws_events_dropped_total", "Events dropped for slow WebSocket clients.",
+                              fn=stat("dropped")))
+
+
+# ---------------------------------------------------------------- ingest ---
+
+INGEST_HELP = {
+    "valkyrie_ingest_jobs_total": ("counter", "Ingest jobs by final status."),
+    "valkyrie_ingest_job_duration_seconds": ("histogram", "Ingest job wall time."),
+    "valkyrie_ingest_stage_items_total": ("counter", "Items produced per ingest stage."),
+    "valkyrie_ingest_stage_busy_seconds_total": ("counter", "Time an ingest stage spent working."),
+    "valkyrie_ingest_stage_wait_seconds_total": ("counter", "Time an ingest stage waited for its upstream stage."),
+    "valkyrie_ingest_stage_blocked_seconds_total": ("counter",
+                                                    "Time an ingest stage waited on a full downstream queue."),
+}
+_FIELD = re.compile(r'^(\w+?)(_bucket|_sum|_count)?(\{.*\})?$')
+
+
+def _le(field: str) -> float:
+    m = re.search(r'le="([^"]+)"', field)
+    return math.inf if m is None or m.group(1) == "+Inf" else float(m.group(1))
+
+
+class IngestMetrics:
+    """Ingest counters in one Redis hash (field = sample name with labels)."""
+
+    def __init__(self, client, key: str = INGEST_METRICS_KEY):
+        self.client = client
+        self.key = key
+
+    def record_job(self, status: str, seconds: float, stages: Optional[dict] = None):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(self.key, f'valkyrie_ingest_jobs_total{{status="{_escape(status)}"}}', 1)
+        for bound in JOB_BUCKETS + (math.inf,):
+            # cumulative buckets; +0 still creates the field so every bucket is exported
+            pipe.hincrby(self.key, f'valkyrie_ingest_job_duration_seconds_bucket{{le="{_number(bound)}"}}',
+                         1 if seconds <= bound else 0)
+        pipe.hincrbyfloat(self.key, "valkyrie_ingest_job_duration_seconds_sum", seconds)
+        pipe.hincrby(self.key, "valkyrie_ingest_job_duration_seconds_count", 1)
+        for stage, s in (stages or {}).items():
+            label = f'{{stage="{_escape(stage)}"}}'
+            pipe.hincrby(self.key, f"valkyrie_ingest_stage_items_total{label}", int(s.get("items", 0)))
+            for field in ("busy", "wait", "blocked"):
+                pipe.hincrbyfloat(self.key, f"valkyrie_ingest_stage_{field}_seconds_total{label}",
+                                  float(s.get(f"{field}_seconds", 0.0)))
+        pipe.execute()
+
+    def render(self) -> str:
+        by_metric: Dict[str, list] = defaultdict(list)
+        for field, value in self.client.hgetall(self.key).items():
+            field = field.decode() if isinstance(field, bytes) else field
+            value = value.decode() if isinstance(value, bytes) else value
+            m = _FIELD.match(field)
+            if m is None:
+                continue
+            by_metric[m.group(1)].append((field, float(value)))
+        lines = []
+        for name, (kind, help) in INGEST_HELP.items():
+            if name not in by_metric:
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            # histogram samples in bucket order, then _sum and _count
+            order = {"_bucket": 0, "_sum": 1, "_count": 2}
+            for field, value in sorted(by_metric[name], key=lambda fv: (
+                    order.get(_FIELD.match(fv[0]).group(2), 0), _le(fv[0]), fv[0])):
+                lines.append(f"{field} {_number(value)}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+_ingest_metrics = None
+
+
+def get_ingest_metrics() -> Optional[IngestMetrics]:
+    """Shared ingest counters (VALKYRIE_INGEST_METRICS=off disables), built on first scrape."""
+    global _ingest_metrics
+    if os.getenv("VALKYRIE_INGEST_METRICS", "redis").lower() == "off":
+        return None
+    if _ingest_metrics is None:
+        import redis
+
+        _ingest_metrics = IngestMetrics(redis.Redis.from_url(
+            os.getenv("VALKYRIE_REDIS_URL", "redis://localhost:6379/0"), socket_timeout=0.5,
+            socket_connect_timeout=0.5, retry_on_timeout=False))
+    return _ingest_metrics
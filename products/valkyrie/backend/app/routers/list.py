@@ -1,58 +1,129 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import binascii
+import json
+import os
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy import text
-from sqlalchemy.orm import Session
-from ..db import get_db
-from ..deps import get_current_user, user_can_read_project
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from .. import auth
+from ..auth import get_current_user_async, readable_project_ids_async
+from ..db_replicas import get_read_db
 
 router = APIRouter(prefix="/api")
 
+# Page sizes: the old hard limits are kept as defaults, callers may ask for
+# more up to MAX_PAGE_SIZE and walk the rest with `cursor`.
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_MEMBER_PAGE_SIZE = 200
+MAX_PAGE_SIZE = int(os.getenv("VALKYRIE_LIST_MAX_PAGE_SIZE", "1000"))
+# Rows fetched per round trip from the server-side cursor in NDJSON mode
+STREAM_BATCH_SIZE = int(os.getenv("VALKYRIE_LIST_STREAM_BATCH", "1000"))
+
+def encode_cursor(last_id: int) -> str:
+    """Opaque keyset cursor: resume strictly after (below) document `last_id`."""
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_id = json.loads(raw)["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # bool is an int subclass: {"id": true} would otherwise resume after id 1
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return last_id
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def _select(where: list) -> str:
+    """Keyset query over documents ordered by id DESC (served by the PK index)."""
+    sql = """
+        SELECT d.id, d.filename, d.project_id, d.owner_user_id, d.created_at
+        FROM documents d
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY d.id DESC"
+
+async def _page(db: AsyncSession, where: list, params: dict, limit: int):
+    rows = (await db.execute(
+        text(_select(where) + " LIMIT :limit"),
+        {**params, "limit": limit + 1},
+    )).mappings().all()
+    next_cursor = encode_cursor(rows[limit - 1]["id"]) if len(rows) > limit else None
+    return {"rows": [dict(r) for r in rows[:limit]], "next_cursor": next_cursor}
+
+def _stream(engine: AsyncEngine, where: list, params: dict, headers: dict) -> StreamingResponse:
+    """NDJSON over a server-side cursor: memory stays at one batch per worker.
+
+    `engine` is the one get_read_db bound the request's session to, so the
+    stream reads from the database named in X-Valkyrie-DB. Returned responses
+    skip FastAPI's merge of dependency headers, hence `headers`.
+    """
+    stmt = text(_select(where)).execution_options(
+        stream_results=True, yield_per=STREAM_BATCH_SIZE
+    )
+
+    async def lines():
+        # Own connection: the request-scoped Session may be closed before the
+        # body finishes streaming.
+        async with engine.connect() as con:
+            result = (await con.stream(stmt, params)).mappings()
+            async for batch in result.partitions():
+                yield "".join(
+                    json.dumps(dict(r), default=_json_default, separators=(",", ":")) + "\n"
+                    for r in batch
+                )
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
 @router.get("/list")
-def list_docs(
+async def list_docs(
+    response: Response,
     project_id: int | None = None,
-    db: Session = Depends(get_db),
-    user = Depends(get_current_user)
+    cursor: str | None = None,
+    limit: int | None = None,
+    format: str = "json",
+    db: AsyncSession = Depends(get_read_db),
+    user = Depends(get_current_user_async)
 ):
-    # DEVELOPMENT MODE - Allow all access
-    DEV_MODE = True
-    
-    if DEV_MODE:
-        # Return all documents for development
-        if project_id is None:
-            rows = db.execute(text("""
-                SELECT id, filename, project_id, owner_user_id, created_at
-                FROM documents ORDER BY id DESC LIMIT 500
-            """)).mappings().all()
-        else:
-            rows = db.execute(text("""
-                SELECT id, filename, project_id, owner_user_id, created_at
-                FROM documents WHERE project_id=:p ORDER BY id DESC LIMIT 500
-            """), {"p": project_id}).mappings().all()
-        return {"rows": [dict(r) for r in rows]}
-    
-    # Production mode - normal access control
-    if user["role"] != "ceo":
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    where, params = [], {}
+    if cursor is not None:
+        where.append("d.id < :after")
+        params["after"] = decode_cursor(cursor)
+    if project_id is not None:
+        where.append("d.project_id = :p")
+        params["p"] = project_id
+
+    page_size = limit or DEFAULT_PAGE_SIZE
+    # DEVELOPMENT MODE (auth.DEV_MODE) - Allow all access
+    if not auth.DEV_MODE and user["role"] != "ceo":
+        # Production mode - normal access control against the cached ACL set
+        readable = await readable_project_ids_async(user, db)
         if project_id is None:
-            rows = db.execute(text("""
-                SELECT d.id, d.filename, d.project_id, d.owner_user_id, d.created_at
-                FROM documents d
-                JOIN project_membership pm ON pm.project_id = d.project_id
-                WHERE pm.user_id = :u
-                ORDER BY d.id DESC LIMIT 200
-            """), {"u": user["id"]}).mappings().all()
-            return {"rows": [dict(r) for r in rows]}
-        else:
-            if not user_can_read_project(user, project_id, db):
-                raise HTTPException(status_code=403, detail="No access to project")
-
-    # CEO or authorized project scope
-    if project_id is None:
-        rows = db.execute(text("""
-            SELECT id, filename, project_id, owner_user_id, created_at
-            FROM documents ORDER BY id DESC LIMIT 500
-        """)).mappings().all()
-    else:
-        rows = db.execute(text("""
-            SELECT id, filename, project_id, owner_user_id, created_at
-            FROM documents WHERE project_id=:p ORDER BY id DESC LIMIT 500
-        """), {"p": project_id}).mappings().all()
-    return {"rows": [dict(r) for r in rows]}
+            if not readable:
+                if format == "ndjson":
+                    return StreamingResponse(iter(()), media_type="application/x-ndjson",
+                                             headers=dict(response.headers))
+                return {"rows": [], "next_cursor": None}
+            where.append("d.project_id = ANY(:ids)")
+            params["ids"] = sorted(readable)
+            page_size = limit or DEFAULT_MEMBER_PAGE_SIZE
+        elif project_id not in readable:
+            raise HTTPException(status_code=403, detail="No access to project")
+
+    if format == "ndjson":
+        return _stream(db.bind, where, params, dict(response.headers))
+    return await _page(db, where, params, page_size)
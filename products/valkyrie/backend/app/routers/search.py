@@ -0,0 +1,210 @@
+import html
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..auth import get_current_user, get_current_user_async, readable_project_ids_async
+from ..db_replicas import get_read_db
+from ..graph import DEFAULT_FANOUT, get_graph_service
+from ..search_cache import get_search_cache, index_generations
+from ..vector_index import HNSW_EF_SEARCH, IVFFLAT_PROBES
+
+router = APIRouter(prefix="/search")
+
+# Candidates taken from each ranking (keyword, vector) before fusion
+DEFAULT_DEPTH = int(os.getenv("VALKYRIE_SEARCH_DEPTH", "100"))
+MAX_DEPTH = int(os.getenv("VALKYRIE_SEARCH_MAX_DEPTH", "1000"))
+RRF_K = int(os.getenv("VALKYRIE_SEARCH_RRF_K", "60"))
+# ts_rank_cd has to read every matching tsvector. When a query matches more
+# chunks than this, only the newest MATCH_CAP matches (highest chunk id) are
+# ranked: an approximation, but a deterministic one. Below the cap the keyword
+# ranking is exact; the vector side of the fusion always sees every chunk.
+MATCH_CAP = int(os.getenv("VALKYRIE_SEARCH_MATCH_CAP", "2000"))
+# Up to this many projects the vector CTE runs one branch per project so each
+# can use that project's partial ANN index (vector_index.py); beyond it, one
+# scan filtered with ANY()
+MAX_PROJECT_BRANCHES = int(os.getenv("VALKYRIE_SEARCH_MAX_PROJECT_BRANCHES", "16"))
+# Upper bound for the per-request ANN knobs (pgvector caps hnsw.ef_search at 1000)
+MAX_ANN_KNOB = 1000
+# ts_headline returns document text verbatim: highlight with control
+# characters, HTML-escape, then turn those into <mark> (render_snippet)
+HEADLINE_START, HEADLINE_STOP = "\x02", "\x03"
+HEADLINE_OPTIONS = f"MaxFragments=2, MaxWords=30, MinWords=10, StartSel={HEADLINE_START}, StopSel={HEADLINE_STOP}"
+
+
+def render_snippet(headline: Optional[str]) -> Optional[str]:
+    """HTML-safe snippet: escaped document text with <mark> around the matches."""
+    if headline is None:
+        return None
+    return html.escape(headline).replace(HEADLINE_START, "<mark>").replace(HEADLINE_STOP, "</mark>")
+
+
+def _vector_candidates(project_ids: Optional[List[int]]) -> str:
+    order = "c.embedding <=> CAST(:vec AS vector)"
+    if project_ids is not None and len(project_ids) <= MAX_PROJECT_BRANCHES:
+        # Integer literals, not parameters: the planner only picks a partial
+        # index when it can prove the predicate at plan time
+        branches = " UNION ALL ".join(
+            f"(SELECT c.id, {order} AS dist FROM chunks c "
+            f"WHERE c.project_id = {int(p)} ORDER BY dist LIMIT :depth)"
+            for p in project_ids
+        )
+        return f"SELECT id, dist FROM ({branches}) b ORDER BY dist LIMIT :depth"
+    where = "WHERE c.project_id = ANY(:ids)" if project_ids is not None else ""
+    return f"SELECT c.id, {order} AS dist FROM chunks c {where} ORDER BY dist LIMIT :depth"
+
+
+def hybrid_sql(project_ids: Optional[List[int]]) -> str:
+    """Keyword and vector candidates, RRF fusion and snippets in one statement."""
+    keyword_filter = "AND m.project_id = ANY(:ids)" if project_ids is not None else ""
+    return f"""
+        WITH q AS MATERIALIZED (
+            SELECT websearch_to_tsquery('english', :q) AS tsq
+        ),
+        kw AS (
+            SELECT id, row_number() OVER (ORDER BY score DESC, id) AS rank
+            FROM (
+                SELECT c.id, ts_rank_cd(c.tsv, q.tsq) AS score
+                FROM chunks c, q
+                WHERE c.id IN (
+                    SELECT m.id FROM chunks m, q
+                    WHERE m.tsv @@ q.tsq {keyword_filter}
+                    ORDER BY m.id DESC
+                    LIMIT :match_cap
+                )
+                ORDER BY score DESC, c.id
+                LIMIT :depth
+            ) k
+        ),
+        vec AS (
+            SELECT id, row_number() OVER (ORDER BY dist, id) AS rank
+            FROM ({_vector_candidates(project_ids)}) v
+        ),
+        fused AS (
+            SELECT coalesce(kw.id, vec.id) AS id,
+                   coalesce(1.0 / (:rrf_k + kw.rank), 0) + coalesce(1.0 / (:rrf_k + vec.rank), 0) AS score,
+                   kw.rank AS keyword_rank, vec.rank AS vector_rank
+            FROM kw FULL OUTER JOIN vec ON kw.id = vec.id
+            ORDER BY score DESC, id
+            LIMIT :limit
+        )
+        SELECT f.id AS chunk_id, c.document_id, c.project_id, c.ord, d.filename,
+               f.score, f.keyword_rank, f.vector_rank,
+               ts_headline('english', c.text, q.tsq, :headline_options) AS snippet
+        FROM fused f
+        JOIN chunks c ON c.id = f.id
+        LEFT JOIN documents d ON d.id = c.document_id
+        CROSS JOIN q
+        ORDER BY f.score DESC, f.id
+    """
+
+
+async def hybrid_search(db: AsyncSession, query: str, vector, project_ids: Optional[List[int]],
+                  limit: int, depth: int, rrf_k: int = RRF_K, ef_search: Optional[int] = None,
+                  probes: Optional[int] = None) -> List[dict]:
+    # Recall/latency knobs for this transaction only (see vector_index.py). An
+    # HNSW scan returns at most ef_search rows, so it never goes below depth.
+    ef_search = max(ef_search or HNSW_EF_SEARCH, depth)
+    if ef_search != HNSW_EF_SEARCH:
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+    if probes is not None and probes != IVFFLAT_PROBES:
+        await db.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+    from ..embeddings import to_pgvector  # numpy: first search, not API import
+
+    rows = (await db.execute(text(hybrid_sql(project_ids)), {
+        "q": query, "vec": to_pgvector(vector), "ids": project_ids,
+        "depth": depth, "limit": limit, "rrf_k": rrf_k, "match_cap": MATCH_CAP,
+        "headline_options": HEADLINE_OPTIONS,
+    })).mappings().all()
+    await db.rollback()  # end the read transaction (and the SET LOCAL) before returning the connection
+    return [{**r, "score": float(r["score"]), "snippet": render_snippet(r["snippet"])} for r in rows]
+
+
+@router.get("/")
+async def search(
+    q: str = Query(..., min_length=1, max_length=1000),
+    project_id: Optional[List[int]] = Query(None),
+    limit: int = 20,
+    depth: int = DEFAULT_DEPTH,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+    user = Depends(get_current_user_async)
+):
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    if not limit <= depth <= MAX_DEPTH:
+        raise HTTPException(status_code=400, detail=f"depth must be between limit and {MAX_DEPTH}")
+    for name, value in (("ef_search", ef_search), ("probes", probes)):
+        if value is not None and not 1 <= value <= MAX_ANN_KNOB:
+            raise HTTPException(status_code=400, detail=f"{name} must be between 1 and {MAX_ANN_KNOB}")
+
+    readable = await readable_project_ids_async(user, db)
+    if project_id:
+        denied = [p for p in project_id if readable is not None and p not in readable]
+        if denied:
+            raise HTTPException(status_code=403, detail="No access to project")
+        scope = sorted(set(project_id))
+    elif readable is None:
+        scope = None
+    else:
+        scope = sorted(readable)
+        if not scope:
+            return {"query": q, "results": []}
+
+    generations = await index_generations(db, scope)
+    search_cache = get_search_cache()
+    key = search_cache.key(q, scope, {"limit": limit, "depth": depth, "ef_search": ef_search, "probes": probes},
+                           generations)
+    results = await search_cache.get(key)
+    if results is None:
+        # Loaded on the first search (or by VALKYRIE_WARMUP), not at worker start
+        from ..embedding_service import embedding_service
+
+        vector = await embedding_service.embed(q)
+        results = await hybrid_search(db, q, vector, scope, limit, depth, ef_search=ef_search, probes=probes)
+        await search_cache.set(key, results)
+    return {"query": q, "results": results}
+
+
+@router.get("/cache-stats")
+def search_cache_stats(user=Depends(get_current_user)):
+    """Result-cache hit rates (local LRU and, when enabled, the shared Redis tier)."""
+    if user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return get_search_cache().stats()
+
+
+@router.get("/graph")
+async def search_graph(
+    project_id: int,
+    entity: List[str] = Query(...),
+    depth: int = 1,
+    fanout: int = DEFAULT_FANOUT,
+    db: AsyncSession = Depends(get_read_db),
+    user = Depends(get_current_user_async)
+):
+    """Deduplicated neighbourhood of one or more seed entities, `depth` hops out."""
+    readable = await readable_project_ids_async(user, db)
+    if readable is not None and project_id not in readable:
+        raise HTTPException(status_code=403, detail="No access to project")
+    if len(entity) > 50:
+        raise HTTPException(status_code=400, detail="At most 50 seed entities")
+    try:
+        graph = get_graph_service()
+        result = await run_in_threadpool(graph.subgraph, project_id, entity, depth, fanout)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"project_id": project_id, "seeds": entity, "depth": depth, **result}
+
+
+@router.get("/graph/cache-stats")
+def search_graph_cache_stats(user=Depends(get_current_user)):
+    """Adjacency-cache hit rate and backend round trips of the graph service."""
+    if user["role"] != "ceo":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return get_graph_service().stats()
@@ -1,16 +1,32 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import json
 import os
+import time
 from datetime import datetime
 import uuid
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ..auth import get_current_user, readable_project_ids, require_min_role
+from ..blobstore import BLOB_DIR, BlobStore, link_file, lookup_file, unlink_file
+from ..file_responses import RangedFileResponse, zip_stream
+from ..db import engine, get_db
+from ..storage_monitor import StorageMonitor
+from ..uploads import (
+    MAX_UPLOAD_BYTES, InvalidUpload, MultipartUpload, UploadTooLarge, discard, safe_filename, stream_to_temp
+)
 
 router = APIRouter()
 
 # Configuration for external SSD
 EXTERNAL_SSD_PATH = "/Volumes"  # macOS default external drive mount point
 USER_DATA_DIR = "valkyrie_user_data"
+# Mount discovery lists /Volumes; drives come and go rarely, so reuse the answer
+MOUNT_CACHE_SECONDS = float(os.getenv("VALKYRIE_MOUNT_CACHE_SECONDS", "60"))
+_mount_cache = {"path": None, "checked_at": 0.0}
 
 class UserData(BaseModel):
     name: str
@@ -22,7 +38,15 @@ class UserData(BaseModel):
     id: str
 
 def get_external_ssd_path():
-    """Find the external SSD mount point"""
+    """Find the external SSD mount point (cached for MOUNT_CACHE_SECONDS)"""
+    path = _mount_cache["path"]
+    if path and time.monotonic() - _mount_cache["checked_at"] < MOUNT_CACHE_SECONDS and os.path.isdir(path):
+        return path
+    path = _discover_external_ssd_path()
+    _mount_cache.update(path=path, checked_at=time.monotonic())
+    return path
+
+def _discover_external_ssd_path():
     if os.path.exists(EXTERNAL_SSD_PATH):
         # Look for mounted drives
         drives = [d for d in os.listdir(EXTERNAL_SSD_PATH) 
@@ -40,6 +64,21 @@ def get_external_ssd_path():
     os.makedirs(fallback_path, exist_ok=True)
     return fallback_path
 
+def get_blob_store():
+    """Content-addressed store shared by all users (see blobstore.py)"""
+    base = os.getenv("VALKYRIE_STORAGE_PATH") or get_external_ssd_path()
+    return BlobStore(os.path.join(base, BLOB_DIR))
+
+class BlobReference(BaseModel):
+    filename: str
+    sha256: str
+    size_bytes: int
+    project_id: Optional[int] = None
+
+class ArchiveRequest(BaseModel):
+    filenames: List[str]
+    compress: bool = False
+
 def ensure_user_data_directory():
     """Ensure the user data directory exists on the external SSD"""
     ssd_path = get_external_ssd_path()
@@ -47,6 +86,12 @@ def ensure_user_data_directory():
     os.makedirs(user_data_path, exist_ok=True)
     return user_data_path
 
+def _owns(user, user_id: str) -> bool:
+    return user["id"] is not None and str(user["id"]) == user_id
+
+# Byte totals and disk usage for /storage-info, maintained off the request path
+storage_monitor = StorageMonitor(get_external_ssd_path, ensure_user_data_directory, lambda: engine)
+
 @router.post("/save-user-data")
 async def save_user_data(user_data: UserData):
     """Save user data to external SSD"""
@@ -75,6 +120,7 @@ async def save_user_data(user_data: UserData):
         keys_file = os.path.join(user_dir, "api_keys.json")
         with open(keys_file, 'w') as f:
             json.dump(user_data.apiKeys, f, indent=2)
+        storage_monitor.record_user(user_data.id)
         
         return {
             "success": True,
@@ -115,64 +161,195 @@ async def get_user_data(user_id: str):
 
 @router.get("/storage-info")
 async def get_storage_info():
-    """Get information about external SSD storage"""
+    """Get information about external SSD storage (served from the storage monitor)"""
     try:
-        ssd_path = get_external_ssd_path()
-        user_data_dir = ensure_user_data_directory()
-        
-        # Get disk usage
-        total, used, free = os.statvfs(ssd_path)[:3]
-        total_gb = (total * 4) / (1024**3)
-        used_gb = ((total - free) * 4) / (1024**3)
-        free_gb = (free * 4) / (1024**3)
-        
-        # Count users
-        user_count = 0
-        if os.path.exists(user_data_dir):
-            user_count = len([d for d in os.listdir(user_data_dir) 
-                            if os.path.isdir(os.path.join(user_data_dir, d))])
-        
-        return {
-            "ssd_path": ssd_path,
-            "user_data_directory": user_data_dir,
-            "disk_usage": {
-                "total_gb": round(total_gb, 2),
-                "used_gb": round(used_gb, 2),
-                "free_gb": round(free_gb, 2),
-                "usage_percentage": round((used_gb / total_gb) * 100, 2)
-            },
-            "user_count": user_count
-        }
-        
+        if not storage_monitor.has_disk:
+            # First request before the background loop's first pass: statvfs
+            # only, the database-derived counts stay flagged stale until the
+            # background reconcile succeeds
+            await run_in_threadpool(storage_monitor.refresh_disk)
+        return storage_monitor.snapshot()
+
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get storage info: {str(e)}"
         )
 
+@router.get("/storage-info/users/{user_id}")
+async def get_user_storage(user_id: str, user = Depends(get_current_user)):
+    """Bytes stored by one user (incrementally maintained); the user themself or ceo"""
+    if user["role"] != "ceo" and not _owns(user, user_id):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"user_id": user_id, "stored_bytes": storage_monitor.user_bytes(user_id)}
+
+@router.get("/storage-info/projects/{project_id}")
+async def get_project_storage(project_id: int, db: Session = Depends(get_db), user = Depends(get_current_user)):
+    """Bytes stored in one project (incrementally maintained); members only"""
+    readable = await run_in_threadpool(readable_project_ids, user, db)
+    if readable is not None and project_id not in readable:
+        raise HTTPException(status_code=403, detail="No access to project")
+    return {"project_id": project_id, "stored_bytes": storage_monitor.project_bytes(project_id)}
+
 @router.post("/upload-file/{user_id}")
-async def upload_file(user_id: str, file_data: dict):
-    """Upload a file to user's directory on external SSD"""
+async def upload_file(user_id: str, request: Request, db: Session = Depends(get_db)):
+    """Stream a multipart upload (`file`, optional `project_id`) into the deduplicating blob store"""
+    # Reject obviously oversized bodies before reading anything
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+
     try:
-        user_data_dir = ensure_user_data_directory()
-        user_dir = os.path.join(user_data_dir, user_id, "files")
-        
-        # Create file path
-        filename = file_data.get("filename")
-        file_path = os.path.join(user_dir, filename)
-        
-        # Save file content (in real implementation, you'd handle file uploads properly)
-        with open(file_path, 'w') as f:
-            f.write(file_data.get("content", ""))
-        
+        store = get_blob_store()
+        form = MultipartUpload(request)
+        # Hashed and size-checked chunk by chunk as the body arrives
+        staged = await stream_to_temp(form.file_chunks(), store.tmp_dir)
+        try:
+            filename = safe_filename(form.filename)
+            project_id = int(form.fields["project_id"]) if form.fields.get("project_id") else None
+        except ValueError:
+            await discard(staged["tmp_path"])
+            raise HTTPException(status_code=400, detail="Invalid filename or project_id")
+        try:
+            # Reference first, file second, commit last (see blobstore.py)
+            replaced = await run_in_threadpool(
+                link_file, db, user_id, filename, staged["sha256"], staged["size"], project_id
+            )
+            stored = await store.adopt(staged["tmp_path"], staged["sha256"])
+            await run_in_threadpool(db.commit)
+            storage_monitor.record_upload(user_id, staged["size"], project_id, replaced)
+        except BaseException:
+            await run_in_threadpool(db.rollback)
+            await discard(staged["tmp_path"])
+            raise
+
         return {
             "success": True,
             "message": f"File {filename} uploaded successfully",
-            "file_path": file_path
+            "file_path": store.path_for(staged["sha256"]),
+            "size_bytes": staged["size"],
+            "sha256": staged["sha256"],
+            "deduplicated": not stored
         }
-        
+
+    except HTTPException:
+        raise
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"File exceeds {e.limit} bytes")
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to upload file: {str(e)}"
         )
+
+@router.post("/upload-file/{user_id}/by-checksum")
+async def link_existing_file(user_id: str, ref: BlobReference, db: Session = Depends(get_db)):
+    """Metadata-only upload: reference content the store already has.
+
+    404 means the content is unknown and the client should upload the bytes.
+    """
+    try:
+        filename = safe_filename(ref.filename)
+        sha256 = ref.sha256.lower()
+        store = get_blob_store()
+        blob_path = store.path_for(sha256)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid filename or sha256")
+
+    def link():
+        size = db.execute(text("SELECT size_bytes FROM blobs WHERE sha256 = :s FOR UPDATE"),
+                          {"s": sha256}).scalar()
+        if size is None or size != ref.size_bytes or not os.path.exists(blob_path):
+            db.rollback()
+            return False
+        replaced = link_file(db, user_id, filename, sha256, size, ref.project_id)
+        db.commit()
+        storage_monitor.record_upload(user_id, size, ref.project_id, replaced)
+        return True
+
+    if not await run_in_threadpool(link):
+        raise HTTPException(status_code=404, detail="Content not stored; upload the file")
+    return {
+        "success": True,
+        "message": f"File {filename} linked to existing content",
+        "file_path": blob_path,
+        "size_bytes": ref.size_bytes,
+        "sha256": sha256,
+        "deduplicated": True
+    }
+
+def _readable_file(db: Session, user, user_id: str, filename: str):
+    """lookup_file, or None when the caller may not read the file.
+
+    Owners read their own files; anyone else needs the file's project in
+    readable_project_ids (ceo reads everything). Callers answer None with the
+    same 404 as a missing file, so paths of unreadable files do not leak.
+    """
+    row = lookup_file(db, user_id, filename)
+    if row is None or _owns(user, user_id):
+        return row
+    readable = readable_project_ids(user, db)
+    if readable is None or (row["project_id"] is not None and row["project_id"] in readable):
+        return row
+    return None
+
+@router.api_route("/files/{user_id}/{filename}", methods=["GET", "HEAD"])
+async def download_file(user_id: str, filename: str, request: Request, db: Session = Depends(get_db),
+                        user = Depends(get_current_user)):
+    """Download a stored file with Range/If-Range, ETag and 304 support"""
+    row = await run_in_threadpool(_readable_file, db, user, user_id, filename)
+    if row is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    path = get_blob_store().path_for(row["sha256"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File content missing")
+    return RangedFileResponse(
+        path, request.headers, checksum=row["sha256"],
+        filename=row["filename"], method=request.method
+    )
+
+@router.delete("/files/{user_id}/{filename}")
+async def delete_file(user_id: str, filename: str, db: Session = Depends(get_db),
+                      user = Depends(get_current_user)):
+    """Remove a user's file; shared content stays until its last reference goes"""
+    def remove():
+        if _readable_file(db, user, user_id, filename) is None:
+            return None
+        if not _owns(user, user_id):
+            # Project members may read each other's files; removing them takes editor+
+            require_min_role(user, "editor")
+        removed = unlink_file(db, user_id, filename)
+        db.commit()
+        return removed
+
+    removed = await run_in_threadpool(remove)
+    if removed is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    storage_monitor.record_delete(user_id, removed)
+    return {"success": True, "message": f"File {filename} deleted"}
+
+@router.post("/files/{user_id}/archive")
+async def download_archive(user_id: str, req: ArchiveRequest, db: Session = Depends(get_db),
+                           user = Depends(get_current_user)):
+    """Stream several files as one zip, built on the fly"""
+    store = get_blob_store()
+
+    def resolve():
+        entries = []
+        for name in dict.fromkeys(req.filenames):
+            row = _readable_file(db, user, user_id, name)
+            if row is None:
+                return name, None
+            entries.append((row["filename"], store.path_for(row["sha256"])))
+        return None, entries
+
+    missing, entries = await run_in_threadpool(resolve)
+    if missing is not None:
+        raise HTTPException(status_code=404, detail=f"File not found: {missing}")
+    return StreamingResponse(
+        zip_stream(entries, compress=req.compress),
+        media_type="application/zip",
+        headers={"content-disposition": f'attachment; filename="{safe_filename(user_id)}-files.zip"'}
+    )
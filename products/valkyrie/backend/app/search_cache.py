@@ -0,0 +1,139 @@
+"""Result cache in front of /search.
+
+Keys combine the normalised query, the project scope, the request filters
+and each scoped project's index generation. Ingest bumps a project's
+generation in the same transaction that commits its chunks
+(`bump_generation`), so a search that runs after the commit computes a new
+key and never sees pre-ingest results; the stale entries are never read
+again and age out of the LRU/TTL on their own, no flush needed.
+
+Tiers: a per-worker LRUTTLCache, and optionally Redis
+(VALKYRIE_SEARCH_CACHE=redis) so every uvicorn worker shares results.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from .cache import LRUTTLCache
+
+logger = logging.getLogger("uvicorn.error")
+
+CACHE_SIZE = int(os.getenv("VALKYRIE_SEARCH_CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("VALKYRIE_SEARCH_CACHE_TTL", "300"))
+KEY_PREFIX = os.getenv("VALKYRIE_SEARCH_CACHE_PREFIX", "valkyrie:search:")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+def bump_generation(con, project_id: int):
+    """Call inside the transaction that changes a project's chunks."""
+    con.execute(text("""
+        INSERT INTO search_generations (project_id, generation) VALUES (:p, 1)
+        ON CONFLICT (project_id) DO UPDATE
+        SET generation = search_generations.generation + 1, updated_at = now()
+    """), {"p": project_id})
+
+
+async def index_generations(db, project_ids: Optional[Iterable[int]]) -> dict:
+    """Current generation per scoped project (one PK lookup); None scope = all projects."""
+    if project_ids is None:
+        row = (await db.execute(text("SELECT coalesce(sum(generation), 0), count(*) FROM search_generations"))).first()
+        return {"*": [int(row[0]), int(row[1])]}
+    ids = sorted(project_ids)
+    rows = (await db.execute(text("""
+        SELECT project_id, generation FROM search_generations WHERE project_id = ANY(:ids)
+    """), {"ids": ids})).all()
+    found = dict(rows)
+    return {str(p): int(found.get(p, 0)) for p in ids}
+
+
+class SearchCache:
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL, redis_client=None,
+                 prefix: str = KEY_PREFIX):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local = LRUTTLCache(max_entries=max_entries, ttl=ttl)
+        self.redis = redis_client
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def key(query: str, scope: Optional[Iterable[int]], filters: dict, generations: dict) -> str:
+        raw = json.dumps({
+            "q": normalize_query(query),
+            "scope": sorted(scope) if scope is not None else None,
+            "filters": filters,
+            "gen": generations,
+        }, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str):
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return value
+        try:
+            raw = await self.redis.get(self.prefix + key)
+        except Exception as exc:
+            self.redis_errors += 1
+            logger.warning("Search cache Redis read failed: %s", exc)
+            return None
+        if raw is None:
+            self.redis_misses += 1
+            return None
+        self.redis_hits += 1
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value):
+        self.local.set(key, value)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(self.prefix + key, json.dumps(value, default=str), ex=int(self.ttl))
+        except Exception as exc:
+            self.redis_errors += 1
+            logger.warning("Search cache Redis write failed: %s", exc)
+
+    def stats(self) -> dict:
+        local = self.local.stats()
+        out = {"local": local}
+        if self.redis is not None:
+            lookups = self.redis_hits + self.redis_misses
+            out["redis"] = {
+                "hits": self.redis_hits,
+                "misses": self.redis_misses,
+                "errors": self.redis_errors,
+                "hit_rate": round(self.redis_hits / lookups, 4) if lookups else 0.0,
+            }
+        requests = local["hits"] + local["misses"]
+        hits = local["hits"] + self.redis_hits
+        out["hit_rate"] = round(hits / requests, 4) if requests else 0.0
+        return out
+
+
+def create_search_cache() -> SearchCache:
+    """VALKYRIE_SEARCH_CACHE=redis adds the shared tier (VALKYRIE_REDIS_URL)."""
+    client = None
+    if os.getenv("VALKYRIE_SEARCH_CACHE", "local").lower() == "redis":
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(os.getenv("VALKYRIE_REDIS_URL", "redis://localhost:6379/0"))
+    return SearchCache(redis_client=client)
+
+
+_search_cache: Optional[SearchCache] = None
+
+
+def get_search_cache() -> SearchCache:
+    """Built on the first search, so importing the router opens no Redis client."""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = create_search_cache()
+    return _search_cache
@@ -0,0 +1,236 @@
+"""Schema check, default seed data and synthetic fixtures.
+
+Worker boot (`bootstrap`, called from main.startup) used to run
+Base.metadata.create_all plus the seed upserts in every uvicorn worker, so
+N workers raced on DDL at every start. Now:
+
+  1. Fast path, no lock: if alembic_version is at the head found in
+     migrations/versions and the default rows exist, nothing else runs.
+  2. Otherwise the worker takes a transaction-level advisory lock
+     (pg_advisory_xact_lock). Exactly one worker at a time re-checks and does
+     the work; the others wait for it, re-check, and find nothing to do.
+
+Seeding goes through `copy_stage`: rows are COPYed into a temp staging
+table and land in the real table with one INSERT ... SELECT ... ON CONFLICT
+DO NOTHING. That is idempotent, and fast enough for `seed_fixtures` to load
+millions of synthetic rows for load tests (scripts/seed_fixtures.py).
+"""
+import logging
+import os
+import random
+import re
+import time
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from .auth import invalidate_acl, invalidate_principal
+
+logger = logging.getLogger("uvicorn.error")
+
+MIGRATIONS_DIR = os.getenv(
+    "VALKYRIE_MIGRATIONS_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "migrations", "versions"),
+)
+# Arbitrary, stable key for pg_advisory_xact_lock ("valkseed")
+SEED_LOCK_KEY = 0x76616C6B73656564
+
+DEFAULT_USERS = [("CEO", "ceo-key-123", "ceo"), ("Alice", "alice-key-123", "editor"),
+                 ("Intern", "intern-key-123", "intern")]
+DEFAULT_PROJECTS = ["Apollo", "Zephyr"]
+# (user api_key, project name)
+DEFAULT_MEMBERSHIPS = [("alice-key-123", "Apollo"), ("intern-key-123", "Zephyr")]
+
+FIXTURE_PREFIX = "fixture"
+FIXTURE_ROLES = ("viewer", "viewer", "editor", "intern", "admin")
+
+
+# ---------------------------------------------------------- schema check ---
+
+def migrations_head(versions_dir: str = MIGRATIONS_DIR) -> Optional[str]:
+    """The revision no other migration names as down_revision (None if unknown)."""
+    if os.getenv("VALKYRIE_MIGRATIONS_HEAD"):
+        return os.environ["VALKYRIE_MIGRATIONS_HEAD"]
+    try:
+        names = [n for n in os.listdir(versions_dir) if n.endswith(".py")]
+    except OSError:
+        return None
+    revisions, parents = set(), set()
+    for name in names:
+        with open(os.path.join(versions_dir, name), encoding="utf-8") as f:
+            source = f.read()
+        rev = re.search(r'^revision\s*=\s*["\']([^"\']+)["\']', source, re.M)
+        down = re.search(r'^down_revision\s*=\s*["\']([^"\']+)["\']', source, re.M)
+        if rev:
+            revisions.add(rev.group(1))
+        if down:
+            parents.add(down.group(1))
+    heads = revisions - parents
+    return heads.pop() if len(heads) == 1 else None
+
+
+def _first_or_none(con, sql: str, params: Optional[dict] = None):
+    try:
+        with con.begin_nested():  # a missing table must not abort the outer transaction
+            return con.execute(text(sql) if isinstance(sql, str) else sql, params or {}).first()
+    except SQLAlchemyError:
+        return None
+
+
+def applied_revision(con) -> Optional[str]:
+    """alembic_version, or None when the schema is managed by create_all."""
+    row = _first_or_none(con, "SELECT version_num FROM alembic_version")
+    return row[0] if row else None
+
+
+def defaults_present(con) -> bool:
+    stmt = text("""
+        SELECT (SELECT count(*) FROM users WHERE api_key IN :keys),
+               (SELECT count(*) FROM projects WHERE name IN :names)
+    """).bindparams(bindparam("keys", expanding=True), bindparam("names", expanding=True))
+    row = _first_or_none(con, stmt, {"keys": [k for _, k, _ in DEFAULT_USERS], "names": DEFAULT_PROJECTS})
+    return row is not None and row[0] == len(DEFAULT_USERS) and row[1] == len(DEFAULT_PROJECTS)
+
+
+def bootstrap(engine, metadata, head: Optional[str] = None) -> dict:
+    """Per-worker startup: create missing tables and default rows, at most once."""
+    head = head if head is not None else migrations_head()
+    started = time.monotonic()
+    with engine.connect() as con:
+        if head is not None and applied_revision(con) == head and defaults_present(con):
+            return {"action": "none", "revision": head}
+    with engine.begin() as con:
+        if con.dialect.name == "postgresql":
+            # Released at commit; concurrent workers queue here instead of racing on DDL
+            con.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": SEED_LOCK_KEY})
+        revision = applied_revision(con)
+        created = False
+        if head is None or revision != head:
+            # Dev databases without alembic: create_all only adds missing tables
+            metadata.create_all(bind=con)
+            created = True
+        seeded = False
+        if not defaults_present(con):
+            seed_defaults(con)
+            seeded = True
+    result = {"action": "bootstrap", "revision": revision, "head": head, "create_all": created,
+              "seeded": seeded, "seconds": round(time.monotonic() - started, 3)}
+    logger.info("Database bootstrap: %s", result)
+    return result
+
+
+# -------------------------------------------------------------- loading ---
+
+def copy_stage(con, name: str, columns: Dict[str, str], rows: Iterable[tuple]) -> None:
+    """Create temp table `name` (column -> SQL type) and bulk-load `rows` into it.
+
+    COPY on PostgreSQL, executemany elsewhere (SQLite dev databases).
+    """
+    cols = ", ".join(columns)
+    defs = ", ".join(f"{c} {t}" for c, t in columns.items())
+    con.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    if con.dialect.name == "postgresql":
+        con.execute(text(f"CREATE TEMP TABLE {name} ({defs}) ON COMMIT DROP"))
+        with con.connection.driver_connection.cursor() as cur:
+            with cur.copy(f"COPY {name} ({cols}) FROM STDIN") as cp:
+                for row in rows:
+                    cp.write_row(row)
+        return
+    con.execute(text(f"CREATE TEMP TABLE {name} ({defs})"))
+    con.execute(text(f"INSERT INTO {name} ({cols}) VALUES ({', '.join(':' + c for c in columns)})"),
+                [dict(zip(columns, row)) for row in rows])
+
+
+def load_users(con, rows: Iterable[tuple]) -> int:
+    """rows: (name, api_key, role); existing api_keys are left alone."""
+    copy_stage(con, "stage_users", {"name": "TEXT", "api_key": "TEXT", "role": "TEXT"}, rows)
+    keys = con.execute(text("""
+        INSERT INTO users (name, api_key, role)
+        SELECT name, api_key, role FROM stage_users WHERE true
+        ON CONFLICT (api_key) DO NOTHING
+        RETURNING api_key
+    """)).scalars().all()
+    for key in keys:
+        invalidate_principal(api_key=key)
+    return len(keys)
+
+
+def load_projects(con, names: Iterable[str]) -> int:
+    copy_stage(con, "stage_projects", {"name": "TEXT"}, ((n,) for n in names))
+    return con.execute(text("""
+        INSERT INTO projects (name) SELECT name FROM stage_projects WHERE true
+        ON CONFLICT (name) DO NOTHING
+    """)).rowcount
+
+
+def load_memberships(con, pairs: Iterable[tuple]) -> int:
+    """pairs: (user api_key, project name)."""
+    copy_stage(con, "stage_memberships", {"api_key": "TEXT", "project": "TEXT"}, pairs)
+    user_ids = con.execute(text("""
+        INSERT INTO project_membership (user_id, project_id)
+        SELECT DISTINCT u.id, p.id
+        FROM stage_memberships s
+        JOIN users u ON u.api_key = s.api_key
+        JOIN projects p ON p.name = s.project
+        WHERE NOT EXISTS (
+            SELECT 1 FROM project_membership pm WHERE pm.user_id = u.id AND pm.project_id = p.id
+        )
+        RETURNING user_id
+    """)).scalars().all()
+    for user_id in set(user_ids):
+        invalidate_acl(user_id)
+    return len(user_ids)
+
+
+def seed_defaults(con) -> None:
+    load_users(con, DEFAULT_USERS)
+    load_projects(con, DEFAULT_PROJECTS)
+    load_memberships(con, DEFAULT_MEMBERSHIPS)
+
+
+def seed_fixtures(con, users: int = 0, projects: int = 0, documents: int = 0,
+                  memberships_per_user: int = 3, seed: int = 0) -> dict:
+    """Synthetic users, projects, memberships and documents for load tests.
+
+    Names are deterministic (`fixture-user-17`, `fixture-project-3`,
+    `fixture-doc-123.txt`), so running it again only adds what is missing:
+    raising --documents from 1M to 2M loads the second million.
+    """
+    rng = random.Random(seed)
+    out = {}
+    if users:
+        out["users"] = load_users(con, (
+            (f"{FIXTURE_PREFIX}-user-{i}", f"{FIXTURE_PREFIX}-key-{i}", FIXTURE_ROLES[i % len(FIXTURE_ROLES)])
+            for i in range(users)))
+    if projects:
+        out["projects"] = load_projects(con, (f"{FIXTURE_PREFIX}-project-{i}" for i in range(projects)))
+    if users and projects and memberships_per_user:
+        per_user = min(memberships_per_user, projects)
+        out["memberships"] = load_memberships(con, (
+            (f"{FIXTURE_PREFIX}-key-{u}", f"{FIXTURE_PREFIX}-project-{p}")
+            for u in range(users) for p in rng.sample(range(projects), per_user)))
+    if documents:
+        out["documents"] = _load_documents(con, documents, rng)
+    return out
+
+
+def _load_documents(con, documents: int, rng: random.Random) -> int:
+    project_ids = [r[0] for r in con.execute(text(
+        "SELECT id FROM projects WHERE name LIKE :p ORDER BY id"), {"p": f"{FIXTURE_PREFIX}-project-%"})]
+    owner_ids = [r[0] for r in con.execute(text(
+        "SELECT id FROM users WHERE api_key LIKE :p ORDER BY id"), {"p": f"{FIXTURE_PREFIX}-key-%"})]
+    if not project_ids or not owner_ids:
+        raise ValueError("fixture documents need fixture users and projects")
+    # documents has no natural key; count what an earlier run loaded and continue from there
+    existing = con.execute(text("SELECT count(*) FROM documents WHERE filename LIKE :p"),
+                           {"p": f"{FIXTURE_PREFIX}-doc-%"}).scalar()
+    if existing >= documents:
+        return 0
+    copy_stage(con, "stage_documents", {"filename": "TEXT", "project_id": "INTEGER", "owner_user_id": "INTEGER"},
+               ((f"{FIXTURE_PREFIX}-doc-{i}.txt", rng.choice(project_ids), rng.choice(owner_ids))
+                for i in range(existing, documents)))
+    return con.execute(text("""
+        INSERT INTO documents (filename, project_id, owner_user_id)
+        SELECT filename, project_id, owner_user_id FROM stage_documents
+    """)).rowcount
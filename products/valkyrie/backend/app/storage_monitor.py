@@ -0,0 +1,185 @@
+"""Background storage accounting behind /api/storage-info.
+
+Byte totals per user and per project are kept in memory and adjusted
+incrementally from upload/delete events, disk usage is refreshed from
+statvfs on a short timer, and a slower reconcile pass recomputes everything
+from user_files and the user-data directory to absorb drift (other workers'
+writes, files changed behind the API's back). Requests only read the last
+snapshot; until a reconcile has succeeded (or when the last one is older
+than two reconcile periods, e.g. the database is down) the counts in it are
+flagged `stale`, while disk usage is still current.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .blobstore import dedup_stats
+
+logger = logging.getLogger("uvicorn.error")
+
+DISK_REFRESH_SECONDS = float(os.getenv("VALKYRIE_STORAGE_DISK_REFRESH_SECONDS", "15"))
+RECONCILE_SECONDS = float(os.getenv("VALKYRIE_STORAGE_RECONCILE_SECONDS", "300"))
+
+
+def disk_usage(path: str) -> dict:
+    """statvfs in bytes; blocks are f_frsize bytes each, not a fixed 4 KiB."""
+    st = os.statvfs(path)
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    return {"total": total, "used": used, "free": free}
+
+
+class StorageMonitor:
+    def __init__(self, mount_path: Callable[[], str], user_data_dir: Callable[[], str],
+                 engine_factory: Callable):
+        self._mount_path = mount_path
+        self._user_data_dir = user_data_dir
+        self._engine_factory = engine_factory
+        self._lock = threading.Lock()
+        self._by_user = defaultdict(int)
+        self._by_project = defaultdict(int)
+        self._files = 0
+        self._bytes = 0
+        self._users = set()
+        self._disk = None
+        self._dedup = None
+        self._paths = None
+        self.reconciled_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # -- incremental updates (called on the request path, O(1)) --
+
+    def record_upload(self, user_id: str, size: int, project_id=None, replaced: Optional[dict] = None):
+        with self._lock:
+            if replaced is not None:
+                self._bytes -= replaced["size_bytes"]
+                self._by_user[user_id] -= replaced["size_bytes"]
+                if replaced.get("project_id") is not None:
+                    self._by_project[replaced["project_id"]] -= replaced["size_bytes"]
+            else:
+                self._files += 1
+            self._bytes += size
+            self._by_user[user_id] += size
+            if project_id is not None:
+                self._by_project[project_id] += size
+
+    def record_delete(self, user_id: str, removed: dict):
+        with self._lock:
+            self._files -= 1
+            self._bytes -= removed["size_bytes"]
+            self._by_user[user_id] -= removed["size_bytes"]
+            if removed.get("project_id") is not None:
+                self._by_project[removed["project_id"]] -= removed["size_bytes"]
+
+    def record_user(self, user_id: str):
+        with self._lock:
+            self._users.add(user_id)
+
+    # -- background refresh (never on the request path) --
+
+    def refresh_disk(self):
+        mount = self._mount_path()
+        usage = disk_usage(mount)
+        with self._lock:
+            self._paths = {"ssd_path": mount, "user_data_directory": self._user_data_dir()}
+            self._disk = usage
+
+    def reconcile(self):
+        """Full recount from the database and the user-data directory."""
+        self.refresh_disk()
+        user_dir = self._paths["user_data_directory"]
+        users = {d for d in os.listdir(user_dir) if os.path.isdir(os.path.join(user_dir, d))}
+        by_user, by_project, files = defaultdict(int), defaultdict(int), 0
+        with Session(self._engine_factory()) as db:
+            rows = db.execute(text("""
+                SELECT user_id, project_id, count(*) AS n, coalesce(sum(size_bytes), 0) AS bytes
+                FROM user_files GROUP BY user_id, project_id
+            """)).mappings().all()
+            dedup = dedup_stats(db)
+        for r in rows:
+            by_user[r["user_id"]] += int(r["bytes"])
+            if r["project_id"] is not None:
+                by_project[r["project_id"]] += int(r["bytes"])
+            files += int(r["n"])
+        with self._lock:
+            self._users = users
+            self._by_user, self._by_project, self._files = by_user, by_project, files
+            self._bytes = sum(by_user.values())
+            self._dedup = dedup
+            self.reconciled_at = time.time()
+
+    async def run(self):
+        last_reconcile = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_reconcile >= RECONCILE_SECONDS:
+                    await asyncio.to_thread(self.reconcile)
+                    last_reconcile = time.monotonic()
+                else:
+                    await asyncio.to_thread(self.refresh_disk)
+            except Exception as exc:
+                logger.warning("Storage monitor refresh failed: %s", exc)
+            await asyncio.sleep(DISK_REFRESH_SECONDS)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # -- reads --
+
+    @property
+    def ready(self) -> bool:
+        return self.reconciled_at is not None
+
+    @property
+    def has_disk(self) -> bool:
+        return self._disk is not None
+
+    @property
+    def stale(self) -> bool:
+        return self.reconciled_at is None or time.time() - self.reconciled_at > 2 * RECONCILE_SECONDS
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total, used, free = self._disk["total"], self._disk["used"], self._disk["free"]
+            return {
+                **self._paths,
+                "disk_usage": {
+                    "total_gb": round(total / 1024 ** 3, 2),
+                    "used_gb": round(used / 1024 ** 3, 2),
+                    "free_gb": round(free / 1024 ** 3, 2),
+                    "usage_percentage": round(used / total * 100, 2) if total else 0.0,
+                },
+                "user_count": len(self._users),
+                "file_count": self._files,
+                "stored_bytes": self._bytes,
+                "deduplication": self._dedup,
+                "reconciled_at": self.reconciled_at,
+                # file/user counts, stored bytes and dedup come from the last reconcile
+                "stale": self.stale,
+            }
+
+    def user_bytes(self, user_id: str) -> int:
+        with self._lock:
+            return self._by_user.get(user_id, 0)
+
+    def project_bytes(self, project_id) -> int:
+        with self._lock:
+            return self._by_project.get(project_id, 0)
@@ -0,0 +1,186 @@
+"""Streaming upload helpers.
+
+Uploads are copied chunk by chunk into a hidden temp file next to their final
+location while the SHA-256 is computed on the fly, then published with an
+atomic rename. Peak memory is one chunk regardless of file size, readers
+never observe a half-written file, and an upload that breaks the size limit
+or the connection leaves nothing behind.
+
+Multipart bodies are parsed straight off the request stream (`MultipartUpload`)
+rather than through UploadFile, which Starlette spools to disk in full before
+the endpoint even runs.
+"""
+import hashlib
+import os
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiofiles
+import aiofiles.os
+
+MAX_UPLOAD_BYTES = int(os.getenv("VALKYRIE_MAX_UPLOAD_BYTES", str(10 * 1024 ** 3)))
+# Total bytes of the non-file form fields that are kept in memory
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"upload exceeds {limit} bytes")
+        self.limit = limit
+
+
+class InvalidUpload(ValueError):
+    """Malformed multipart body (maps to 400)."""
+
+
+def safe_filename(filename: str) -> str:
+    """Strip any directory components a client put in the filename."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        raise ValueError("invalid filename")
+    return name
+
+
+class MultipartUpload:
+    """One file part and a few small fields from a multipart/form-data request.
+
+    `file_chunks()` feeds the body through python-multipart's push parser as
+    it arrives and yields the bytes of the `file_field` part; hand it to
+    stream_to_temp so hashing and the size limit apply chunk by chunk. The
+    rest of the body is read too, so `filename` and `fields` are complete
+    once the iterator is exhausted, whichever order the parts came in.
+    """
+
+    def __init__(self, request, file_field: str = "file", max_field_bytes: int = MAX_FIELD_BYTES):
+        try:
+            from python_multipart.multipart import MultipartParser, parse_options_header
+        except ImportError:  # python-multipart < 0.0.13
+            from multipart.multipart import MultipartParser, parse_options_header
+        self._parse_options_header = parse_options_header
+        content_type, options = parse_options_header(request.headers.get("content-type"))
+        boundary = options.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise InvalidUpload("expected a multipart/form-data body")
+        self.request = request
+        self.file_field = file_field
+        self.max_field_bytes = max_field_bytes
+        self.filename: Optional[str] = None
+        self.fields: Dict[str, str] = {}
+        self._field_bytes = 0
+        self._pending: List[bytes] = []
+        self._header_name = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._part: Optional[str] = None  # "file", a field name, or None to skip
+        self._value = bytearray()
+        self._complete = False
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_end": self._on_end,
+        })
+
+    # -- parser callbacks (synchronous, called from write()) --
+
+    def _on_part_begin(self):
+        self._headers, self._part = {}, None
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, options = self._parse_options_header(self._headers.get(b"content-disposition"))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name == self.file_field and b"filename" in options:
+            if self.filename is not None:
+                raise InvalidUpload(f"more than one {self.file_field!r} part")
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._part = "file"
+        elif name and b"filename" not in options:
+            self._part = name
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._part == "file":
+            self._pending.append(data[start:end])
+        elif self._part is not None:
+            self._field_bytes += end - start
+            if self._field_bytes > self.max_field_bytes:
+                raise InvalidUpload("form fields too large")
+            self._value += data[start:end]
+
+    def _on_part_end(self):
+        if self._part not in (None, "file"):
+            self.fields[self._part] = self._value.decode("utf-8", "replace")
+        self._part = None
+
+    def _on_end(self):
+        self._complete = True
+
+    async def file_chunks(self) -> AsyncIterator[bytes]:
+        async for chunk in self.request.stream():
+            if not chunk:
+                continue
+            try:
+                self._parser.write(chunk)
+            except InvalidUpload:
+                raise
+            except ValueError as exc:  # python-multipart's parse errors
+                raise InvalidUpload(str(exc)) from exc
+            for piece in self._pending:
+                yield piece
+            self._pending.clear()
+        self._parser.finalize()
+        if not self._complete:
+            raise InvalidUpload("truncated multipart body")
+        if self.filename is None:
+            raise InvalidUpload(f"missing {self.file_field!r} file part")
+
+
+async def stream_to_temp(chunks: AsyncIterator[bytes], directory: str, max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+    """Write chunks to a temp file in `directory`; returns temp path, size and sha256.
+
+    The caller publishes the temp file (see publish) or removes it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                await f.write(chunk)
+            await f.flush()
+    except BaseException:
+        await discard(tmp_path)
+        raise
+    return {"tmp_path": tmp_path, "size": size, "sha256": digest.hexdigest()}
+
+
+async def publish(tmp_path: str, final_path: str) -> str:
+    """Atomically move a finished temp file into place (same filesystem)."""
+    await aiofiles.os.replace(tmp_path, final_path)
+    return final_path
+
+
+async def discard(tmp_path: str):
+    try:
+        await aiofiles.os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,183 @@
+"""Approximate-nearest-neighbour indexes over chunks.embedding (pgvector).
+
+One partial index per project (`WHERE project_id = N`): a project's index
+stays proportional to its own chunk count, can be built, tuned and rebuilt
+on its own, and the planner only uses it for queries pinned to that project.
+Builds use CREATE INDEX CONCURRENTLY / REINDEX CONCURRENTLY so ingest keeps
+writing while they run; an interrupted concurrent build leaves an INVALID
+index behind, which create() drops and retries.
+
+Recall/latency trade-off per query: nearest_chunks() sets hnsw.ef_search
+or ivfflat.probes with SET LOCAL, so the knob only lives for that
+transaction (VALKYRIE_HNSW_EF_SEARCH / VALKYRIE_IVFFLAT_PROBES by default).
+"""
+import logging
+import math
+import os
+import threading
+import time
+from typing import List, Optional, Sequence
+
+from sqlalchemy import text
+
+logger = logging.getLogger("uvicorn.error")
+
+METHODS = ("hnsw", "ivfflat")
+DEFAULT_METHOD = os.getenv("VALKYRIE_VECTOR_INDEX", "hnsw")
+HNSW_M = int(os.getenv("VALKYRIE_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VALKYRIE_HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("VALKYRIE_HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("VALKYRIE_IVFFLAT_PROBES", "10"))
+# Below this many chunks an exact scan is fast enough and always exact
+MIN_INDEXED_CHUNKS = int(os.getenv("VALKYRIE_VECTOR_INDEX_MIN_CHUNKS", "20000"))
+BUILD_MEMORY = os.getenv("VALKYRIE_VECTOR_INDEX_BUILD_MEMORY", "1GB")
+
+
+def index_name(project_id: int, method: str) -> str:
+    if method not in METHODS:
+        raise ValueError(f"unknown vector index method {method!r}")
+    return f"ix_chunks_embedding_{method}_p{int(project_id)}"
+
+
+def ivfflat_lists(rows: int) -> int:
+    """pgvector's guidance: rows/1000 up to 1M rows, sqrt(rows) beyond."""
+    return max(1, rows // 1000 if rows <= 1_000_000 else int(math.sqrt(rows)))
+
+
+def _autocommit(engine):
+    # CONCURRENTLY cannot run inside a transaction block
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def list_indexes(engine) -> List[dict]:
+    with engine.connect() as con:
+        rows = con.execute(text("""
+            SELECT c.relname AS name, i.indisvalid AS valid,
+                   pg_relation_size(c.oid) AS size_bytes, pg_get_indexdef(c.oid) AS definition
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = 'chunks'::regclass AND c.relname LIKE 'ix_chunks_embedding_%'
+            ORDER BY c.relname
+        """)).mappings().all()
+    out = []
+    for r in rows:
+        method, _, project = r["name"].removeprefix("ix_chunks_embedding_").rpartition("_p")
+        out.append({**r, "method": method, "project_id": int(project) if project.isdigit() else None})
+    return out
+
+
+def create(engine, project_id: int, method: str = DEFAULT_METHOD, m: int = HNSW_M,
+           ef_construction: int = HNSW_EF_CONSTRUCTION, lists: Optional[int] = None) -> dict:
+    """Build (or finish building) the project's index without blocking writes."""
+    name = index_name(project_id, method)
+    project_id = int(project_id)
+    with _autocommit(engine) as con:
+        invalid = con.execute(text("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :n AND NOT i.indisvalid
+        """), {"n": name}).first()
+        if invalid:
+            logger.warning("Dropping invalid vector index %s left by an interrupted build", name)
+            con.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        if method == "hnsw":
+            options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+        else:
+            if lists is None:
+                rows = con.execute(text("SELECT count(*) FROM chunks WHERE project_id = :p"), {"p": project_id}).scalar()
+                lists = ivfflat_lists(rows)
+            options = f"lists = {int(lists)}"
+        con.execute(text(f"SET maintenance_work_mem = '{BUILD_MEMORY}'"))
+        started = time.monotonic()
+        con.execute(text(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+            ON chunks USING {method} (embedding vector_cosine_ops) WITH ({options})
+            WHERE project_id = {project_id}
+        """))
+        # A freshly bulk-loaded project is invisible to stale statistics and the
+        # planner would keep using ix_chunks_project_id + sort instead
+        con.execute(text("ANALYZE chunks"))
+    return {"index": name, "options": options, "seconds": round(time.monotonic() - started, 2)}
+
+
+def rebuild(engine, project_id: int, method: str = DEFAULT_METHOD) -> dict:
+    """REINDEX CONCURRENTLY, e.g. after IVFFlat centroids drifted from the data."""
+    name = index_name(project_id, method)
+    started = time.monotonic()
+    with _autocommit(engine) as con:
+        con.execute(text(f"SET maintenance_work_mem = '{BUILD_MEMORY}'"))
+        con.execute(text(f"REINDEX INDEX CONCURRENTLY {name}"))
+    return {"index": name, "seconds": round(time.monotonic() - started, 2)}
+
+
+def drop(engine, project_id: int, method: str = DEFAULT_METHOD):
+    with _autocommit(engine) as con:
+        con.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name(project_id, method)}"))
+
+
+def ensure(engine, method: str = DEFAULT_METHOD, min_chunks: int = MIN_INDEXED_CHUNKS) -> List[dict]:
+    """Index every project that has outgrown exact scans and has no valid index yet."""
+    existing = {(i["project_id"], i["method"]) for i in list_indexes(engine) if i["valid"]}
+    with engine.connect() as con:
+        projects = con.execute(text("""
+            SELECT project_id FROM chunks GROUP BY project_id HAVING count(*) >= :n
+        """), {"n": min_chunks}).scalars().all()
+    return [create(engine, p, method) for p in projects if (p, method) not in existing]
+
+
+class IndexBuilder:
+    """Runs one build at a time on a background thread and remembers the outcome."""
+
+    def __init__(self, engine_factory):
+        self._engine_factory = engine_factory
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status: dict = {"state": "idle"}
+
+    def start(self, project_id: int, method: str = DEFAULT_METHOD, rebuild_existing: bool = False) -> bool:
+        """False if a build is already running."""
+        index_name(project_id, method)  # validate before queuing
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = {"state": "building", "project_id": project_id, "method": method, "started_at": time.time()}
+            self._thread = threading.Thread(target=self._run, args=(project_id, method, rebuild_existing),
+                                            name="vector-index-build", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, project_id, method, rebuild_existing):
+        try:
+            engine = self._engine_factory()
+            result = rebuild(engine, project_id, method) if rebuild_existing else create(engine, project_id, method)
+            self.status = {**self.status, "state": "done", **result}
+        except Exception as exc:
+            logger.exception("Vector index build for project %s failed", project_id)
+            self.status = {**self.status, "state": "failed", "error": str(exc)}
+
+
+def nearest_chunks(con, project_id: int, vector: Sequence[float], k: int = 10, method: str = DEFAULT_METHOD,
+                   ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[dict]:
+    """Top-k chunks of one project by cosine distance, via the project's index.
+
+    Runs in the caller's transaction (SET LOCAL must not leak to pooled
+    connections). The project id is inlined as an integer literal: a bound
+    parameter would let a generic plan skip the partial index.
+    """
+    if method == "hnsw":
+        con.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search or max(HNSW_EF_SEARCH, k))}"))
+    else:
+        con.execute(text(f"SET LOCAL ivfflat.probes = {int(probes or IVFFLAT_PROBES)}"))
+    # numpy (via embeddings) loads on first query, not when the API imports this module
+    import numpy as np
+
+    from .embeddings import to_pgvector
+
+    literal = to_pgvector(np.asarray(vector, dtype=np.float32))
+    rows = con.execute(text(f"""
+        SELECT id, document_id, project_id, ord, embedding <=> CAST(:q AS vector) AS distance
+        FROM chunks
+        WHERE project_id = {int(project_id)}
+        ORDER BY embedding <=> CAST(:q AS vector)
+        LIMIT :k
+    """), {"q": literal, "k": int(k)}).mappings().all()
+    return [dict(r) for r in rows]
@@ -0,0 +1,26 @@
+"""add indexed key_id / key_digest lookup columns to api_keys
+
+Existing rows only hold a bcrypt hash, from which the raw key cannot be
+recovered, so their digest cannot be computed here and stays NULL. Such keys
+no longer authenticate; scripts/backfill_api_key_digests.py converts the ones
+whose raw key the operator still has, after which they are served by the
+unique index like any new `vk_` key.
+"""
+from alembic import op
+
+revision = "004_api_key_digest"
+down_revision = "003_api_keys"
+
+
+def upgrade():
+    op.execute("ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS key_id TEXT")
+    op.execute("ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS key_digest TEXT")
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_api_keys_key_digest ON api_keys (key_digest)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_api_keys_key_id ON api_keys (key_id)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_api_keys_key_id")
+    op.execute("DROP INDEX IF EXISTS ix_api_keys_key_digest")
+    op.execute("ALTER TABLE api_keys DROP COLUMN IF EXISTS key_digest")
+    op.execute("ALTER TABLE api_keys DROP COLUMN IF EXISTS key_id")
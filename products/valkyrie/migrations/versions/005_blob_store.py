@@ -0,0 +1,36 @@
+"""add content-addressed blob store tables (blobs, user_files)"""
+from alembic import op
+
+revision = "005_blob_store"
+down_revision = "004_api_key_digest"
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 CHAR(64) PRIMARY KEY,
+            size_bytes BIGINT NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+    """)
+    # gc() scans unreferenced blobs oldest-first
+    op.execute("CREATE INDEX IF NOT EXISTS ix_blobs_unreferenced ON blobs (updated_at) WHERE refcount <= 0")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS user_files (
+            id BIGSERIAL PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            sha256 CHAR(64) NOT NULL REFERENCES blobs (sha256),
+            size_bytes BIGINT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            UNIQUE (user_id, filename)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_user_files_sha256 ON user_files (sha256)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS user_files")
+    op.execute("DROP TABLE IF EXISTS blobs")
@@ -0,0 +1,15 @@
+"""add project_id to user_files for per-project storage accounting"""
+from alembic import op
+
+revision = "006_user_files_project"
+down_revision = "005_blob_store"
+
+
+def upgrade():
+    op.execute("ALTER TABLE user_files ADD COLUMN IF NOT EXISTS project_id INTEGER")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_user_files_project_id ON user_files (project_id)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_user_files_project_id")
+    op.execute("ALTER TABLE user_files DROP COLUMN IF EXISTS project_id")
@@ -0,0 +1,74 @@
+"""add ingest pipeline tables (ingest_jobs, chunks, entities, chunk_entities, relations)"""
+from alembic import op
+
+revision = "007_ingest_pipeline"
+down_revision = "006_user_files_project"
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS storage_path TEXT")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id BIGSERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            error TEXT,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            started_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE
+        )
+    """)
+    # ids are pre-allocated from chunks_id_seq so COPY batches can carry them
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS chunks (
+            id BIGSERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL,
+            project_id INTEGER NOT NULL,
+            ord INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            embedding vector(384),
+            tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', text)) STORED,
+            UNIQUE (document_id, ord)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_chunks_project_id ON chunks (project_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_chunks_tsv ON chunks USING gin (tsv)")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS entities (
+            id BIGSERIAL PRIMARY KEY,
+            project_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            label TEXT NOT NULL,
+            UNIQUE (project_id, name, label)
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_entities (
+            chunk_id BIGINT NOT NULL REFERENCES chunks (id) ON DELETE CASCADE,
+            entity_id BIGINT NOT NULL REFERENCES entities (id) ON DELETE CASCADE,
+            PRIMARY KEY (chunk_id, entity_id)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_chunk_entities_entity_id ON chunk_entities (entity_id)")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS relations (
+            id BIGSERIAL PRIMARY KEY,
+            project_id INTEGER NOT NULL,
+            source_entity_id BIGINT NOT NULL REFERENCES entities (id) ON DELETE CASCADE,
+            target_entity_id BIGINT NOT NULL REFERENCES entities (id) ON DELETE CASCADE,
+            kind TEXT NOT NULL,
+            chunk_id BIGINT REFERENCES chunks (id) ON DELETE CASCADE,
+            UNIQUE (source_entity_id, target_entity_id, kind, chunk_id)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_relations_project_id ON relations (project_id)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS relations")
+    op.execute("DROP TABLE IF EXISTS chunk_entities")
+    op.execute("DROP TABLE IF EXISTS entities")
+    op.execute("DROP TABLE IF EXISTS chunks")
+    op.execute("DROP TABLE IF EXISTS ingest_jobs")
+    op.execute("ALTER TABLE documents DROP COLUMN IF EXISTS storage_path")
@@ -0,0 +1,27 @@
+"""add chunks.content_hash for incremental re-ingest"""
+from alembic import op
+
+revision = "008_chunk_content_hash"
+down_revision = "007_ingest_pipeline"
+
+
+def upgrade():
+    op.execute("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_hash CHAR(64)")
+    op.execute("""
+        UPDATE chunks SET content_hash = encode(sha256(convert_to(text, 'UTF8')), 'hex')
+        WHERE content_hash IS NULL
+    """)
+    op.execute("ALTER TABLE chunks ALTER COLUMN content_hash SET NOT NULL")
+    # Re-ingest inserts new chunks and renumbers kept ones in one transaction,
+    # so positions may collide until commit
+    op.execute("ALTER TABLE chunks DROP CONSTRAINT IF EXISTS chunks_document_id_ord_key")
+    op.execute("""
+        ALTER TABLE chunks ADD CONSTRAINT chunks_document_id_ord_key
+        UNIQUE (document_id, ord) DEFERRABLE INITIALLY DEFERRED
+    """)
+
+
+def downgrade():
+    op.execute("ALTER TABLE chunks DROP CONSTRAINT IF EXISTS chunks_document_id_ord_key")
+    op.execute("ALTER TABLE chunks ADD CONSTRAINT chunks_document_id_ord_key UNIQUE (document_id, ord)")
+    op.execute("ALTER TABLE chunks DROP COLUMN IF EXISTS content_hash")
@@ -0,0 +1,22 @@
+"""add embedding_cache keyed on (model, text hash)"""
+from alembic import op
+
+revision = "009_embedding_cache"
+down_revision = "008_chunk_content_hash"
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model TEXT NOT NULL,
+            text_hash BYTEA NOT NULL,
+            dtype TEXT NOT NULL,
+            vector BYTEA NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (model, text_hash)
+        )
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS embedding_cache")
@@ -0,0 +1,13 @@
+"""index relations.chunk_id (ON DELETE CASCADE from chunks scans it)"""
+from alembic import op
+
+revision = "010_relations_chunk_index"
+down_revision = "009_embedding_cache"
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS ix_relations_chunk_id ON relations (chunk_id)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_relations_chunk_id")
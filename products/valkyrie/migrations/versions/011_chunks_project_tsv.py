@@ -0,0 +1,15 @@
+"""composite (project_id, tsv) GIN index for project-scoped keyword search"""
+from alembic import op
+
+revision = "011_chunks_project_tsv"
+down_revision = "010_relations_chunk_index"
+
+
+def upgrade():
+    # btree_gin lets one GIN index answer both the project filter and the tsquery
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_chunks_project_tsv ON chunks USING gin (project_id, tsv)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_chunks_project_tsv")
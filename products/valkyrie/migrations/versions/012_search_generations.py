@@ -0,0 +1,19 @@
+"""add search_generations (per-project index generation for the search cache)"""
+from alembic import op
+
+revision = "012_search_generations"
+down_revision = "011_chunks_project_tsv"
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS search_generations (
+            project_id INTEGER PRIMARY KEY,
+            generation BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS search_generations")
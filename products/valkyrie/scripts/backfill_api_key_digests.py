@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Give pre-digest API keys the indexed key_digest they need to authenticate.
+
+    python scripts/backfill_api_key_digests.py < legacy_keys.txt
+
+Keys minted before migration 004 are stored only as bcrypt hashes, so their
+digest cannot be derived from the database; the API rejects them rather than
+scanning bcrypt hashes per request. Feed this script the raw keys you still
+have, one per line: each is checked against the digest-less rows and, on a
+match, gets its key_id and key_digest. Prints one JSON line per key (the key
+itself is never printed).
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.api_keys import backfill_legacy_key  # noqa: E402
+from app.db import engine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("keys", nargs="?", type=argparse.FileType("r"), default=sys.stdin,
+                        help="file with one raw key per line (default: stdin)")
+    args = parser.parse_args()
+
+    missing = 0
+    with Session(engine) as db:
+        for line_no, line in enumerate(args.keys, 1):
+            raw_key = line.strip()
+            if not raw_key:
+                continue
+            row_id = backfill_legacy_key(db, raw_key)
+            db.commit()
+            missing += row_id is None
+            print(json.dumps({"line": line_no, "api_key_id": row_id}))
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
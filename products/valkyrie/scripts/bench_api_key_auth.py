@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Benchmark API-key authentication cost as the api_keys table grows.
+
+Uses an in-memory SQLite stand-in for Postgres so it runs anywhere the
+backend requirements are installed:
+
+    python scripts/bench_api_key_auth.py --sizes 10 1000 100000
+
+For every table size it reports:
+  indexed  - digest lookup through the unique index + one bcrypt verify
+             (what a cache miss in get_current_user costs)
+  cached   - principal cache hit (what every other request in the TTL costs)
+  scan     - the old bcrypt-every-row validation, only for sizes up to
+             --scan-max because it is linear in the number of keys
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from passlib.hash import bcrypt  # noqa: E402
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.api_keys import generate_api_key, hash_api_key, key_digest, resolve_api_key  # noqa: E402
+from app.cache import LRUTTLCache  # noqa: E402
+
+
+def build_table(db, size, probe_key):
+    db.execute(text("""
+        CREATE TABLE api_keys (
+            id TEXT PRIMARY KEY, project_id TEXT, key TEXT NOT NULL,
+            role TEXT NOT NULL, key_id TEXT, key_digest TEXT
+        )
+    """))
+    db.execute(text("CREATE UNIQUE INDEX ix_api_keys_key_digest ON api_keys (key_digest)"))
+    # Filler rows share one bcrypt hash: hashing 100k keys would take hours and
+    # the lookup never verifies them anyway.
+    filler_hash = bcrypt.hash("filler")
+    rows = [
+        {"id": f"k{i}", "key": filler_hash, "key_id": f"{i:012x}", "key_digest": key_digest(f"filler-{i}")}
+        for i in range(size - 1)
+    ]
+    rows.append({"id": "probe", **hash_api_key(probe_key)})
+    db.execute(text("""
+        INSERT INTO api_keys (id, project_id, key, role, key_id, key_digest)
+        VALUES (:id, NULL, :key, 'admin', :key_id, :key_digest)
+    """), rows)
+    db.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def bench_size(size, repeat, scan_max):
+    engine = create_engine("sqlite://")
+    _, probe_key = generate_api_key()
+    with Session(engine) as db:
+        build_table(db, size, probe_key)
+        assert resolve_api_key(db, probe_key) is not None
+
+        indexed = timed(lambda: resolve_api_key(db, probe_key), repeat)
+
+        cache = LRUTTLCache(max_entries=4096, ttl=30)
+        cache.set(key_digest(probe_key), {"role": "admin"})
+        cached = timed(lambda: cache.get(key_digest(probe_key)), repeat * 100)
+
+        scan = None
+        if size <= scan_max:
+            hashes = [r[0] for r in db.execute(text("SELECT key FROM api_keys")).all()]
+
+            def legacy_scan():
+                for h in hashes:
+                    if bcrypt.verify(probe_key, h):
+                        break
+
+            scan = timed(legacy_scan, 1)
+    return indexed, cached, scan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5, help="bcrypt-bound samples per size")
+    parser.add_argument("--scan-max", type=int, default=10, help="largest table to run the legacy scan on")
+    args = parser.parse_args()
+
+    print(f"{'keys':>8} | {'indexed p50/p99 ms':>20} | {'cached p50/p99 ms':>20} | {'legacy scan ms':>14}")
+    for size in args.sizes:
+        indexed, cached, scan = bench_size(size, args.repeat, args.scan_max)
+        scan_col = f"{scan[0]:.1f}" if scan else "skipped"
+        print(f"{size:>8} | {indexed[0]:>9.2f} / {indexed[1]:<8.2f} | {cached[0]:>9.4f} / {cached[1]:<8.4f} | {scan_col:>14}")
+
+
+if __name__ == "__main__":
+    main()
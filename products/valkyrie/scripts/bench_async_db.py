@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Requests/second and latency of /api/list: sync Session vs the async engine.
+
+    python scripts/bench_async_db.py --clients 500 --seconds 20
+
+Starts one uvicorn worker (a subprocess) serving two copies of the same
+keyset page query:
+
+  /sync/list   the pre-async implementation: sync Session from get_db, run in
+               FastAPI's threadpool (one blocking connection per request)
+  /api/list    the production router on get_async_db (db_async.py)
+
+then drives each with `--clients` concurrent keep-alive clients for
+`--seconds` and prints requests/s, p50/p99 latency and errors. Needs
+VALKYRIE_DATABASE_URL pointing at a database with a populated documents
+table (e.g. after scripts/seed_db.py).
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND)
+
+
+def build_app():
+    from fastapi import Depends, FastAPI
+    from sqlalchemy import text
+    from sqlalchemy.orm import Session
+
+    from app.db import get_db
+    from app.routers.list import _select, router
+
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.get("/sync/list")
+    def sync_list(limit: int = 50, db: Session = Depends(get_db)):
+        rows = db.execute(text(_select([]) + " LIMIT :limit"), {"limit": limit + 1}).mappings().all()
+        return {"rows": [dict(r) for r in rows[:limit]]}
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def drive(url: str, clients: int, seconds: float, limit: int) -> dict:
+    import httpx
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url, params={"limit": limit})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else float("nan")
+
+    return {"requests": len(latencies), "rps": len(latencies) / elapsed, "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99), "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--limit", type=int, default=50, help="rows per page")
+    parser.add_argument("--warmup", type=float, default=3)
+    args = parser.parse_args()
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench_async_db:build_app", "--factory", "--port", str(port),
+         "--log-level", "warning", "--no-access-log", "--app-dir", os.path.dirname(os.path.abspath(__file__))],
+        env={**os.environ, "PYTHONPATH": BACKEND + os.pathsep + os.environ.get("PYTHONPATH", "")},
+    )
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        print(f"{args.clients} clients, {args.seconds:.0f}s per endpoint, {args.limit} rows per page")
+        print(f"{'endpoint':12} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for path in ("/sync/list", "/api/list"):
+            url = f"http://127.0.0.1:{port}{path}"
+            asyncio.run(drive(url, args.clients, args.warmup, args.limit))
+            r = asyncio.run(drive(url, args.clients, args.seconds, args.limit))
+            print(f"{path:12} {r['requests']:>9} {r['rps']:>8.0f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+                  f"{r['errors']:>7}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Queries/second of the embedding service with and without micro-batching.
+
+    python scripts/bench_embedding_service.py --clients 64 --queries 4000 --call-ms 4
+
+`--clients` coroutines issue `await embedding_service.embed(q)` back to
+back. Each model call costs a fixed `--call-ms` on top of the per-text work,
+like a forward pass through a real encoder; batching amortises that cost
+over every request that arrives within the window. `--repeat` is the share
+of queries drawn from a small pool of popular strings, which the LRU serves
+without reaching the model at all. Pass `--database-url` to include the
+persistent embedding_cache tier.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from app.embedding_service import EmbeddingService  # noqa: E402
+from app.embeddings import embed_texts  # noqa: E402
+
+
+def make_queries(args):
+    rng = random.Random(11)
+    words = [f"w{i}" for i in range(5000)]
+    popular = [" ".join(rng.choices(words, k=4)) for _ in range(50)]
+    return [
+        rng.choice(popular) if rng.random() < args.repeat else " ".join(rng.choices(words, k=rng.randint(2, 8)))
+        for _ in range(args.queries)
+    ]
+
+
+async def run(args, queries, batch_window, max_batch):
+    def model(texts):
+        time.sleep(args.call_ms / 1000)
+        return embed_texts(texts)
+
+    engine_factory = None
+    if args.database_url:
+        from sqlalchemy import create_engine
+        engine = create_engine(args.database_url)
+        engine_factory = lambda: engine  # noqa: E731
+    # A fresh model name per run so the persistent tier starts cold each time
+    service = EmbeddingService(embed_fn=model, model=f"bench-{uuid.uuid4().hex[:8]}", engine_factory=engine_factory,
+                               batch_window=batch_window, max_batch=max_batch)
+    pending = iter(queries)
+
+    async def client():
+        for q in pending:
+            await service.embed(q)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    await service.close()
+    return len(queries) / elapsed, service.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=4000)
+    parser.add_argument("--call-ms", type=float, default=4.0)
+    parser.add_argument("--repeat", type=float, default=0.3)
+    parser.add_argument("--window-ms", type=float, default=3.0)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    queries = make_queries(args)
+
+    for label, window, max_batch in (("unbatched", 0.0, 1), ("batched", args.window_ms / 1000, 128)):
+        qps, stats = asyncio.run(run(args, queries, window, max_batch))
+        print(f"{label:>10}: {qps:9.0f} queries/s  batches={stats['batches']:5d}  "
+              f"computed={stats['computed']:5d}  lru hit rate={stats['memory']['hit_rate']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Entities/second of graph sync, per-row writes vs batched UNWIND/pipelines.
+
+    python scripts/bench_graph_sync.py --entities 20000 --degree 4 --rtt-ms 0.5
+
+Runs GraphWriter against in-process stand-ins for Neo4j and Redis. Each
+stand-in charges `--rtt-ms` per round trip (one statement / one pipeline
+execute) plus `--row-us` per row it applies, and really stores what it is
+sent, so both modes are checked to produce the same graph. `--batch 1` is
+the old one-MERGE-per-entity behaviour; compare it with the default batch.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from app.graph_sync import GraphWriter, Neo4jGraphWriter, RedisGraphWriter  # noqa: E402
+
+
+class Latency:
+    def __init__(self, rtt_ms, row_us):
+        self.rtt = rtt_ms / 1000
+        self.row = row_us / 1_000_000
+        self.round_trips = 0
+
+    def charge(self, rows):
+        self.round_trips += 1
+        time.sleep(self.rtt + rows * self.row)
+
+
+class FakeNeo4jDriver:
+    """Applies the writer's UNWIND statements to dicts (nodes, relationships)."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.nodes = {}
+        self.rels = {}
+
+    def session(self, database=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute_write(self, fn):
+        return fn(self)
+
+    def run(self, query, project_id=None, rows=(), **params):
+        self.latency.charge(len(rows))
+        for row in rows:
+            if "row.label" in query:
+                self.nodes[(project_id, row["name"])] = row["label"]
+            else:
+                a, b = sorted((row["source"], row["target"]))
+                self.rels[(project_id, a, b, row["kind"])] = row["weight"]
+        return self
+
+    def consume(self):
+        pass
+
+
+class FakeRedis:
+    def __init__(self, latency):
+        self.latency = latency
+        self.hashes = {}
+        self.zsets = {}
+        self._commands = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hset(self, key, mapping):
+        self.latency.charge(len(mapping))
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def zadd(self, key, mapping):
+        self._commands.append((key, mapping))
+
+    def execute(self):
+        self.latency.charge(sum(len(m) for _, m in self._commands))
+        for key, mapping in self._commands:
+            self.zsets.setdefault(key, {}).update(mapping)
+        self._commands = []
+
+
+def make_graph(args):
+    rng = random.Random(7)
+    labels = ["PERSON", "ORG", "GPE", "PRODUCT", "EVENT"]
+    entities = [(f"entity-{i}", rng.choice(labels)) for i in range(args.entities)]
+    relations = {}
+    for i in range(args.entities):
+        for _ in range(args.degree // 2):
+            j = rng.randrange(args.entities)
+            if j != i:
+                a, b = sorted((entities[i][0], entities[j][0]))
+                relations[(a, b)] = relations.get((a, b), 0) + 1
+    return entities, [(a, b, "co_occurs", w) for (a, b), w in relations.items()]
+
+
+def run(backend, latency, entities, relations, batch):
+    writer = GraphWriter(backend, project_id=1, batch_size=batch)
+    started = time.perf_counter()
+    with writer:
+        for name, label in entities:
+            writer.add_entity(name, label)
+        writer.flush()
+        for source, target, kind, weight in relations:
+            writer.add_relation(source, target, kind, weight)
+    elapsed = time.perf_counter() - started
+    return elapsed, latency.round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=20000)
+    parser.add_argument("--degree", type=int, default=4, help="average relations per entity")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 2000])
+    parser.add_argument("--rtt-ms", type=float, default=0.5)
+    parser.add_argument("--row-us", type=float, default=2.0)
+    args = parser.parse_args()
+
+    entities, relations = make_graph(args)
+    print(f"{len(entities)} entities, {len(relations)} relations, rtt {args.rtt_ms} ms, {args.row_us} us/row")
+    print(f"{'backend':8} {'batch':>6} {'seconds':>8} {'round trips':>12} {'entities/s':>11} {'rows/s':>9}")
+    for name in ("neo4j", "redis"):
+        stored = None
+        for batch in args.batch:
+            latency = Latency(args.rtt_ms, args.row_us)
+            if name == "neo4j":
+                driver = FakeNeo4jDriver(latency)
+                backend = Neo4jGraphWriter(driver)
+                backend._schema_ready = True
+            else:
+                driver = FakeRedis(latency)
+                backend = RedisGraphWriter(driver)
+            elapsed, trips = run(backend, latency, entities, relations, batch)
+            graph = (driver.nodes, driver.rels) if name == "neo4j" else (driver.hashes, driver.zsets)
+            assert stored is None or graph == stored, "batched and per-row sync disagree"
+            stored = graph
+            rows = len(entities) + len(relations)
+            print(f"{name:8} {batch:>6} {elapsed:>8.2f} {trips:>12} {len(entities) / elapsed:>11.0f} "
+                  f"{rows / elapsed:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Re-ingest after a small edit: full ingest vs incremental (chunk content hashes).
+
+    python scripts/bench_reingest.py --paragraphs 4000 --project-id 2
+
+Needs the API database at the migrations head (chunks.content_hash, pgvector)
+and the NER/embedding models the worker loads. Writes a synthetic document,
+ingests it once (every chunk goes through NER and embedding), then edits one
+paragraph, inserts one and deletes three, and ingests again: only the chunks
+around the edits should be processed, the rest keep their rows. Prints one
+JSON line per run and checks that the stored chunks equal a fresh chunking
+of the edited file. The benchmark document is deleted afterwards unless
+--keep is given.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import text  # noqa: E402
+
+from app import ingest_pipeline  # noqa: E402
+from app.db import engine  # noqa: E402
+
+WORDS = ["alpha", "beta", "Apollo", "Zephyr", "reactor", "Berlin", "Acme", "data", "graph", "the", "of", "and"]
+
+
+def run(label, path, document_id, project_id):
+    started = time.perf_counter()
+    result = ingest_pipeline.ingest_document(path, document_id, project_id, lambda stages: None)
+    print(json.dumps({
+        "run": label,
+        "seconds": round(time.perf_counter() - started, 2),
+        "chunks_processed": result["chunks"],
+        "chunks_reused": result["chunks_reused"],
+        "chunks_deleted": result["chunks_deleted"],
+        "chunks_moved": result["chunks_moved"],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=4000)
+    parser.add_argument("--project-id", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="leave the benchmark document in the database")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    paras = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))) + "."
+             for _ in range(args.paragraphs)]
+    fd, path = tempfile.mkstemp(prefix="valkyrie-reingest-", suffix=".txt")
+    os.close(fd)
+
+    def write(paragraphs):
+        with open(path, "w") as f:
+            f.write("\n\n".join(paragraphs))
+
+    with engine.begin() as con:
+        document_id = con.execute(text("""
+            INSERT INTO documents (filename, project_id, storage_path)
+            VALUES ('bench-reingest.txt', :p, :s) RETURNING id
+        """), {"p": args.project_id, "s": path}).scalar()
+    try:
+        write(paras)
+        run("initial", path, document_id, args.project_id)
+
+        edited = list(paras)
+        edited[len(edited) // 40] = "Edited paragraph about Berlin."
+        edited.insert(len(edited) // 2, "A brand new Zephyr paragraph.")
+        del edited[3 * len(edited) // 4:3 * len(edited) // 4 + 3]
+        write(edited)
+        run("edited", path, document_id, args.project_id)
+        run("unchanged", path, document_id, args.project_id)
+
+        with engine.connect() as con:
+            stored = con.execute(text("SELECT text FROM chunks WHERE document_id = :d ORDER BY ord"),
+                                 {"d": document_id}).scalars().all()
+        expected = [c["text"] for c in ingest_pipeline.chunk_blocks(ingest_pipeline.extract_blocks(path))]
+        print(json.dumps({"chunks": len(stored), "matches_fresh_chunking": stored == expected}))
+        if stored != expected:
+            sys.exit(1)
+    finally:
+        os.remove(path)
+        if not args.keep:
+            with engine.begin() as con:
+                con.execute(text("DELETE FROM chunks WHERE document_id = :d"), {"d": document_id})
+                con.execute(text("DELETE FROM documents WHERE id = :d"), {"d": document_id})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Recall@k and latency of pgvector ANN indexes against exact NumPy search.
+
+    python scripts/bench_vector_recall.py --rows 200000 --queries 200 --k 10 \\
+        --method hnsw --ef-search 20,40,100,200
+
+Loads `--rows` synthetic vectors into chunks under a scratch
+project (COPY), builds that project's index with vector_index.create(), and
+for every ef_search (HNSW) or probes (IVFFlat) value runs the same queries
+through nearest_chunks(). Ground truth is a brute-force cosine top-k in
+NumPy over the same vectors. Reports recall@k and p50/p99 latency, plus
+the exact (index-less) scan for reference. The scratch rows are deleted
+afterwards unless --keep is given.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from app import vector_index  # noqa: E402
+from app.db import engine  # noqa: E402
+from app.embeddings import EMBED_DIM, to_pgvector  # noqa: E402
+
+
+def synthetic(rows, dim, latent_dim, seed):
+    """Unit vectors on a noisy low-dimensional subspace, like real text embeddings."""
+    basis = np.random.default_rng(0).normal(size=(latent_dim, dim)).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    data = rng.normal(size=(rows, latent_dim)).astype(np.float32) @ basis
+    data += 0.1 * np.sqrt(latent_dim) * rng.normal(size=(rows, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def load(project, data):
+    con = engine.raw_connection()
+    try:
+        with con.cursor() as cur:
+            cur.execute("DELETE FROM chunks WHERE project_id = %s", (project,))
+            cur.execute("SELECT coalesce(max(document_id), 0) + 1 FROM chunks")
+            doc = cur.fetchone()[0]
+            with cur.copy("COPY chunks (document_id, project_id, ord, text, content_hash, embedding) FROM STDIN") as cp:
+                for i, v in enumerate(data):
+                    cp.write_row((doc, project, i, "", "0" * 64, to_pgvector(v)))
+            cur.execute("SELECT id FROM chunks WHERE project_id = %s ORDER BY ord", (project,))
+            ids = np.array([r[0] for r in cur.fetchall()])
+        con.commit()
+        return ids
+    finally:
+        con.close()
+
+
+def run(project, queries, ids, truth, k, method, **knob):
+    latencies, recalls = [], []
+    with engine.connect() as con:
+        for q, expected in zip(queries, truth):
+            with con.begin():
+                start = time.perf_counter()
+                rows = vector_index.nearest_chunks(con, project, q, k=k, method=method, **knob)
+                latencies.append(time.perf_counter() - start)
+            recalls.append(len({r["id"] for r in rows} & set(ids[expected])) / k)
+    lat = np.array(latencies) * 1000
+    return float(np.mean(recalls)), float(np.percentile(lat, 50)), float(np.percentile(lat, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--latent-dim", type=int, default=32)
+    parser.add_argument("--method", choices=vector_index.METHODS, default="hnsw")
+    parser.add_argument("--ef-search", default="10,20,40,100,200", help="HNSW values to sweep")
+    parser.add_argument("--probes", default="1,5,10,20,50", help="IVFFlat values to sweep")
+    parser.add_argument("--project", type=int, default=999_999, help="scratch project id")
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    data = synthetic(args.rows, EMBED_DIM, args.latent_dim, seed=1)
+    queries = synthetic(args.queries, EMBED_DIM, args.latent_dim, seed=2)
+    print(f"loading {args.rows} vectors ...")
+    ids = load(args.project, data)
+    start = time.perf_counter()
+    scores = queries @ data.T
+    truth = np.argsort(-scores, axis=1)[:, :args.k]
+    print(f"numpy brute force: {(time.perf_counter() - start) / args.queries * 1000:.2f} ms/query")
+
+    try:
+        vector_index.drop(engine, args.project, args.method)
+        recall, p50, p99 = run(args.project, queries, ids, truth, args.k, args.method)
+        print(f"exact scan         recall@{args.k}={recall:.3f}  p50={p50:7.2f} ms  p99={p99:7.2f} ms")
+        built = vector_index.create(engine, args.project, args.method)
+        print(f"built {built['index']} ({built['options']}) in {built['seconds']} s")
+        knob = "ef_search" if args.method == "hnsw" else "probes"
+        for value in (args.ef_search if args.method == "hnsw" else args.probes).split(","):
+            recall, p50, p99 = run(args.project, queries, ids, truth, args.k, args.method, **{knob: int(value)})
+            print(f"{knob}={int(value):<5}       recall@{args.k}={recall:.3f}  p50={p50:7.2f} ms  p99={p99:7.2f} ms")
+    finally:
+        if not args.keep:
+            vector_index.drop(engine, args.project, args.method)
+            with engine.begin() as con:
+                con.exec_driver_sql("DELETE FROM chunks WHERE project_id = %s", (args.project,))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Load test for the /ws/events fan-out with simulated sockets.
+
+    python scripts/bench_ws_fanout.py --sockets 5000 --events 200 --slow 0.01
+
+Fake sockets stand in for WebSocket connections: `send_text` awaits a small
+network delay, and a fraction of them (`--slow`) take far longer, like a
+client on a bad link. Delivery latency is measured from publish to the
+moment a healthy client's send completes and reported as p50/p99, for the
+per-connection queue broadcaster and for the old sequential loop.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from app.events import EventBroadcaster  # noqa: E402
+
+
+class FakeSocket:
+    def __init__(self, delay, slow):
+        self.delay = delay
+        self.slow = slow
+        self.latencies = []
+
+    async def send_text(self, payload):
+        await asyncio.sleep(self.delay)
+        if not self.slow:
+            self.latencies.append(time.perf_counter() - json.loads(payload)["ts"])
+
+    async def send_json(self, event):
+        await self.send_text(json.dumps(event))
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000 if samples else float("nan")
+
+
+def make_sockets(args):
+    rng = random.Random(7)
+    return [
+        FakeSocket(args.slow_delay, True) if rng.random() < args.slow else FakeSocket(args.delay, False)
+        for _ in range(args.sockets)
+    ]
+
+
+async def run_queued(args):
+    broadcaster = EventBroadcaster(max_queue=args.queue)
+    sockets = make_sockets(args)
+    subs = [broadcaster.subscribe(ws, [i % args.projects]) for i, ws in enumerate(sockets)]
+    t0 = time.perf_counter()
+    for n in range(args.events):
+        broadcaster.publish({"type": "ingest", "project_id": n % args.projects, "seq": n, "ts": time.perf_counter()})
+        await asyncio.sleep(args.interval)
+    # let healthy clients drain
+    while any(s.depth for s, ws in zip(subs, sockets) if not ws.slow):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    stats = broadcaster.stats()
+    await broadcaster.close()
+    return sockets, elapsed, stats
+
+
+async def run_sequential(args):
+    """The previous broadcast_event: await send_json on each socket in turn."""
+    sockets = make_sockets(args)
+    t0 = time.perf_counter()
+    for n in range(args.events):
+        event = {"type": "ingest", "project_id": n % args.projects, "seq": n, "ts": time.perf_counter()}
+        for ws in sockets:
+            await ws.send_json(event)
+        await asyncio.sleep(args.interval)
+    return sockets, time.perf_counter() - t0, {}
+
+
+def report(name, sockets, elapsed, stats):
+    lat = [x for ws in sockets for x in ws.latencies]
+    print(f"{name:>10}: delivered={len(lat):>8} p50={percentile(lat, 50):8.2f}ms "
+          f"p99={percentile(lat, 99):8.2f}ms wall={elapsed:6.2f}s {json.dumps(stats) if stats else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--projects", type=int, default=1, help="spread sockets/events over N project topics")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between published events")
+    parser.add_argument("--delay", type=float, default=0.0005, help="send latency of a healthy client")
+    parser.add_argument("--slow", type=float, default=0.01, help="fraction of slow clients")
+    parser.add_argument("--slow-delay", type=float, default=0.25, help="send latency of a slow client")
+    parser.add_argument("--queue", type=int, default=256)
+    parser.add_argument("--sequential-events", type=int, default=3,
+                        help="events for the sequential baseline (it is very slow)")
+    args = parser.parse_args()
+
+    report("queued", *asyncio.run(run_queued(args)))
+    args.events = args.sequential_events
+    report("sequential", *asyncio.run(run_sequential(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Delete unreferenced blobs from the content-addressed upload store.
+
+    python scripts/blob_gc.py [--grace-seconds 3600] [--limit 1000]
+
+Safe to run on a schedule (cron / systemd timer) next to a live API: it only
+removes blobs whose refcount dropped to zero more than --grace-seconds ago
+and uses row locks so it never races an upload of the same content.
+Blob files with no `blobs` row (an upload that crashed or failed to commit
+after moving its file into place) are registered as unreferenced first, so
+they go through the same grace period and locking.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.blobstore import GC_GRACE_SECONDS, gc, register_orphans  # noqa: E402
+from app.db import engine  # noqa: E402
+from app.routers.users import get_blob_store  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grace-seconds", type=int, default=GC_GRACE_SECONDS)
+    parser.add_argument("--limit", type=int, default=1000, help="blobs per batch")
+    args = parser.parse_args()
+
+    store = get_blob_store()
+    total = {"deleted_blobs": 0, "bytes_freed": 0}
+    with Session(engine) as db:
+        total.update(register_orphans(db, store, grace_seconds=args.grace_seconds))
+        while True:
+            result = gc(db, store, grace_seconds=args.grace_seconds, limit=args.limit)
+            total["deleted_blobs"] += result["deleted_blobs"]
+            total["bytes_freed"] += result["bytes_freed"]
+            if result["deleted_blobs"] < args.limit:
+                break
+    print(json.dumps(total))
+
+
+if __name__ == "__main__":
+    main()
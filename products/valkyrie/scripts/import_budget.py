@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Cold-start import report for the API process, checked against a budget.
+
+    python scripts/import_budget.py --budget-ms 1500 --runs 5
+
+Runs `python -X importtime -c "import app.main"` in fresh interpreters,
+keeps the fastest run (the least disturbed by the rest of the machine), and
+prints the slowest modules, the cost per top-level package, and what
+app.main pulls in directly. Exits 1 when:
+
+  * the total exceeds --budget-ms, or
+  * a module listed in --forbid is imported at startup. Those belong to
+    subsystems that load on first use (or at VALKYRIE_WARMUP), so one of
+    them showing up means an eager import crept back in.
+
+Budgets are machine-specific: record the number on the target hardware
+(e.g. the Raspberry Pi) and pass it explicitly there.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+DEFAULT_FORBID = ["numpy", "spacy", "neo4j", "pgvector", "redis", "app.embeddings", "app.embedding_service",
+                  "app.ingest_pipeline", "app.graph_sync"]
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure(module: str) -> list:
+    env = {**os.environ, "PYTHONPATH": BACKEND + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        sys.exit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            rows.append({"self_us": int(m.group(1)), "cumulative_us": int(m.group(2)),
+                         "depth": len(m.group(3)) // 2, "module": m.group(4)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("VALKYRIE_IMPORT_BUDGET_MS", "1500")))
+    parser.add_argument("--forbid", nargs="*", default=DEFAULT_FORBID,
+                        help="modules (or packages) that must not load at startup")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    rows = min(runs, key=lambda r: sum(x["self_us"] for x in r))
+    total_ms = sum(r["self_us"] for r in rows) / 1000
+    per_package = defaultdict(int)
+    for r in rows:
+        per_package[r["module"].split(".")[0]] += r["self_us"]
+
+    print(f"import {args.module}: {total_ms:.0f} ms (best of {args.runs}), {len(rows)} modules, "
+          f"budget {args.budget_ms:.0f} ms")
+    print("\nslowest modules (self time)")
+    for r in sorted(rows, key=lambda r: -r["self_us"])[:args.top]:
+        print(f"  {r['self_us'] / 1000:8.1f} ms  {r['module']}")
+    print("\nper top-level package")
+    for package, us in sorted(per_package.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {package}")
+    root_depth = next((r["depth"] for r in rows if r["module"] == args.module), 0)
+    print(f"\nimported directly by {args.module} (cumulative)")
+    direct = [r for r in rows if r["depth"] == root_depth + 1]
+    for r in sorted(direct, key=lambda r: -r["cumulative_us"])[:args.top]:
+        print(f"  {r['cumulative_us'] / 1000:8.1f} ms  {r['module']}")
+
+    loaded = {r["module"] for r in rows}
+    offenders = sorted(m for m in loaded for f in args.forbid if m == f or m.startswith(f + "."))
+    failed = False
+    if offenders:
+        roots = sorted({m for m in offenders if not any(m.startswith(o + ".") for o in offenders)})
+        print(f"\nFAIL: imported at startup but should load lazily: {', '.join(roots)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\nFAIL: {total_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print("\nOK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""Reproducible load test of the API, with a JSON report and a baseline check.
+
+    python scripts/loadtest.py run --documents 100000 --users 1000 \\
+        --concurrency 50 --seconds 20 --out loadtest.json
+    python scripts/loadtest.py run ... --baseline loadtest-baseline.json
+    python scripts/loadtest.py compare loadtest-baseline.json loadtest.json
+
+`run`:
+
+  1. seeds synthetic users, projects and documents (app/seeding.py; the
+     same deterministic fixtures as scripts/seed_fixtures.py, so re-runs only
+     load what is missing) into --database-url: a local Postgres, or an
+     SQLite file as a stand-in (no search there: it needs tsvector/pgvector);
+  2. starts `uvicorn app.main:app` (--workers) against that database;
+  3. drives each scenario for --warmup + --seconds with --concurrency
+     clients, each authenticating as a different fixture user:
+
+       list      GET /api/list, following next_cursor up to --list-pages deep
+       search    GET /api/search/?q=... over a fixed word list, scoped to
+                 one of the client's projects (project_id)
+       upload    multipart POST /api/upload-file/{user_id}, --upload-kb of
+                 random bytes per file, into one of the client's projects
+       download  GET /api/files/{user_id}/{filename} for the files the same
+                 user uploaded
+       archive   POST /api/files/{user_id}/archive, a zip of up to
+                 --archive-files of those files
+       ws        --concurrency /ws/events connections opened at once, held
+                 for --seconds (handshake latency; RSS with them open)
+
+  4. writes a report: per scenario requests, errors, requests/s, p50/p95/p99
+     latency (ms) and the server's peak RSS (all uvicorn processes, sampled
+     from /proc), plus the run parameters and git revision.
+
+`compare` flags a scenario when requests/s drops, or p50/p95/p99 or peak RSS
+grows, by more than --tolerance (fraction; latency changes under --min-ms
+are ignored as noise), or when its error rate goes up. It exits 1 if
+anything regressed, so CI can run it against a stored baseline.
+
+Load generator and server share the machine: compare reports taken on the
+same hardware with the same parameters only.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+SCENARIOS = ("list", "search", "upload", "download", "archive", "ws")
+SEARCH_TERMS = ("report", "budget", "apollo", "contract", "meeting notes", "quarterly revenue", "zephyr",
+                "security review", "roadmap", "invoice")
+# (report key, higher is better)
+COMPARED = (("rps", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("rss_mb_peak", False))
+
+
+# ------------------------------------------------------------------ setup ---
+
+def seed(database_url: str, users: int, projects: int, documents: int) -> dict:
+    os.environ["VALKYRIE_DATABASE_URL"] = database_url
+    sys.path.insert(0, BACKEND)
+    from sqlalchemy import text
+
+    import app.models  # noqa: F401  (registers the tables on Base.metadata)
+    from app.db import Base, engine
+    from app.seeding import SEED_LOCK_KEY, bootstrap, seed_fixtures
+
+    bootstrap(engine, Base.metadata)
+    with engine.begin() as con:
+        if con.dialect.name == "postgresql":
+            con.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": SEED_LOCK_KEY})
+        loaded = seed_fixtures(con, users=users, projects=projects, documents=documents)
+        # Fixture user n authenticates with fixture-key-n; clients need its id and projects
+        user_ids, memberships = {}, {}
+        for key, user_id, project_id in con.execute(text("""
+            SELECT u.api_key, u.id, pm.project_id FROM users u
+            LEFT JOIN project_membership pm ON pm.user_id = u.id
+            WHERE u.api_key LIKE 'fixture-key-%' ORDER BY u.id, pm.project_id
+        """)):
+            n = int(key.rsplit("-", 1)[1])
+            user_ids[n] = user_id
+            if project_id is not None:
+                memberships.setdefault(n, []).append(project_id)
+    engine.dispose()
+    return {"loaded": loaded, "user_ids": user_ids, "memberships": memberships}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database_url: str, port: int, workers: int) -> subprocess.Popen:
+    env = {**os.environ, "VALKYRIE_DATABASE_URL": database_url,
+           "PYTHONPATH": BACKEND + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"], cwd=BACKEND, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"server exited with {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    sys.exit("server did not start within 60s")
+
+
+def _children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_mb(pid: int) -> float:
+    """Resident memory of `pid` and its descendants (uvicorn workers), from /proc."""
+    total, pending = 0, [pid]
+    while pending:
+        p = pending.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                total += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+        except OSError:
+            continue
+        pending += _children(p)
+    return round(total / 1024, 1)
+
+
+class RssSampler:
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, rss_mb(self.pid))
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self.peak = max(self.peak, rss_mb(self.pid))
+
+
+# -------------------------------------------------------------- scenarios ---
+
+def percentile(sorted_values: list, p: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list (None when empty)."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values), max(1, math.ceil(p * len(sorted_values)))) - 1]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    out = {"requests": len(latencies), "errors": errors,
+           "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0}
+    for key, p in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        value = percentile(latencies, p)
+        out[key] = round(value * 1000, 2) if value is not None else None
+    return out
+
+
+def _cell(value, width: int = 8) -> str:
+    return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+
+async def drive(base: str, clients: int, seconds: float, make_request) -> dict:
+    """Run make_request(client, worker_index, state) in `clients` loops for `seconds`."""
+    import httpx
+
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + seconds
+
+        async def worker(i):
+            nonlocal errors
+            state = {}
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    ok = await make_request(client, i, state)
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed)
+
+
+def _headers(args, i: int) -> dict:
+    return {"X-API-Key": f"fixture-key-{i % args.users}"}
+
+
+def make_scenarios(args, user_ids: dict, memberships: dict, uploaded: dict) -> dict:
+    """Request functions per scenario; `uploaded` collects filenames per fixture user for download/archive."""
+    rng = random.Random(args.seed)
+    payload = rng.randbytes(args.upload_kb * 1024)
+    upload_seq = itertools.count(1)
+
+    def project_of(i, n):
+        projects = memberships.get(i % args.users)
+        return projects[n % len(projects)] if projects else None
+
+    async def list_page(client, i, state):
+        params = {"limit": args.page_size}
+        if state.get("cursor") and state.get("pages", 0) < args.list_pages:
+            params["cursor"] = state["cursor"]
+        else:
+            state["pages"] = 0
+        r = await client.get("/api/list", params=params, headers=_headers(args, i))
+        if r.status_code != 200:
+            return False
+        state["cursor"], state["pages"] = r.json().get("next_cursor"), state["pages"] + 1
+        return True
+
+    async def search(client, i, state):
+        n = state.setdefault("n", 0)
+        state["n"] += 1
+        params = {"q": SEARCH_TERMS[(i + n) % len(SEARCH_TERMS)], "limit": 20}
+        project_id = project_of(i, n)
+        if project_id is not None:
+            params["project_id"] = project_id
+        r = await client.get("/api/search/", params=params, headers=_headers(args, i))
+        return r.status_code == 200
+
+    async def upload(client, i, state):
+        # Unique across the warmup and measured drives, so every request stores a new file
+        n = next(upload_seq)
+        filename = f"loadtest-{i}-{n}.bin"
+        project_id = project_of(i, n)
+        data = {"project_id": str(project_id)} if project_id is not None else {}
+        files = {"file": (filename, payload, "application/octet-stream")}
+        r = await client.post(f"/api/upload-file/{user_ids[i % args.users]}", data=data, files=files,
+                              headers=_headers(args, i))
+        if r.status_code != 200:
+            return False
+        uploaded.setdefault(i % args.users, []).append(filename)
+        return True
+
+    async def _drain(r) -> bool:
+        async for _ in r.aiter_bytes():
+            pass
+        return r.status_code == 200
+
+    async def download(client, i, state):
+        names = uploaded.get(i % args.users)
+        if not names:
+            return False
+        filename = names[state.setdefault("n", 0) % len(names)]
+        state["n"] += 1
+        async with client.stream("GET", f"/api/files/{user_ids[i % args.users]}/{filename}",
+                                 headers=_headers(args, i)) as r:
+            return await _drain(r)
+
+    async def archive(client, i, state):
+        names = uploaded.get(i % args.users)
+        if not names:
+            return False
+        start = state.setdefault("n", 0) % len(names)
+        state["n"] += 1
+        picked = (names[start:] + names[:start])[:args.archive_files]
+        async with client.stream("POST", f"/api/files/{user_ids[i % args.users]}/archive",
+                                 json={"filenames": picked}, headers=_headers(args, i)) as r:
+            return await _drain(r)
+
+    return {"list": list_page, "search": search, "upload": upload, "download": download, "archive": archive}
+
+
+async def run_ws(port: int, clients: int, seconds: float) -> dict:
+    import websockets
+
+    latencies, errors, sockets = [], 0, []
+
+    async def connect():
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            sockets.append(await websockets.connect(f"ws://127.0.0.1:{port}/ws/events", open_timeout=30))
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connect() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(seconds)  # held open while RSS is sampled
+    await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+    return {**summarize(latencies, errors, elapsed), "connections": len(sockets)}
+
+
+async def run_scenarios(args, server_pid: int, port: int, seeded: dict) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    uploaded: dict = {}
+    requests = make_scenarios(args, seeded["user_ids"], seeded["memberships"], uploaded)
+    results = {}
+    for name in args.scenarios:
+        if name in ("download", "archive") and not uploaded:
+            results[name] = {"skipped": "no files from the upload scenario to download"}
+            print(f"{name:9} skipped: {results[name]['skipped']}")
+            continue
+        async with RssSampler(server_pid) as rss:
+            if name == "ws":
+                result = await run_ws(port, args.concurrency, args.seconds)
+            else:
+                await drive(base, args.concurrency, args.warmup, requests[name])
+                result = await drive(base, args.concurrency, args.seconds, requests[name])
+        results[name] = {**result, "rss_mb_peak": rss.peak}
+        r = results[name]
+        print(f"{name:9} {r['requests']:>8} {r['errors']:>7} {r['rps']:>9.1f} {_cell(r['p50_ms'])} "
+              f"{_cell(r['p95_ms'])} {_cell(r['p99_ms'])} {_cell(r['rss_mb_peak'])}")
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BACKEND, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def cmd_run(args) -> int:
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    url = args.database_url or os.getenv("VALKYRIE_DATABASE_URL") or \
+        f"sqlite:///{os.path.join(tempfile.gettempdir(), 'valkyrie-loadtest.db')}"
+    started = time.monotonic()
+    seeded = seed(url, args.users, args.projects, args.documents)
+    print(f"seeded {seeded['loaded']} in {time.monotonic() - started:.1f}s")
+
+    port = _free_port()
+    server = start_server(url, port, args.workers)
+    try:
+        idle_rss = rss_mb(server.pid)
+        print(f"{args.concurrency} clients, {args.seconds:.0f}s per scenario, server idle RSS {idle_rss} MB")
+        print(f"{'scenario':9} {'requests':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'RSS MB':>8}")
+        results = asyncio.run(run_scenarios(args, server.pid, port, seeded))
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "git_revision": _git_revision(),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "database": url.split(":", 1)[0], "users": args.users, "projects": args.projects,
+            "documents": args.documents, "concurrency": args.concurrency, "seconds": args.seconds,
+            "workers": args.workers, "idle_rss_mb": idle_rss,
+        },
+        "scenarios": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return print_comparison(compare(baseline, report, args.tolerance, args.min_ms))
+    return 0
+
+
+# ------------------------------------------------------------- comparison ---
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.10, min_ms: float = 1.0) -> list:
+    """One row per (scenario, metric) present in both reports; `regressed` marks the ones to flag."""
+    rows = []
+    for name, cur in current.get("scenarios", {}).items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or "skipped" in base or "skipped" in cur:
+            continue
+        for key, higher_is_better in COMPARED:
+            if base.get(key) is None or cur.get(key) is None:
+                continue
+            old, new = float(base[key]), float(cur[key])
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            regressed = worse > tolerance
+            if key.endswith("_ms") and abs(new - old) < min_ms:
+                regressed = False
+            rows.append({"scenario": name, "metric": key, "baseline": old, "current": new,
+                         "change": round(change, 4), "regressed": regressed})
+        old_rate = base["errors"] / max(base["requests"] + base["errors"], 1)
+        new_rate = cur["errors"] / max(cur["requests"] + cur["errors"], 1)
+        rows.append({"scenario": name, "metric": "error_rate", "baseline": round(old_rate, 4),
+                     "current": round(new_rate, 4), "change": round(new_rate - old_rate, 4),
+                     "regressed": new_rate > old_rate + 0.001})
+    return rows
+
+
+def print_comparison(rows: list) -> int:
+    print(f"{'scenario':9} {'metric':12} {'baseline':>10} {'current':>10} {'change':>8}")
+    for r in rows:
+        flag = "  REGRESSION" if r["regressed"] else ""
+        change = f"{r['change'] * 100:+.1f}%" if r["metric"] != "error_rate" else f"{r['change']:+.4f}"
+        print(f"{r['scenario']:9} {r['metric']:12} {r['baseline']:>10g} {r['current']:>10g} {change:>8}{flag}")
+    regressions = [r for r in rows if r["regressed"]]
+    print(f"{len(regressions)} regression(s)" if regressions else "no regressions")
+    return 1 if regressions else 0
+
+
+def cmd_compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return print_comparison(compare(baseline, current, args.tolerance, args.min_ms))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="seed, start the API and run the scenarios")
+    run.add_argument("--database-url", help="default: VALKYRIE_DATABASE_URL, else a temp SQLite file")
+    run.add_argument("--users", type=int, default=1000)
+    run.add_argument("--projects", type=int, default=100)
+    run.add_argument("--documents", type=int, default=10000)
+    run.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), metavar="NAME",
+                     help=f"subset of: {' '.join(SCENARIOS)}")
+    run.add_argument("--concurrency", type=int, default=50)
+    run.add_argument("--seconds", type=float, default=20)
+    run.add_argument("--warmup", type=float, default=3)
+    run.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    run.add_argument("--page-size", type=int, default=50)
+    run.add_argument("--list-pages", type=int, default=5, help="follow next_cursor this deep, then restart")
+    run.add_argument("--upload-kb", type=int, default=64)
+    run.add_argument("--archive-files", type=int, default=5, help="files per archive request")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--out", default="loadtest.json")
+    run.add_argument("--baseline", help="compare against this report after the run")
+
+    cmp_ = sub.add_parser("compare", help="flag regressions of a report against a baseline")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("current")
+    for p in (run, cmp_):
+        p.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change (0.15 = 15%%)")
+        p.add_argument("--min-ms", type=float, default=1.0, help="ignore latency changes smaller than this")
+
+    args = parser.parse_args()
+    sys.exit(cmd_run(args) if args.command == "run" else cmd_compare(args))
+
+
+if __name__ == "__main__":
+    main()
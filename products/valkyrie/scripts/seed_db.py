@@ -6,7 +6,10 @@ and creates a minimal `projects` and `api_keys` table and inserts a single admin
 
 It purposefully avoids importing the full application to keep seeding simple.
 """
+import hashlib
+import hmac
 import os
+import secrets
 import sys
 import uuid
 from urllib.parse import urlparse
@@ -27,6 +30,19 @@ def get_database_url():
     return db.replace("postgresql+psycopg://", "postgresql://")
 
 
+def mint_api_key():
+    """Return (key_id, raw_key, key_digest) in the `vk_<key_id>_<secret>` format.
+
+    Mirrors backend/app/api_keys.py; duplicated so this script keeps working
+    without the application on sys.path.
+    """
+    key_id = secrets.token_hex(6)
+    raw_key = f"vk_{key_id}_{secrets.token_urlsafe(32)}"
+    pepper = os.environ.get("VALKYRIE_SECRET_KEY", "dev-secret-key").encode("utf-8")
+    digest = hmac.new(pepper, raw_key.encode("utf-8"), hashlib.sha256).hexdigest()
+    return key_id, raw_key, digest
+
+
 def ensure_tables(conn):
     with conn.cursor() as cur:
         cur.execute(
@@ -44,6 +60,12 @@ def ensure_tables(conn):
             role TEXT NOT NULL DEFAULT 'admin',
             created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
         );
+
+        -- Indexed lookup columns (see migrations/versions/004_api_key_digest.py)
+        ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS key_id TEXT;
+        ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS key_digest TEXT;
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_api_keys_key_digest ON api_keys (key_digest);
+        CREATE INDEX IF NOT EXISTS ix_api_keys_key_id ON api_keys (key_id);
         """
         )
     conn.commit()
@@ -73,14 +95,15 @@ def seed_admin(conn):
             print(f"Admin API key already exists (id={existing_id}). To rotate, create a new key manually.")
             return None
 
-        # create a new admin key and store only the hash
+        # create a new admin key and store only the hash + lookup digest
         admin_id = str(uuid.uuid4())
-        raw_key = f"admin-{uuid.uuid4().hex}"
+        key_id, raw_key, digest = mint_api_key()
         hashed = bcrypt.hash(raw_key)
 
         cur.execute(
-            "INSERT INTO api_keys (id, project_id, key, role) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING;",
-            (admin_id, project_id, hashed, "admin"),
+            "INSERT INTO api_keys (id, project_id, key, role, key_id, key_digest) "
+            "VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING;",
+            (admin_id, project_id, hashed, "admin", key_id, digest),
         )
     conn.commit()
     # Sleep a tiny bit to ensure logs show after container start
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Manage per-project pgvector ANN indexes on chunks.embedding.
+
+    python scripts/vector_index.py list
+    python scripts/vector_index.py create --project 3 [--method hnsw|ivfflat] [--m 16] [--ef-construction 64]
+    python scripts/vector_index.py rebuild --project 3
+    python scripts/vector_index.py drop --project 3
+    python scripts/vector_index.py ensure [--min-chunks 20000]
+
+Every build runs CONCURRENTLY, so it is safe against a live API and worker;
+`ensure` is meant for a nightly timer and indexes projects that outgrew
+exact scans.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from app import vector_index  # noqa: E402
+from app.db import engine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", choices=["list", "create", "rebuild", "drop", "ensure"])
+    parser.add_argument("--project", type=int)
+    parser.add_argument("--method", choices=vector_index.METHODS, default=vector_index.DEFAULT_METHOD)
+    parser.add_argument("--m", type=int, default=vector_index.HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=vector_index.HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--lists", type=int, default=None, help="IVFFlat lists (default: from row count)")
+    parser.add_argument("--min-chunks", type=int, default=vector_index.MIN_INDEXED_CHUNKS)
+    args = parser.parse_args()
+    if args.action in ("create", "rebuild", "drop") and args.project is None:
+        parser.error(f"{args.action} needs --project")
+
+    if args.action == "list":
+        result = vector_index.list_indexes(engine)
+    elif args.action == "create":
+        result = vector_index.create(engine, args.project, args.method, m=args.m,
+                                     ef_construction=args.ef_construction, lists=args.lists)
+    elif args.action == "rebuild":
+        result = vector_index.rebuild(engine, args.project, args.method)
+    elif args.action == "drop":
+        vector_index.drop(engine, args.project, args.method)
+        result = {"dropped": vector_index.index_name(args.project, args.method)}
+    else:
+        result = vector_index.ensure(engine, args.method, min_chunks=args.min_chunks)
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
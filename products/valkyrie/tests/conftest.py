@@ -0,0 +1,66 @@
+import os
+import sys
+import types
+import uuid
+
+import pytest
+
+# The API package lives in backend/app and is imported as `app`, the same way
+# uvicorn loads it (`uvicorn app.main:app` from backend/).
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+
+def _install_db_stand_in():
+    """app.db (engine, SessionLocal, get_db, Base) is provided by the deployment
+    and is not part of this tree. Modules that import it get a SQLite stand-in,
+    so their tests run here; tests bring their own engines and dependency
+    overrides and never touch this one."""
+    try:
+        import app.db  # noqa: F401
+        return
+    except ModuleNotFoundError as exc:
+        if exc.name != "app.db":
+            raise
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import declarative_base, sessionmaker
+
+    db = types.ModuleType("app.db")
+    db.engine = create_engine("sqlite://")
+    db.SessionLocal = sessionmaker(bind=db.engine)
+    db.Base = declarative_base()
+
+    def get_db():
+        session = db.SessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    db.get_db = get_db
+    sys.modules["app.db"] = db
+
+
+_install_db_stand_in()
+
+
+@pytest.fixture
+def pg_engine():
+    """Engine on a throwaway schema of VALKYRIE_TEST_DATABASE_URL, for code that
+    only speaks PostgreSQL (row locks, ON CONFLICT, intervals). Skipped unset."""
+    url = os.getenv("VALKYRIE_TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("VALKYRIE_TEST_DATABASE_URL is not set")
+    from sqlalchemy import create_engine, text
+
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(url)
+    with admin.begin() as con:
+        con.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(url, connect_args={"options": f"-c search_path={schema}"})
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as con:
+            con.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
@@ -1,2 +1,184 @@
 def test_placeholder():
     assert True
+
+
+def test_principal_cache_lru_and_ttl():
+    from app.cache import LRUTTLCache
+
+    now = [0.0]
+    cache = LRUTTLCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", {"id": 1})
+    cache.set("b", {"id": 2})
+    assert cache.get("a") == {"id": 1}
+    cache.set("c", {"id": 3})  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["evictions"] == 1
+
+
+def test_principal_cache_invalidation_by_user():
+    from app.cache import LRUTTLCache
+
+    cache = LRUTTLCache(max_entries=8, ttl=60)
+    cache.set("k1", {"id": 7, "role": "editor"})
+    cache.set("k2", {"id": 7, "role": "editor"})
+    cache.set("k3", {"id": 8, "role": "viewer"})
+    assert cache.pop_where(lambda _k, p: p["id"] == 7) == 2
+    assert cache.get("k3") == {"id": 8, "role": "viewer"}
+    assert cache.pop("k3") and not cache.pop("k3")
+
+
+def test_invalidate_principal_by_key_user_and_api_key_row():
+    from app import auth
+
+    auth.clear_principal_cache()
+    auth._principal_cache.set(auth._key_digest("alice-key"), {"id": 7, "role": "editor"})
+    auth._principal_cache.set(auth._key_digest("alice-key-2"), {"id": 7, "role": "editor"})
+    auth._principal_cache.set(auth._key_digest("vk_a_b"), {"id": None, "role": "viewer", "api_key_id": "42"})
+    auth._principal_cache.set(auth._key_digest("bob-key"), {"id": 8, "role": "viewer"})
+    assert auth.invalidate_principal(api_key="alice-key") == 1
+    assert auth.invalidate_principal(user_id=7) == 1
+    assert auth.invalidate_principal(api_key_id=42) == 1
+    assert auth.invalidate_principal(api_key="nobody") == 0
+    assert auth.invalidate_principal() == 1
+    assert len(auth._principal_cache) == 0
+
+
+def test_legacy_api_keys_need_the_offline_backfill(monkeypatch):
+    import pytest
+
+    pytest.importorskip("passlib")
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    from passlib.hash import bcrypt
+    from sqlalchemy.orm import Session
+
+    from app import api_keys
+    from app.api_keys import backfill_legacy_key, generate_api_key, hash_api_key, resolve_api_key
+
+    engine = sqlalchemy.create_engine("sqlite://")
+    with Session(engine) as db:
+        db.execute(sqlalchemy.text(
+            "CREATE TABLE api_keys (id TEXT, project_id TEXT, key TEXT, role TEXT, key_id TEXT, key_digest TEXT)"
+        ))
+        _, new_key = generate_api_key()
+        db.execute(sqlalchemy.text(
+            "INSERT INTO api_keys VALUES ('a', NULL, :key, 'admin', :key_id, :key_digest)"
+        ), hash_api_key(new_key))
+        db.execute(sqlalchemy.text(
+            "INSERT INTO api_keys VALUES ('b', NULL, :h, 'viewer', NULL, NULL)"
+        ), {"h": bcrypt.hash("admin-legacy")})
+        db.commit()
+
+        verified = []
+        real_verify = api_keys.bcrypt.verify
+        monkeypatch.setattr(api_keys.bcrypt, "verify", lambda *a: verified.append(a) or real_verify(*a))
+        assert resolve_api_key(db, new_key)["role"] == "admin"
+        assert resolve_api_key(db, "vk_nope_nope") is None
+        # Unknown and legacy keys cost one indexed lookup, never a bcrypt scan
+        verified.clear()
+        assert resolve_api_key(db, "junk") is None
+        assert resolve_api_key(db, "admin-legacy") is None
+        assert verified == []
+
+        from app import auth
+        auth._principal_cache.set("stale", {"id": None, "role": "admin", "api_key_id": "b"})
+        assert backfill_legacy_key(db, "junk") is None
+        assert backfill_legacy_key(db, "admin-legacy") == "b"
+        assert auth._principal_cache.get("stale") is None
+        db.commit()
+        assert resolve_api_key(db, "admin-legacy")["api_key_id"] == "b"
+        remaining = db.execute(sqlalchemy.text("SELECT count(*) FROM api_keys WHERE key_digest IS NULL")).scalar()
+        assert remaining == 0
+
+
+def test_get_current_user_serves_repeat_keys_from_the_cache(monkeypatch):
+    import pytest
+    from fastapi import HTTPException
+    from sqlalchemy import create_engine, event, text
+    from sqlalchemy.orm import Session
+
+    from app import auth
+
+    monkeypatch.setattr(auth, "DEV_MODE", False)
+    auth.clear_principal_cache()
+    engine = create_engine("sqlite://")
+    with engine.begin() as con:
+        con.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, role TEXT, api_key TEXT)"))
+        con.execute(text("CREATE TABLE api_keys (id TEXT, project_id INTEGER, key TEXT, role TEXT, "
+                         "key_id TEXT, key_digest TEXT)"))
+        con.execute(text("INSERT INTO users VALUES (7, 'ana', 'editor', 'k-ana')"))
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda con, cur, sql, *a: statements.append(sql))
+
+    with Session(engine) as db:
+        before = auth.principal_cache_stats()
+        assert auth.get_current_user("k-ana", db) == {"id": 7, "name": "ana", "role": "editor"}
+        queries = len(statements)
+        assert auth.get_current_user("k-ana", db)["id"] == 7
+        assert len(statements) == queries  # served from the cache
+        for bad in ("k-nobody", None):
+            with pytest.raises(HTTPException) as exc:
+                auth.get_current_user(bad, db)
+            assert exc.value.status_code == 401
+        after = auth.principal_cache_stats()
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 2
+    auth.clear_principal_cache()
+
+
+def test_sync_and_async_auth_paths_agree(tmp_path, monkeypatch):
+    import asyncio
+
+    import pytest
+    from fastapi import HTTPException
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import Session
+
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    from app import auth
+    from app.api_keys import generate_api_key, hash_api_key
+
+    monkeypatch.setattr(auth, "DEV_MODE", False)
+    key_id, scoped_key = generate_api_key()
+    engine = create_engine(f"sqlite:///{tmp_path}/auth.db")
+    with engine.begin() as con:
+        con.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, role TEXT, api_key TEXT)"))
+        con.execute(text("CREATE TABLE api_keys (id INTEGER, project_id INTEGER, key TEXT, role TEXT, "
+                         "key_id TEXT, key_digest TEXT)"))
+        con.execute(text("CREATE TABLE project_membership (user_id INTEGER, project_id INTEGER)"))
+        con.execute(text("INSERT INTO users VALUES (7, 'ana', 'editor', 'k-ana'), (8, 'ceo', 'ceo', 'k-ceo')"))
+        con.execute(text("INSERT INTO project_membership VALUES (7, 1), (7, 3)"))
+        con.execute(text("INSERT INTO api_keys VALUES (5, 4, :key, 'viewer', :key_id, :key_digest)"),
+                    hash_api_key(scoped_key))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/auth.db")
+
+    def sync_path(key):
+        with Session(engine) as db:
+            user = auth.get_current_user(key, db)
+            return user, auth.readable_project_ids(user, db)
+
+    async def async_path(key):
+        async with AsyncSession(async_engine) as db:
+            user = await auth.get_current_user_async(key, db)
+            return user, await auth.readable_project_ids_async(user, db)
+
+    for key in ("k-ana", "k-ceo", scoped_key, "k-nobody", "vk_nope_x", None):
+        outcomes = []
+        for run in (sync_path, lambda k: asyncio.run(async_path(k))):
+            # Cold caches each time, so both paths really query
+            auth.clear_principal_cache()
+            auth._acl_cache.clear()
+            try:
+                outcomes.append(run(key))
+            except HTTPException as exc:
+                outcomes.append(exc.status_code)
+        assert outcomes[0] == outcomes[1], key
+    assert outcomes[0] == 401
+    assert sync_path("k-ana")[1] == frozenset({1, 3}) and sync_path(scoped_key)[1] == frozenset({4})
+    auth.clear_principal_cache()
+    auth._acl_cache.clear()
+    asyncio.run(async_engine.dispose())
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+pytest.importorskip("aiofiles")
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.blobstore import BlobStore, dedup_stats, gc, link_file, lookup_file, register_orphans, unlink_file
+from app.uploads import stream_to_temp
+
+# migrations 005_blob_store + 006_user_files_project
+SCHEMA = [
+    """CREATE TABLE blobs (
+        sha256 CHAR(64) PRIMARY KEY,
+        size_bytes BIGINT NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+        updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+    )""",
+    """CREATE TABLE user_files (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        sha256 CHAR(64) NOT NULL REFERENCES blobs (sha256),
+        size_bytes BIGINT NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+        project_id INTEGER,
+        UNIQUE (user_id, filename)
+    )""",
+]
+
+
+@pytest.fixture
+def db(pg_engine):
+    with pg_engine.begin() as con:
+        for ddl in SCHEMA:
+            con.execute(text(ddl))
+    with Session(pg_engine) as session:
+        yield session
+
+
+def upload(db, store, user_id, filename, content: bytes):
+    """The upload endpoint's sequence: stage, reference, adopt, commit."""
+    async def chunks():
+        yield content
+
+    staged = asyncio.run(stream_to_temp(chunks(), store.tmp_dir))
+    replaced = link_file(db, user_id, filename, staged["sha256"], staged["size"])
+    stored = asyncio.run(store.adopt(staged["tmp_path"], staged["sha256"]))
+    db.commit()
+    return stored, replaced
+
+
+def refcount(db, content: bytes):
+    return db.execute(text("SELECT refcount FROM blobs WHERE sha256 = :s"),
+                      {"s": hashlib.sha256(content).hexdigest()}).scalar()
+
+
+def test_identical_content_is_stored_once(db, tmp_path):
+    store = BlobStore(str(tmp_path))
+    assert upload(db, store, "alice", "a.pdf", b"report") == (True, None)
+    assert upload(db, store, "bob", "copy.pdf", b"report") == (False, None)
+    assert refcount(db, b"report") == 2
+    assert len(list(store.walk())) == 1 and os.listdir(store.tmp_dir) == []
+
+    # Replacing a name moves its reference to the new content
+    stored, replaced = upload(db, store, "bob", "copy.pdf", b"report v2")
+    assert stored and replaced["sha256"] == hashlib.sha256(b"report").hexdigest()
+    assert refcount(db, b"report") == 1 and refcount(db, b"report v2") == 1
+    assert lookup_file(db, "bob", "copy.pdf")["size_bytes"] == len(b"report v2")
+
+    stats = dedup_stats(db)
+    assert stats["blobs"] == 2 and stats["references"] == 2 and stats["bytes_saved"] == 0
+
+
+def test_gc_removes_only_unreferenced_blobs_past_the_grace_period(db, tmp_path):
+    store = BlobStore(str(tmp_path))
+    upload(db, store, "alice", "a.pdf", b"shared")
+    upload(db, store, "bob", "b.pdf", b"shared")
+    upload(db, store, "alice", "gone.pdf", b"only alice")
+    unlink_file(db, "alice", "gone.pdf")
+    unlink_file(db, "alice", "a.pdf")
+    db.commit()
+
+    assert gc(db, store, grace_seconds=3600) == {"deleted_blobs": 0, "bytes_freed": 0}
+    db.execute(text("UPDATE blobs SET updated_at = now() - interval '2 hours' WHERE refcount <= 0"))
+    db.commit()
+    assert gc(db, store, grace_seconds=3600) == {"deleted_blobs": 1, "bytes_freed": len(b"only alice")}
+    assert not store.has(hashlib.sha256(b"only alice").hexdigest())
+    assert store.has(hashlib.sha256(b"shared").hexdigest()) and refcount(db, b"shared") == 1
+
+
+def test_files_left_by_failed_commits_are_collected(db, tmp_path):
+    store = BlobStore(str(tmp_path))
+    # adopt() went through but the commit did not: file on disk, no row
+    async def stage(content):
+        async def chunks():
+            yield content
+        staged = await stream_to_temp(chunks(), store.tmp_dir)
+        await store.adopt(staged["tmp_path"], staged["sha256"])
+        return store.path_for(staged["sha256"])
+
+    old, fresh = asyncio.run(stage(b"orphan")), asyncio.run(stage(b"in flight"))
+    upload(db, store, "alice", "kept.pdf", b"kept")
+    stale_part = os.path.join(store.tmp_dir, ".upload-dead.part")
+    open(stale_part, "wb").close()
+    two_hours_ago = time.time() - 7200
+    for path in (old, stale_part, store.path_for(hashlib.sha256(b"kept").hexdigest())):
+        os.utime(path, (two_hours_ago, two_hours_ago))
+
+    assert register_orphans(db, store, grace_seconds=3600) == {"orphan_blobs": 1, "stale_tmp_files": 1}
+    assert refcount(db, b"orphan") == 0 and refcount(db, b"in flight") is None
+    assert gc(db, store, grace_seconds=3600)["deleted_blobs"] == 1
+    assert not os.path.exists(old) and os.path.exists(fresh) and not os.path.exists(stale_part)
+    assert store.has(hashlib.sha256(b"kept").hexdigest()) and refcount(db, b"kept") == 1
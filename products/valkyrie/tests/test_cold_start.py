@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..", "backend")
+
+
+def _loaded_after(statement: str, modules) -> list:
+    code = f"import sys\n{statement}\nprint(','.join(m for m in {list(modules)!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         env={**os.environ, "PYTHONPATH": BACKEND}).stdout.strip()
+    return [m for m in out.split(",") if m]
+
+
+def test_api_modules_do_not_import_numpy_or_drivers():
+    # Fresh interpreter: this test process already has numpy loaded
+    loaded = _loaded_after("import app.vector_index, app.search_cache, app.graph",
+                           ["numpy", "app.embeddings", "app.embedding_service", "redis", "neo4j"])
+    assert loaded == []
+
+
+def test_search_cache_is_built_on_first_use():
+    from app import search_cache
+
+    search_cache._search_cache = None
+    cache = search_cache.get_search_cache()
+    assert cache is search_cache.get_search_cache()
+    search_cache._search_cache = None
@@ -0,0 +1,19 @@
+import pytest
+
+db_async = pytest.importorskip("app.db_async")
+
+
+def test_async_url_maps_sync_drivers():
+    assert db_async.async_url("postgresql://u:p@h/db") == "postgresql+psycopg://u:p@h/db"
+    assert db_async.async_url("postgresql+psycopg2://u:p@h/db") == "postgresql+psycopg://u:p@h/db"
+    assert db_async.async_url("postgresql+psycopg://u:p@h/db") == "postgresql+psycopg://u:p@h/db"
+    assert db_async.async_url("sqlite:///./dev.db") == "sqlite+aiosqlite:///./dev.db"
+
+
+def test_connect_args_set_timeout_and_prepared_statements(monkeypatch):
+    args = db_async.connect_args("postgresql+psycopg://h/db")
+    assert f"statement_timeout={db_async.STATEMENT_TIMEOUT_MS}" in args["options"]
+    assert args["prepare_threshold"] == 5
+    monkeypatch.setattr(db_async, "PREPARE_THRESHOLD", "off")
+    assert db_async.connect_args("postgresql+psycopg://h/db")["prepare_threshold"] is None
+    assert db_async.connect_args("sqlite+aiosqlite:///x.db") == {}
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.db_replicas import Replica, ReplicaRouter, get_read_db, pin_writes
+
+
+def _database(path, name):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as con:
+        con.execute(text("CREATE TABLE marker (name TEXT)"))
+        con.execute(text("INSERT INTO marker VALUES (:n)"), {"n": name})
+    engine.dispose()
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def _app(router):
+    app = FastAPI()
+    app.state.replica_router = router
+    app.middleware("http")(pin_writes)
+
+    @app.on_event("startup")
+    async def start():
+        await router.start()
+
+    @app.on_event("shutdown")
+    async def stop():
+        await router.stop()
+
+    @app.get("/who")
+    async def who(db=Depends(get_read_db)):
+        return (await db.execute(text("SELECT name FROM marker"))).scalar()
+
+    @app.post("/write")
+    async def write():
+        return {"ok": True}
+
+    return app
+
+
+def test_reads_go_to_healthy_replicas_and_writers_read_their_writes(tmp_path):
+    primary = _database(tmp_path / "primary.db", "primary")
+    replica = _database(tmp_path / "replica.db", "replica")
+    router = ReplicaRouter([replica, f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db"],
+                           primary_sessions=async_sessionmaker(create_async_engine(primary)))
+    with TestClient(_app(router)) as client:
+        assert [r.healthy for r in router.replicas] == [True, False]
+        assert router.replicas[1].error
+        response = client.get("/who")
+        assert response.json() == "replica" and response.headers["X-Valkyrie-DB"] == "replica-1"
+
+        assert client.get("/who", headers={"X-Valkyrie-Consistency": "strong"}).json() == "primary"
+
+        # A successful write pins this client (cookie) to the primary for a while
+        pinned = client.post("/write")
+        assert "X-Valkyrie-Primary-Until" in pinned.headers
+        assert client.get("/who").json() == "primary"
+        client.cookies.clear()
+        assert client.get("/who").json() == "replica"
+        # Cookie-less clients echo the header instead
+        assert client.get("/who", headers={"X-Valkyrie-Primary-Until": pinned.headers["X-Valkyrie-Primary-Until"]}
+                          ).json() == "primary"
+
+
+def test_lagging_replicas_fall_back_to_primary(tmp_path):
+    primary = _database(tmp_path / "primary.db", "primary")
+    replica = _database(tmp_path / "replica.db", "replica")
+    router = ReplicaRouter([replica], max_lag=-1,  # every replica is "too far behind"
+                           primary_sessions=async_sessionmaker(create_async_engine(primary)))
+    with TestClient(_app(router)) as client:
+        assert client.get("/who").json() == "primary"
+    assert router.fallbacks == 1 and router.reads["replica-1"] == 0
+
+
+def test_replica_with_a_disconnected_wal_receiver_is_unhealthy():
+    class Result:
+        def scalar(self):
+            return None  # LAG_SQL: in recovery, but pg_stat_wal_receiver is not streaming
+
+    class Connection:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, statement):
+            assert "pg_stat_wal_receiver" in statement.text
+            return Result()
+
+    class Engine:
+        dialect = type("Dialect", (), {"name": "postgresql"})()
+
+        def connect(self):
+            return Connection()
+
+    replica = Replica("replica-1", Engine())
+    asyncio.run(replica.check(max_lag=5))
+    assert not replica.healthy and replica.lag is None and replica.error == "WAL receiver is not streaming"
@@ -0,0 +1,157 @@
+import hashlib
+import io
+import os
+import zipfile
+
+import pytest
+
+pytest.importorskip("starlette")
+
+from app.file_responses import parse_range, zip_stream
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=a-b", 100)
+
+
+def test_zip_stream_round_trips(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"alpha" * 1000)
+    (tmp_path / "b.bin").write_bytes(bytes(range(256)))
+    entries = [("a.txt", str(tmp_path / "a.txt")), ("b.bin", str(tmp_path / "b.bin"))]
+    for compress in (False, True):
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(zip_stream(entries, compress=compress))))
+        assert archive.testzip() is None
+        assert archive.read("a.txt") == b"alpha" * 1000
+        assert archive.read("b.bin") == bytes(range(256))
+
+
+@pytest.fixture
+def download_client(tmp_path, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app import file_responses
+    from app.auth import get_current_user
+    from app.blobstore import BlobStore
+    from app.db import get_db
+    from app.routers import users
+
+    content = bytes(range(256)) * 20
+    digest = hashlib.sha256(content).hexdigest()
+    store = BlobStore(str(tmp_path))
+    os.makedirs(os.path.dirname(store.path_for(digest)))
+    with open(store.path_for(digest), "wb") as f:
+        f.write(content)
+
+    def lookup(db, user_id, filename):
+        if (user_id, filename) == ("1", "data.bin"):
+            return {"filename": filename, "sha256": digest, "project_id": 5}
+        if (user_id, filename) == ("1", "private.bin"):
+            return {"filename": filename, "sha256": digest, "project_id": None}
+        return None
+
+    monkeypatch.setattr(file_responses, "SEND_CHUNK", 1000)  # several body messages per response
+    monkeypatch.setattr(users, "get_blob_store", lambda: store)
+    monkeypatch.setattr(users, "lookup_file", lookup)
+    app = FastAPI()
+    app.include_router(users.router)
+    app.dependency_overrides[get_db] = lambda: None
+    app.dependency_overrides[get_current_user] = lambda: {"id": 99, "name": "Boss", "role": "ceo"}
+    return TestClient(app), content, f'"{digest}"'
+
+
+def test_download_full_body_and_ranges(download_client):
+    client, content, etag = download_client
+    full = client.get("/files/1/data.bin")
+    assert full.status_code == 200 and full.content == content
+    assert full.headers["etag"] == etag and full.headers["accept-ranges"] == "bytes"
+    assert full.headers["content-length"] == str(len(content))
+
+    part = client.get("/files/1/data.bin", headers={"Range": "bytes=1500-2599"})
+    assert part.status_code == 206 and part.content == content[1500:2600]
+    assert part.headers["content-range"] == f"bytes 1500-2599/{len(content)}"
+    assert part.headers["content-length"] == "1100"
+
+    tail = client.get("/files/1/data.bin", headers={"Range": "bytes=-10"})
+    assert tail.status_code == 206 and tail.content == content[-10:]
+
+    # A stale If-Range validator gets the whole (changed) representation
+    stale = client.get("/files/1/data.bin", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert stale.status_code == 200 and stale.content == content
+
+    head = client.head("/files/1/data.bin")
+    assert head.status_code == 200 and head.content == b"" and head.headers["content-length"] == str(len(content))
+    assert client.get("/files/1/missing.bin").status_code == 404
+
+
+def test_download_conditional_and_unsatisfiable_requests(download_client):
+    client, content, etag = download_client
+    cached = client.get("/files/1/data.bin", headers={"If-None-Match": f'W/"x", {etag}'})
+    assert cached.status_code == 304 and cached.content == b"" and cached.headers["etag"] == etag
+
+    beyond = client.get("/files/1/data.bin", headers={"Range": f"bytes={len(content)}-"})
+    assert beyond.status_code == 416 and beyond.content == b""
+    assert beyond.headers["content-range"] == f"bytes */{len(content)}"
+
+
+def test_files_are_404_to_callers_who_cannot_read_them(download_client, monkeypatch):
+    from types import SimpleNamespace
+
+    from app.auth import get_current_user
+    from app.db import get_db
+    from app.routers import users
+
+    client, content, _ = download_client
+    caller = {}
+    client.app.dependency_overrides[get_current_user] = lambda: caller
+    client.app.dependency_overrides[get_db] = lambda: SimpleNamespace(commit=lambda: None)
+    monkeypatch.setattr(users, "readable_project_ids", lambda user, db: {2: frozenset({5})}.get(user["id"],
+                                                                                                 frozenset()))
+    unlinked = []
+    monkeypatch.setattr(users, "unlink_file", lambda db, u, f: unlinked.append((u, f)) or {"sha256": "x"})
+    monkeypatch.setattr(users.storage_monitor, "record_delete", lambda *a: None)
+
+    # Not a member of project 5, and a scoped key bound to another project
+    for stranger in ({"id": 3, "name": "Eve", "role": "editor"},
+                     {"id": None, "name": "api-key:k", "role": "admin", "project_id": 6}):
+        caller.clear()
+        caller.update(stranger)
+        assert client.get("/files/1/data.bin").status_code == 404
+        assert client.head("/files/1/data.bin").status_code == 404
+        assert client.post("/files/1/archive", json={"filenames": ["data.bin"]}).status_code == 404
+        assert client.delete("/files/1/data.bin").status_code == 404
+    assert unlinked == []
+
+    # A viewer in project 5 reads the file but neither it nor the owner's project-less files can be removed
+    caller.update({"id": 2, "name": "Val", "role": "viewer", "project_id": None})
+    assert client.get("/files/1/data.bin").content == content
+    assert client.get("/files/1/private.bin").status_code == 404
+    assert client.post("/files/1/archive", json={"filenames": ["data.bin", "private.bin"]}).status_code == 404
+    assert client.delete("/files/1/data.bin").status_code == 403
+    assert unlinked == []
+
+    # The owner needs no membership for their own files
+    caller.update({"id": 1, "name": "Owner", "role": "intern"})
+    assert client.get("/files/1/private.bin").status_code == 200
+    assert client.delete("/files/1/private.bin").status_code == 200
+    assert unlinked == [("1", "private.bin")]
+
+
+def test_files_need_an_api_key(download_client, monkeypatch):
+    from app import auth
+
+    client, _, _ = download_client
+    client.app.dependency_overrides.pop(auth.get_current_user)
+    monkeypatch.setattr(auth, "DEV_MODE", False)
+    assert client.get("/files/1/data.bin").status_code == 401
+    assert client.delete("/files/1/data.bin").status_code == 401
+    assert client.post("/files/1/archive", json={"filenames": ["data.bin"]}).status_code == 401
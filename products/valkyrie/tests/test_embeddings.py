@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.embedding_service import EmbeddingService
+from app.embeddings import embed_texts
+
+
+def test_embed_texts_is_deterministic_and_normalised():
+    a, b = embed_texts(["hello world", "hello world"])
+    assert np.array_equal(a, b)
+    assert abs(float(np.linalg.norm(a)) - 1.0) < 1e-5
+
+
+def test_concurrent_requests_share_one_model_call():
+    calls = []
+
+    def model(texts):
+        calls.append(list(texts))
+        return embed_texts(texts)
+
+    service = EmbeddingService(embed_fn=model, batch_window=0.02)
+
+    async def main():
+        results = await asyncio.gather(*(service.embed(q) for q in ["a b", "c d", "a b", "e f"]))
+        again = await service.embed("c d")
+        await service.close()
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert calls == [["a b", "c d", "e f"]]
+    assert np.allclose(results[1], again)
+    assert service.stats()["computed"] == 3
+
+
+
+def test_each_tier_counts_a_lookup_once_and_serves_the_same_vector(tmp_path):
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(f"sqlite:///{tmp_path}/cache.db")
+    with engine.begin() as con:
+        con.execute(text("CREATE TABLE embedding_cache (model TEXT, text_hash BLOB, vector BLOB)"))
+
+    class Service(EmbeddingService):
+        # SQLite stand-in for the ANY()/unnest() queries of the DB tier
+        def _load(self, hashes):
+            with engine.connect() as con:
+                rows = con.execute(text("SELECT text_hash, vector FROM embedding_cache")).all()
+            return {bytes(h): np.frombuffer(v, dtype=self.dtype).astype(np.float32)
+                    for h, v in rows if bytes(h) in hashes}
+
+        def _save(self, hashes, vectors):
+            with engine.begin() as con:
+                con.execute(text("INSERT INTO embedding_cache VALUES ('m', :h, :v)"),
+                            [{"h": h, "v": v.astype(self.dtype).tobytes()} for h, v in zip(hashes, vectors)])
+
+    first = Service(batch_window=0)
+    fresh = asyncio.run(first.embed("alpha beta"))
+    stats = first.stats()
+    assert stats["memory"]["misses"] == 1 and stats["db_misses"] == 1 and stats["computed"] == 1
+    assert fresh.dtype == np.float32 and np.array_equal(first.embed_many(["alpha beta"])[0], fresh)
+
+    # A second worker finds it in the DB tier: the same vector, one memory miss, one DB hit
+    second = Service(batch_window=0)
+    from_db = asyncio.run(second.embed("alpha beta"))
+    stats = second.stats()
+    assert stats["memory"]["misses"] == 1 and stats["db_hits"] == 1 and stats["computed"] == 0
+    assert np.array_equal(from_db, fresh)
+    assert np.array_equal(fresh, first.quantize(embed_texts(["alpha beta"]))[0])
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+from app.events import EventBroadcaster
+
+
+class RecordingSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.received = []
+
+    async def send_text(self, payload):
+        await asyncio.sleep(self.delay)
+        self.received.append(json.loads(payload))
+
+
+def test_slow_client_does_not_stall_others_and_drops_oldest():
+    async def scenario():
+        broadcaster = EventBroadcaster(max_queue=2)
+        fast, slow = RecordingSocket(), RecordingSocket(delay=10)
+        broadcaster.subscribe(fast)
+        slow_sub = broadcaster.subscribe(slow)
+        await asyncio.sleep(0)
+        for n in range(5):
+            broadcaster.publish({"type": "note", "n": n})
+            await asyncio.sleep(0.01)
+        assert [e["n"] for e in fast.received] == [0, 1, 2, 3, 4]
+        assert slow_sub.depth == 2 and slow_sub.dropped == 2
+        await broadcaster.close()
+
+    asyncio.run(scenario())
+
+
+def test_project_topics_and_progress_coalescing():
+    async def scenario():
+        broadcaster = EventBroadcaster()
+        apollo, zephyr = RecordingSocket(), RecordingSocket()
+        apollo_sub = broadcaster.subscribe(apollo, [1])
+        broadcaster.subscribe(zephyr, ["2"])
+        for pct in (10, 50, 90):
+            broadcaster.publish({"type": "ingest_progress", "job_id": 7, "project_id": 1, "pct": pct})
+        broadcaster.publish({"type": "notice"})
+        assert apollo_sub.coalesced == 2
+        await asyncio.sleep(0.01)
+        assert apollo.received == [{"type": "ingest_progress", "job_id": 7, "project_id": 1, "pct": 90},
+                                   {"type": "notice"}]
+        assert zephyr.received == [{"type": "notice"}]
+        await broadcaster.close()
+        assert broadcaster.stats()["connections"] == 0
+
+    asyncio.run(scenario())
+
+
+class FakeRedis:
+    """In-process stand-in for the redis.asyncio pub/sub calls the bus uses."""
+
+    def __init__(self):
+        self.queues = []
+
+    async def publish(self, channel, data):
+        for q in self.queues:
+            q.put_nowait({"type": "message", "channel": channel, "data": data})
+
+    def pubsub(self):
+        redis = self
+
+        class PubSub:
+            async def subscribe(self, channel):
+                self.q = asyncio.Queue()
+                redis.queues.append(self.q)
+
+            async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+                # asyncio.timeout, not wait_for: on 3.11 wait_for can swallow a
+                # cancel that races a message, leaving the subscriber running
+                try:
+                    async with asyncio.timeout(timeout):
+                        return await self.q.get()
+                except TimeoutError:
+                    return None
+
+            async def aclose(self):
+                redis.queues.remove(self.q)
+
+        return PubSub()
+
+
+def test_redis_bus_fans_out_across_workers_in_batches():
+    from app.event_bus import RedisEventBus
+
+    async def scenario():
+        redis = FakeRedis()
+        workers = [EventBroadcaster(), EventBroadcaster()]
+        buses = [RedisEventBus(b, client=redis, batch_window=0.005) for b in workers]
+        sockets = [RecordingSocket(), RecordingSocket()]
+        for broadcaster, bus, ws in zip(workers, buses, sockets):
+            await bus.start()
+            broadcaster.subscribe(ws)
+        for n in range(3):
+            await buses[0].publish({"type": "ingest_done", "n": n})
+        await asyncio.sleep(0.05)
+        assert buses[0].messages_published == 1
+        for ws in sockets:
+            assert [e["n"] for e in ws.received] == [0, 1, 2]
+        for broadcaster, bus in zip(workers, buses):
+            await bus.stop()
+            await broadcaster.close()
+
+    asyncio.run(scenario())
+
+
+def test_redis_bus_stop_sends_the_pending_batch_and_cancels_the_timer():
+    from app.event_bus import RedisEventBus
+
+    async def scenario():
+        redis = FakeRedis()
+        broadcaster = EventBroadcaster()
+        bus = RedisEventBus(broadcaster, client=redis, batch_window=60)
+        await bus.start()
+        await bus.publish({"type": "ingest_done", "n": 1})
+        timer = bus._flush_task
+        await bus.stop()
+        assert timer.cancelled() and bus._flush_task is None
+        assert bus.messages_published == 1 and bus._outbox == []
+        await broadcaster.close()
+
+    asyncio.run(scenario())
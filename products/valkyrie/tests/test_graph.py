@@ -0,0 +1,165 @@
+import json
+
+import pytest
+
+from app.graph import GraphService, RedisGraph, adjacency_key, labels_key
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def zrevrange(self, key, start, stop, withscores=False):
+        self.commands.append((key, start, stop))
+
+    def execute(self):
+        self.client.round_trips += 1
+        out = []
+        for key, start, stop in self.commands:
+            members = sorted(self.client.zsets.get(key, {}).items(), key=lambda kv: -kv[1])
+            out.append([(m.encode(), s) for m, s in members[start:stop + 1]])
+        return out
+
+
+class FakeRedis:
+    def __init__(self):
+        self.zsets = {}
+        self.hashes = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hmget(self, key, fields):
+        self.round_trips += 1
+        values = self.hashes.get(key, {})
+        return [values[f].encode() if f in values else None for f in fields]
+
+
+def _graph(edges, labels, project_id=1):
+    client = FakeRedis()
+    for a, b, kind, weight in edges:
+        for s, t in ((a, b), (b, a)):
+            client.zsets.setdefault(adjacency_key(project_id, s), {})[json.dumps([t, kind])] = weight
+    client.hashes[labels_key(project_id)] = labels
+    return client
+
+
+def test_multi_seed_subgraph_is_deduplicated_and_pipelined():
+    client = _graph(
+        [("Apollo", "NASA", "co_occurs", 5.0), ("Gemini", "NASA", "co_occurs", 3.0),
+         ("NASA", "Houston", "co_occurs", 2.0), ("Houston", "Texas", "co_occurs", 1.0)],
+        {"Apollo": "ORG", "Gemini": "ORG", "NASA": "ORG", "Houston": "GPE", "Texas": "GPE"},
+    )
+    service = GraphService(RedisGraph(client))
+    result = service.subgraph(1, ["Apollo", "Gemini", "Nobody"], depth=2, fanout=10)
+
+    depths = {n["name"]: n["depth"] for n in result["nodes"]}
+    assert depths == {"Apollo": 0, "Gemini": 0, "NASA": 1, "Houston": 2}
+    assert {n["name"]: n["label"] for n in result["nodes"]}["Houston"] == "GPE"
+    pairs = {frozenset((e["source"], e["target"])) for e in result["edges"]}
+    assert pairs == {frozenset(p) for p in [("Apollo", "NASA"), ("Gemini", "NASA"), ("NASA", "Houston")]}
+    assert len(result["edges"]) == len(pairs)  # NASA-Houston seen from both sides once
+    # one pipeline per hop plus one label lookup, not one call per node
+    assert client.round_trips == 3 and result["cached"] is False
+
+    again = service.subgraph(1, ["Gemini", "Apollo"], depth=2, fanout=10)
+    assert again["cached"] is True and client.round_trips == 3
+    assert sorted(n["name"] for n in again["nodes"]) == sorted(depths)
+
+
+def test_fanout_cap_and_cache_reuse_rules():
+    client = _graph([("Hub", f"N{i}", "co_occurs", float(i)) for i in range(10)], {"Hub": "ORG"})
+    service = GraphService(RedisGraph(client))
+    narrow = service.subgraph(1, ["Hub"], depth=1, fanout=3)
+    assert sorted(e["target"] for e in narrow["edges"]) == ["N7", "N8", "N9"]
+
+    # A truncated adjacency list cannot serve a wider request ...
+    wide = service.subgraph(1, ["Hub"], depth=1, fanout=20)
+    assert wide["cached"] is False and len(wide["edges"]) == 10
+    # ... but a complete one serves any narrower one
+    assert service.subgraph(1, ["Hub"], depth=1, fanout=2)["cached"] is True
+
+    assert service.invalidate_project(1) > 0
+    assert service.subgraph(1, ["Hub"], depth=1, fanout=2)["cached"] is False
+    with pytest.raises(ValueError):
+        service.subgraph(1, ["Hub"], depth=9)
+
+
+def test_graph_writer_batches_retries_and_round_trips_through_redis():
+    from app.graph_sync import GraphWriter, RedisGraphWriter
+
+    class WritableRedis(FakeRedis):
+        def __init__(self):
+            super().__init__()
+            self.failures = 1
+
+        def hset(self, key, mapping):
+            self.round_trips += 1
+            self.hashes.setdefault(key, {}).update(mapping)
+
+        def pipeline(self, transaction=True):
+            client = self
+            pipe = FakePipeline(self)
+            writes = []
+
+            def execute():
+                if writes:
+                    if client.failures:
+                        client.failures -= 1
+                        raise ConnectionError("connection reset")
+                    client.round_trips += 1
+                    for key, mapping in writes:
+                        client.zsets.setdefault(key, {}).update(mapping)
+                    return []
+                return FakePipeline.execute(pipe)
+
+            pipe.zadd = lambda key, mapping: writes.append((key, mapping))
+            pipe.execute = execute
+            return pipe
+
+    client = WritableRedis()
+    delays = []
+    with GraphWriter(RedisGraphWriter(client), project_id=4, batch_size=2, sleep=delays.append) as writer:
+        for name in ("Apollo", "NASA", "Houston"):
+            writer.add_entity(name, "ORG")
+        writer.add_relation("Apollo", "NASA", "co_occurs", 3)
+        writer.add_relation("NASA", "Houston", "co_occurs", 1)
+    assert writer.stats()["entities"] == 3 and writer.stats()["relations"] == 2
+    assert writer.batches == 3 and writer.retried == 1 and len(delays) == 1
+
+    # Weights are set, not added: replaying the same rows changes nothing
+    before = {k: dict(v) for k, v in client.zsets.items()}
+    with GraphWriter(RedisGraphWriter(client), project_id=4) as again:
+        again.add_relation("Apollo", "NASA", "co_occurs", 3)
+    assert client.zsets == before
+
+    result = GraphService(RedisGraph(client)).subgraph(4, ["Apollo"], depth=2)
+    assert {n["name"]: n["label"] for n in result["nodes"]} == {"Apollo": "ORG", "NASA": "ORG", "Houston": "ORG"}
+
+
+def test_graph_cache_stats_are_ceo_only(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    search = pytest.importorskip("app.routers.search")
+    from app import auth
+
+    class Service:
+        def stats(self):
+            return {"backend_calls": 4}
+
+    monkeypatch.setattr(search, "get_graph_service", Service)
+    app = FastAPI()
+    app.include_router(search.router)
+    client = TestClient(app)
+    caller = {"id": 2, "name": "Alice", "role": "admin"}
+    app.dependency_overrides[auth.get_current_user] = lambda: caller
+    assert client.get("/search/graph/cache-stats").status_code == 403
+    caller["role"] = "ceo"
+    assert client.get("/search/graph/cache-stats").json() == {"backend_calls": 4}
+
+    del app.dependency_overrides[auth.get_current_user]
+    monkeypatch.setattr(auth, "DEV_MODE", False)
+    assert client.get("/search/graph/cache-stats").status_code == 401
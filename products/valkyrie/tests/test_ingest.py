@@ -0,0 +1,134 @@
+import pytest
+
+ingest = pytest.importorskip("app.ingest_pipeline")
+
+
+def test_extract_and_chunk(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text("first paragraph\n\n\n" + "word " * 300 + "\n\nlast one")
+    blocks = list(ingest.extract_blocks(str(path), read_size=7))
+    assert blocks[0] == "first paragraph" and blocks[-1] == "last one"
+    chunks = list(ingest.chunk_blocks(blocks, size=400, overlap=50))
+    assert [c["ord"] for c in chunks] == list(range(len(chunks)))
+    # size + overlap + the "\n\n" that joins the first piece onto the overlap tail
+    assert all(len(c["text"]) <= 400 + 50 + 2 for c in chunks)
+    assert max(len(c["text"]) for c in ingest.chunk_blocks(["x" * 400] * 3, size=400, overlap=50)) == 452
+
+
+def test_chunk_hashes_survive_a_local_edit():
+    paras = [f"paragraph {i} " + "text " * (i % 40 + 5) for i in range(300)]
+    before = [c["content_hash"] for c in ingest.chunk_blocks(paras, size=600, overlap=60)]
+    paras[150] = "an edited paragraph"
+    after = [c["content_hash"] for c in ingest.chunk_blocks(paras, size=600, overlap=60)]
+    changed = set(after) - set(before)
+    assert 0 < len(changed) <= 6  # of ~110
+
+
+def test_pipeline_runs_stages_in_order_and_reports():
+    reports = []
+    pipeline = ingest.Pipeline(reports.append, queue_depth=2)
+    seen = []
+
+    def double(items):
+        for i in items:
+            yield i * 2
+
+    def sink(items):
+        for i in items:
+            seen.append(i)
+            yield i
+
+    src = pipeline.stage("src", lambda _: iter(range(50)), None)
+    doubled = pipeline.stage("double", double, src)
+    pipeline.run(pipeline.stage("sink", sink, doubled))
+    assert seen == [i * 2 for i in range(50)]
+    assert reports[-1]["sink"]["items"] == 50
+
+
+def test_pipeline_propagates_stage_errors():
+    pipeline = ingest.Pipeline(lambda stats: None, queue_depth=1)
+
+    def boom(items):
+        for i in items:
+            if i == 3:
+                raise RuntimeError("bad chunk")
+            yield i
+
+    src = pipeline.stage("src", lambda _: iter(range(1000)), None)
+    with pytest.raises(RuntimeError):
+        pipeline.run(pipeline.stage("boom", boom, src))
+
+
+def test_job_for_a_deleted_document_is_marked_failed(tmp_path, monkeypatch):
+    import datetime
+
+    from sqlalchemy import create_engine, event, text
+
+    engine = create_engine(f"sqlite:///{tmp_path}/jobs.db")
+    event.listen(engine, "connect", lambda con, _: con.create_function(
+        "now", 0, lambda: datetime.datetime.now().isoformat()))
+    with engine.begin() as con:
+        con.execute(text("""CREATE TABLE ingest_jobs (id INTEGER PRIMARY KEY, document_id INTEGER, status TEXT,
+                            error TEXT, started_at TEXT, finished_at TEXT)"""))
+        con.execute(text("CREATE TABLE documents (id INTEGER PRIMARY KEY, project_id INTEGER, storage_path TEXT)"))
+        con.execute(text("INSERT INTO ingest_jobs (id, document_id, status) VALUES (1, 42, 'queued')"))
+    monkeypatch.setattr(ingest, "_engine", lambda: engine)
+
+    assert ingest.run_ingest_job(1) == {"status": "failed", "error": "document 42 not found"}
+    with engine.connect() as con:
+        job = con.execute(text("SELECT status, error, finished_at FROM ingest_jobs")).mappings().one()
+    assert job["status"] == "failed" and job["error"] == "document 42 not found" and job["finished_at"]
+    with pytest.raises(ValueError):
+        ingest.run_ingest_job(2)
+
+
+def test_graph_sync_runs_when_a_reingest_only_deletes_or_moves_chunks(tmp_path, monkeypatch):
+    import datetime
+    from types import SimpleNamespace
+
+    from sqlalchemy import create_engine, event, text
+
+    engine = create_engine(f"sqlite:///{tmp_path}/jobs.db")
+    event.listen(engine, "connect", lambda con, _: con.create_function(
+        "now", 0, lambda: datetime.datetime.now().isoformat()))
+    with engine.begin() as con:
+        con.execute(text("""CREATE TABLE ingest_jobs (id INTEGER PRIMARY KEY, document_id INTEGER, status TEXT,
+                            error TEXT, started_at TEXT, finished_at TEXT)"""))
+        con.execute(text("CREATE TABLE documents (id INTEGER PRIMARY KEY, project_id INTEGER, storage_path TEXT)"))
+        con.execute(text("INSERT INTO documents VALUES (7, 3, '/tmp/doc.txt')"))
+        for job_id in (1, 2, 3, 4):
+            con.execute(text("INSERT INTO ingest_jobs (id, document_id, status) VALUES (:j, 7, 'queued')"),
+                        {"j": job_id})
+
+    class Events:
+        client = None
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def publish(self, event):
+            pass
+
+        def flush(self):
+            pass
+
+    outcomes = iter([
+        {"chunks": 0, "chunks_deleted": 3, "chunks_moved": 0},
+        {"chunks": 0, "chunks_deleted": 0, "chunks_moved": 5},
+        {"chunks": 2, "chunks_deleted": 0, "chunks_moved": 0},
+        {"chunks": 0, "chunks_deleted": 0, "chunks_moved": 0},  # unchanged file
+    ])
+    synced = []
+    monkeypatch.setattr(ingest, "_engine", lambda: engine)
+    monkeypatch.setattr(ingest, "EventPublisher", Events)
+    monkeypatch.setattr(ingest, "INGEST_METRICS", False)
+    monkeypatch.setattr(ingest, "GRAPH_SYNC", True)
+    monkeypatch.setattr(ingest, "ingest_document", lambda *a: {**next(outcomes), "chunks_reused": 0,
+                                                               "stages": {}})
+    monkeypatch.setattr(ingest, "sync_document_graph", lambda d, p, engine: synced.append(d) or SimpleNamespace())
+    for job_id in (1, 2, 3, 4):
+        ingest.run_ingest_job(job_id)
+    assert synced == [7, 7, 7]
@@ -0,0 +1,125 @@
+import base64
+import json
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.auth import get_current_user_async
+from app.db_replicas import ReplicaRouter
+from app.routers import list as list_router
+
+CEO = {"id": 1, "name": "Boss", "role": "ceo"}
+
+
+def _raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def _documents(path, ids) -> str:
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as con:
+        con.execute(text("""CREATE TABLE documents (id INTEGER PRIMARY KEY, filename TEXT, project_id INTEGER,
+                            owner_user_id INTEGER, created_at TEXT)"""))
+        for i in ids:
+            con.execute(text("INSERT INTO documents VALUES (:i, :f, :p, 1, '2024-01-01')"),
+                        {"i": i, "f": f"doc{i}.pdf", "p": 1 if i % 2 else 2})
+    engine.dispose()
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def _app(router) -> FastAPI:
+    app = FastAPI()
+    app.state.replica_router = router
+    app.include_router(list_router.router)
+    app.dependency_overrides[get_current_user_async] = lambda: CEO
+    return app
+
+
+@pytest.fixture
+def client(tmp_path):
+    primary = create_async_engine(_documents(tmp_path / "list.db", range(1, 8)))
+    with TestClient(_app(ReplicaRouter(primary_sessions=async_sessionmaker(primary)))) as c:
+        yield c
+
+
+def test_cursor_round_trip_and_rejects_non_int_ids():
+    assert list_router.decode_cursor(list_router.encode_cursor(42)) == 42
+    for bad in ("not-base64!", _raw_cursor({"id": "7"}), _raw_cursor({"id": True}), _raw_cursor({"x": 1}),
+                _raw_cursor([1])):
+        with pytest.raises(HTTPException) as exc:
+            list_router.decode_cursor(bad)
+        assert exc.value.status_code == 400, bad
+
+
+def test_pages_walk_every_row_once_and_end_without_a_cursor(client):
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/api/list", params=params).json()
+        seen += [r["id"] for r in body["rows"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+    # An exactly full last page does not hand out a cursor to an empty page
+    assert client.get("/api/list", params={"limit": 7}).json()["next_cursor"] is None
+    assert client.get("/api/list", params={"limit": 3, "project_id": 2}).json()["rows"][0]["id"] == 6
+
+
+def test_invalid_cursor_and_limit_are_400(client):
+    assert client.get("/api/list", params={"cursor": _raw_cursor({"id": True})}).status_code == 400
+    assert client.get("/api/list", params={"cursor": "%%%"}).status_code == 400
+    assert client.get("/api/list", params={"limit": 0}).status_code == 400
+    assert client.get("/api/list", params={"format": "csv"}).status_code == 400
+
+
+def test_ndjson_is_one_object_per_line(client):
+    response = client.get("/api/list", params={"format": "ndjson",
+                                               "cursor": list_router.encode_cursor(4)})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.text.endswith("\n")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["id"] for r in rows] == [3, 2, 1]
+    assert rows[0]["filename"] == "doc3.pdf"
+
+
+def test_ndjson_streams_from_the_database_get_read_db_picked(tmp_path):
+    primary = create_async_engine(_documents(tmp_path / "primary.db", range(1, 8)))
+    # The replica has not caught up with the last four inserts
+    router = ReplicaRouter([_documents(tmp_path / "replica.db", range(1, 4))],
+                           primary_sessions=async_sessionmaker(primary))
+    router.replicas[0].healthy = True
+    with TestClient(_app(router)) as client:
+        response = client.get("/api/list", params={"format": "ndjson"})
+        assert response.headers["X-Valkyrie-DB"] == "replica-1"
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [3, 2, 1]
+
+        response = client.get("/api/list", params={"format": "ndjson"},
+                              headers={"X-Valkyrie-Consistency": "strong"})
+        assert response.headers["X-Valkyrie-DB"] == "primary"
+        assert len(response.text.splitlines()) == 7
+
+
+def test_scoped_api_key_reads_only_its_project(client, monkeypatch):
+    from app import auth
+    from app.api_keys import _principal
+
+    monkeypatch.setattr(auth, "DEV_MODE", False)
+    principal = _principal({"id": 9, "key_id": "abc123", "role": "viewer", "project_id": 2})
+    assert principal["project_id"] == 2
+    client.app.dependency_overrides[get_current_user_async] = lambda: principal
+    body = client.get("/api/list", params={"project_id": 2}).json()
+    assert [r["id"] for r in body["rows"]] == [6, 4, 2]
+    assert client.get("/api/list", params={"project_id": 1}).status_code == 403
+
+    unbound = _principal({"id": 10, "key_id": "def456", "role": "viewer", "project_id": None})
+    client.app.dependency_overrides[get_current_user_async] = lambda: unbound
+    assert client.get("/api/list").json() == {"rows": [], "next_cursor": None}
+    response = client.get("/api/list", params={"format": "ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson") and response.text == ""
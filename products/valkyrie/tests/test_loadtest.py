@@ -0,0 +1,92 @@
+import importlib.util
+import json
+import os
+
+spec = importlib.util.spec_from_file_location(
+    "loadtest", os.path.join(os.path.dirname(__file__), "..", "scripts", "loadtest.py"))
+loadtest = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(loadtest)
+
+
+def _report(**scenarios):
+    return {"meta": {}, "scenarios": scenarios}
+
+
+def _scenario(rps=100.0, p99=50.0, errors=0, requests=1000, rss=100.0):
+    return {"requests": requests, "errors": errors, "rps": rps, "p50_ms": 10.0, "p95_ms": 30.0,
+            "p99_ms": p99, "rss_mb_peak": rss}
+
+
+def test_percentile_is_nearest_rank():
+    values = [i / 1000 for i in range(1, 101)]
+    assert loadtest.percentile(values, 0.50) == 0.050
+    assert loadtest.percentile(values, 0.99) == 0.099
+    assert loadtest.percentile([], 0.5) is None
+    assert loadtest.summarize([], 3, 1.0)["p99_ms"] is None
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = _report(list=_scenario(), upload=_scenario(), ws=_scenario(), download={"skipped": "no ids"})
+    current = _report(list=_scenario(rps=80.0), upload=_scenario(p99=54.0, errors=5), ws=_scenario(rss=130.0),
+                      download=_scenario())
+    rows = loadtest.compare(baseline, current, tolerance=0.10)
+    regressed = {(r["scenario"], r["metric"]) for r in rows if r["regressed"]}
+    assert regressed == {("list", "rps"), ("upload", "error_rate"), ("ws", "rss_mb_peak")}
+    # skipped scenarios are not compared
+    assert not any(r["scenario"] == "download" for r in rows)
+    assert loadtest.print_comparison(rows) == 1
+    assert loadtest.print_comparison(loadtest.compare(baseline, baseline)) == 0
+
+
+def test_compare_ignores_small_absolute_latency_changes():
+    rows = loadtest.compare(_report(list=_scenario(p99=2.0)), _report(list=_scenario(p99=2.8)), min_ms=1.0)
+    assert not any(r["regressed"] for r in rows)
+
+
+def test_scenarios_hit_routes_the_api_serves():
+    import asyncio
+    from types import SimpleNamespace
+
+    import pytest
+
+    httpx = pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from starlette.routing import Match
+
+    search = pytest.importorskip("app.routers.search")
+    from app.routers import list as list_router
+    from app.routers import users
+
+    app = FastAPI()
+    app.include_router(list_router.router)
+    app.include_router(users.router, prefix="/api")
+    app.include_router(search.router, prefix="/api")
+
+    sent = []
+
+    def respond(request):
+        scope = {"type": "http", "path": request.url.path, "method": request.method}
+        assert any(route.matches(scope)[0] == Match.FULL for route in app.routes), request.url.path
+        sent.append(request)
+        return httpx.Response(200, json={"rows": [], "next_cursor": None})
+
+    args = SimpleNamespace(seed=0, upload_kb=1, users=2, page_size=10, list_pages=2, archive_files=2)
+    uploaded = {}
+    scenarios = loadtest.make_scenarios(args, {0: 11, 1: 12}, {0: [5, 6]}, uploaded)
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(respond), base_url="http://api") as client:
+            for name in ("list", "search", "upload", "upload", "download", "archive"):
+                for i in (0, 1):
+                    assert await scenarios[name](client, i, {}), name
+
+    asyncio.run(main())
+    by_path = {(r.method, r.url.path): r for r in sent}
+    assert uploaded == {0: ["loadtest-0-1.bin", "loadtest-0-3.bin"], 1: ["loadtest-1-2.bin", "loadtest-1-4.bin"]}
+    upload = next(r for r in sent if r.url.path == "/api/upload-file/11")
+    assert b'name="project_id"\r\n\r\n6' in upload.content and b'filename="loadtest-0-1.bin"' in upload.content
+    assert ("GET", "/api/files/12/loadtest-1-2.bin") in by_path
+    assert json.loads(by_path[("POST", "/api/files/11/archive")].content) == {
+        "filenames": ["loadtest-0-1.bin", "loadtest-0-3.bin"]}
+    searches = [r for r in sent if r.url.path == "/api/search/"]
+    assert searches[0].url.params["project_id"] == "5" and "project_id" not in searches[1].url.params
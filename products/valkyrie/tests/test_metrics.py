@@ -0,0 +1,131 @@
+import logging
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import metrics
+
+
+def _sample(text_: str, line_prefix: str, default=None) -> float:
+    for line in text_.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    if default is not None:
+        return default
+    raise AssertionError(f"{line_prefix} not in output")
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    h = registry.register(metrics.Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1.0)))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v, "/a")
+    out = registry.render()
+    assert "# TYPE t_seconds histogram" in out
+    assert _sample(out, 't_seconds_bucket{route="/a",le="0.1"}') == 1
+    assert _sample(out, 't_seconds_bucket{route="/a",le="1.0"}') == 3
+    assert _sample(out, 't_seconds_bucket{route="/a",le="+Inf"}') == 4
+    assert _sample(out, 't_seconds_count{route="/a"}') == 4
+    assert _sample(out, 't_seconds_sum{route="/a"}') == pytest.approx(4.05)
+
+
+@pytest.fixture
+def app(tmp_path):
+    url = f"sqlite:///{tmp_path / 'm.db'}"
+    engine = create_engine(url)
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    with engine.begin() as con:
+        con.execute(text("CREATE TABLE projects (id INTEGER PRIMARY KEY)"))
+        con.execute(text("INSERT INTO projects (id) VALUES (1), (2), (3)"))
+    metrics.instrument_engine(engine, "test")
+    metrics.instrument_engine(async_engine, "test-async")
+
+    app = FastAPI()
+    app.middleware("http")(metrics.record_requests)
+
+    def get_con():
+        with engine.connect() as con:
+            yield con
+
+    @app.get("/projects/{project_id}/n-plus-one")
+    def n_plus_one(project_id: int, con=Depends(get_con)):
+        # one query per project, the pattern the slow-request log is meant to expose
+        ids = [r[0] for r in con.execute(text("SELECT id FROM projects"))]
+        return [con.execute(text("SELECT id FROM projects WHERE id = :i"), {"i": i}).scalar() for i in ids]
+
+    @app.get("/async")
+    async def async_route():
+        async with async_engine.connect() as con:
+            return (await con.execute(text("SELECT count(*) FROM projects"))).scalar()
+
+    yield app
+    engine.dispose()
+
+
+def test_requests_are_timed_per_route_with_their_queries(app):
+    client = TestClient(app)
+    before = metrics.registry.render()
+    assert client.get("/projects/7/n-plus-one").json() == [1, 2, 3]
+    assert client.get("/async").json() == 3
+    client.get("/nope")
+    out = metrics.registry.render()
+
+    def delta(name):
+        return _sample(out, name) - _sample(before, name, default=0)
+
+    route = 'method="GET",route="/projects/{project_id}/n-plus-one"'
+    assert delta(f'valkyrie_http_requests_total{{{route},status="200"}}') == 1
+    # four statements in the threadpool endpoint, one through the async engine's greenlet
+    assert delta(f"valkyrie_http_request_db_queries_sum{{{route}}}") == 4
+    assert delta('valkyrie_http_request_db_queries_sum{method="GET",route="/async"}') == 1
+    assert delta('valkyrie_http_requests_total{method="GET",route="unmatched",status="404"}') == 1
+    assert delta('valkyrie_db_statements_total{db="test"}') == 4
+
+
+def test_slow_requests_log_grouped_statements(app, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="uvicorn.error"):
+        TestClient(app).get("/projects/1/n-plus-one")
+    message = next(r.getMessage() for r in caplog.records if r.getMessage().startswith("Slow request"))
+    assert "4 SQL statements" in message
+    assert "   3x" in message and "SELECT id FROM projects WHERE id = ?" in message
+
+
+class FakeRedisHash:
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hincrby(self, key, field, amount):
+        h = self.hashes.setdefault(key, {})
+        h[field] = h.get(field, 0) + amount
+
+    hincrbyfloat = hincrby
+
+    def execute(self):
+        return []
+
+    def hgetall(self, key):
+        return {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()}
+
+
+def test_ingest_metrics_accumulate_across_jobs():
+    ingest = metrics.IngestMetrics(FakeRedisHash())
+    stages = {"ner": {"items": 64, "busy_seconds": 2.0, "wait_seconds": 0.5, "blocked_seconds": 0.25}}
+    ingest.record_job("done", 3.0, stages)
+    ingest.record_job("done", 30.0, stages)
+    ingest.record_job("failed", 0.2)
+    out = ingest.render()
+    assert _sample(out, 'valkyrie_ingest_jobs_total{status="done"}') == 2
+    assert _sample(out, 'valkyrie_ingest_stage_busy_seconds_total{stage="ner"}') == 4.0
+    assert _sample(out, 'valkyrie_ingest_stage_items_total{stage="ner"}') == 128
+    assert _sample(out, 'valkyrie_ingest_job_duration_seconds_bucket{le="1.0"}') == 1
+    assert _sample(out, 'valkyrie_ingest_job_duration_seconds_bucket{le="+Inf"}') == 3
+    buckets = [line for line in out.splitlines() if "_bucket" in line]
+    assert buckets[-1].startswith('valkyrie_ingest_job_duration_seconds_bucket{le="+Inf"}')
+    assert out.index("_bucket") < out.index("valkyrie_ingest_job_duration_seconds_sum")
@@ -0,0 +1,177 @@
+import pytest
+
+
+def test_vector_candidates_branch_per_project_with_literal_ids():
+    search = pytest.importorskip("app.routers.search")
+    sql = search.hybrid_sql([3, 7])
+    assert "c.project_id = 3 ORDER BY dist" in sql and "c.project_id = 7 ORDER BY dist" in sql
+    assert "FULL OUTER JOIN" in sql and "ts_headline" in sql
+
+
+def test_unscoped_and_wide_scopes_use_a_single_scan():
+    search = pytest.importorskip("app.routers.search")
+    assert "ANY(:ids)" not in search.hybrid_sql(None)
+    wide = search.hybrid_sql(list(range(search.MAX_PROJECT_BRANCHES + 1)))
+    assert "UNION ALL" not in wide and "ANY(:ids)" in wide
+
+
+def test_search_cache_keys_and_redis_tier():
+    import asyncio
+
+    from app.search_cache import SearchCache
+
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+
+        async def get(self, key):
+            return self.data.get(key)
+
+        async def set(self, key, value, ex=None):
+            self.data[key] = value
+
+    shared = FakeRedis()
+    worker_a, worker_b = SearchCache(redis_client=shared), SearchCache(redis_client=shared)
+    key = SearchCache.key("  Apollo  Reactor", [2, 1], {"limit": 20}, {"1": 4, "2": 9})
+    assert key == SearchCache.key("apollo reactor", [1, 2], {"limit": 20}, {"1": 4, "2": 9})
+    assert key != SearchCache.key("apollo reactor", [1, 2], {"limit": 20}, {"1": 4, "2": 10})
+
+    async def main():
+        await worker_a.set(key, [{"chunk_id": 1}])
+        return await worker_b.get(key), await worker_b.get(key)
+
+    assert asyncio.run(main()) == ([{"chunk_id": 1}], [{"chunk_id": 1}])
+    stats = worker_b.stats()
+    assert stats["redis"]["hits"] == 1 and stats["local"]["hits"] == 1 and stats["hit_rate"] == 1.0
+
+
+def test_scoped_api_key_searches_its_own_project(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    search = pytest.importorskip("app.routers.search")
+    from app import embedding_service as embedding_module
+    from app.api_keys import _principal
+    from app.auth import get_current_user_async
+    from app.db_replicas import get_read_db
+
+    scopes = []
+
+    async def fake_generations(db, project_ids):
+        return {str(p): 0 for p in project_ids or []}
+
+    async def fake_hybrid_search(db, query, vector, project_ids, limit, depth, **knobs):
+        search.hybrid_sql(project_ids)  # literal per-project branches need int ids
+        scopes.append(project_ids)
+        return []
+
+    class FakeEmbeddings:
+        async def embed(self, text):
+            return [0.0]
+
+    monkeypatch.setattr(search, "index_generations", fake_generations)
+    monkeypatch.setattr(search, "hybrid_search", fake_hybrid_search)
+    monkeypatch.setattr(embedding_module, "embedding_service", FakeEmbeddings())
+    monkeypatch.setattr(search, "get_search_cache", _NoCache)
+
+    app = FastAPI()
+    app.include_router(search.router)
+    app.dependency_overrides[get_read_db] = lambda: None
+    app.dependency_overrides[get_current_user_async] = lambda: _principal(
+        {"id": 9, "key_id": "abc123", "role": "viewer", "project_id": 5})
+    client = TestClient(app)
+    assert client.get("/search/", params={"q": "reactor"}).status_code == 200
+    assert client.get("/search/", params={"q": "reactor", "project_id": 5}).status_code == 200
+    assert client.get("/search/", params={"q": "reactor", "project_id": 6}).status_code == 403
+    assert client.get("/search/", params={"q": "reactor", "ef_search": 0}).status_code == 400
+    assert client.get("/search/", params={"q": "reactor", "ef_search": 400, "probes": 20}).status_code == 200
+    assert scopes == [[5], [5], [5]]
+
+
+class _NoCache:
+    def key(self, *parts):
+        return None
+
+    async def get(self, key):
+        return None
+
+    async def set(self, key, value):
+        pass
+
+
+def test_snippets_are_escaped_around_the_highlights():
+    search = pytest.importorskip("app.routers.search")
+    headline = "<img src=x onerror=alert(1)> the \x02reactor\x03 & \x02core\x03"
+    assert search.render_snippet(headline) == (
+        "&lt;img src=x onerror=alert(1)&gt; the <mark>reactor</mark> &amp; <mark>core</mark>")
+    assert search.render_snippet(None) is None
+
+
+def test_keyword_ranking_is_exact_below_the_cap_and_newest_first_above(pg_engine):
+    from sqlalchemy import text
+
+    search = pytest.importorskip("app.routers.search")
+    with pg_engine.begin() as con:
+        con.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        con.execute(text("CREATE TABLE documents (id INTEGER PRIMARY KEY, filename TEXT)"))
+        con.execute(text("""
+            CREATE TABLE chunks (
+                id BIGSERIAL PRIMARY KEY, document_id INTEGER NOT NULL, project_id INTEGER NOT NULL,
+                ord INTEGER NOT NULL, text TEXT NOT NULL, embedding vector(3),
+                tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', text)) STORED
+            )
+        """))
+        con.execute(text("INSERT INTO documents VALUES (1, 'a.txt')"))
+        # chunk i mentions the term i times (more mentions rank higher); the
+        # vector side points away so only the keyword ranking decides
+        for i in range(1, 21):
+            con.execute(text("""
+                INSERT INTO chunks (id, document_id, project_id, ord, text, embedding)
+                VALUES (:i, 1, 1, :i, :t, '[0, 0, 1]')
+            """), {"i": i, "t": "<b>x</b> & " + " filler words" * (20 - i) + " reactor" * i})
+
+    def keyword_ranks(match_cap, ids):
+        with pg_engine.connect() as con:
+            rows = con.execute(text(search.hybrid_sql(ids)), {
+                "q": "reactor", "vec": "[1, 0, 0]", "ids": ids, "depth": 5, "limit": 40, "rrf_k": 60,
+                "match_cap": match_cap, "headline_options": search.HEADLINE_OPTIONS,
+            }).mappings().all()
+        ranked = sorted((r for r in rows if r["keyword_rank"]), key=lambda r: r["keyword_rank"])
+        return [r["chunk_id"] for r in ranked], rows
+
+    exact, rows = keyword_ranks(1000, None)
+    assert exact == [20, 19, 18, 17, 16]
+    assert keyword_ranks(1000, [1])[0] == exact
+    # Above the cap only the newest matches are ranked
+    assert keyword_ranks(3, None)[0] == [20, 19, 18]
+    assert keyword_ranks(3, [1])[0] == [20, 19, 18]
+    assert keyword_ranks(1000, [2])[0] == []
+
+    snippet = search.render_snippet(rows[0]["snippet"])
+    assert "<mark>reactor</mark>" in snippet and "<b>" not in snippet and "& " not in snippet
+
+
+def test_cache_stats_are_ceo_only(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    search = pytest.importorskip("app.routers.search")
+    from app import auth
+
+    class Stats:
+        def stats(self):
+            return {"local": {"hits": 3}}
+
+    monkeypatch.setattr(search, "get_search_cache", Stats)
+    app = FastAPI()
+    app.include_router(search.router)
+    client = TestClient(app)
+    caller = {"id": 2, "name": "Alice", "role": "admin"}
+    app.dependency_overrides[auth.get_current_user] = lambda: caller
+    assert client.get("/search/cache-stats").status_code == 403
+    caller["role"] = "ceo"
+    assert client.get("/search/cache-stats").json() == {"local": {"hits": 3}}
+
+    del app.dependency_overrides[auth.get_current_user]
+    monkeypatch.setattr(auth, "DEV_MODE", False)
+    assert client.get("/search/cache-stats").status_code == 401
@@ -0,0 +1,77 @@
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table, create_engine, text
+
+from app import seeding
+
+
+def _metadata():
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True), Column("name", String),
+          Column("api_key", String, unique=True), Column("role", String))
+    Table("projects", metadata, Column("id", Integer, primary_key=True), Column("name", String, unique=True))
+    Table("project_membership", metadata, Column("id", Integer, primary_key=True),
+          Column("user_id", ForeignKey("users.id")), Column("project_id", ForeignKey("projects.id")))
+    Table("documents", metadata, Column("id", Integer, primary_key=True), Column("filename", String),
+          Column("project_id", Integer), Column("owner_user_id", Integer))
+    return metadata
+
+
+def test_migrations_head_is_the_last_revision():
+    assert seeding.migrations_head() == "012_search_generations"
+
+
+def test_bootstrap_seeds_once_then_takes_the_fast_path(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/boot.db")
+    metadata = _metadata()
+    first = seeding.bootstrap(engine, metadata, head="012_search_generations")
+    assert first["create_all"] and first["seeded"]
+    again = seeding.bootstrap(engine, metadata, head="012_search_generations")
+    assert again["action"] == "bootstrap" and not again["seeded"]  # no alembic_version: create_all path
+
+    with engine.begin() as con:
+        con.execute(text("CREATE TABLE alembic_version (version_num VARCHAR(32))"))
+        con.execute(text("INSERT INTO alembic_version VALUES ('012_search_generations')"))
+    assert seeding.bootstrap(engine, metadata, head="012_search_generations")["action"] == "none"
+    with engine.connect() as con:
+        assert con.execute(text("SELECT count(*) FROM users")).scalar() == 3
+        assert con.execute(text("SELECT count(*) FROM project_membership")).scalar() == 2
+
+
+def test_fixtures_are_idempotent_and_resumable(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/fixtures.db")
+    _metadata().create_all(engine)
+    with engine.begin() as con:
+        loaded = seeding.seed_fixtures(con, users=20, projects=5, documents=300, memberships_per_user=2)
+    assert loaded == {"users": 20, "projects": 5, "memberships": 40, "documents": 300}
+    with engine.begin() as con:
+        again = seeding.seed_fixtures(con, users=20, projects=5, documents=450, memberships_per_user=2)
+    assert again == {"users": 0, "projects": 0, "memberships": 0, "documents": 150}
+    with engine.connect() as con:
+        assert con.execute(text("SELECT count(DISTINCT filename) FROM documents")).scalar() == 450
+
+
+def test_loading_users_drops_their_cached_principals(tmp_path, monkeypatch):
+    dropped = []
+    monkeypatch.setattr(seeding, "invalidate_principal", lambda **kw: dropped.append(kw))
+    engine = create_engine(f"sqlite:///{tmp_path}/users.db")
+    _metadata().create_all(engine)
+    with engine.begin() as con:
+        assert seeding.load_users(con, [("A", "a-key", "viewer"), ("B", "b-key", "editor")]) == 2
+        assert seeding.load_users(con, [("A", "a-key", "ceo")]) == 0  # existing keys are left alone
+    assert dropped == [{"api_key": "a-key"}, {"api_key": "b-key"}]
+
+
+def test_loading_memberships_drops_the_members_cached_acls(tmp_path):
+    from app import auth
+
+    engine = create_engine(f"sqlite:///{tmp_path}/acl.db")
+    _metadata().create_all(engine)
+    with engine.begin() as con:
+        seeding.load_users(con, [("A", "a-key", "viewer"), ("B", "b-key", "viewer")])
+        seeding.load_projects(con, ["Apollo", "Zephyr"])
+        a_id = con.execute(text("SELECT id FROM users WHERE api_key = 'a-key'")).scalar()
+        b_id = con.execute(text("SELECT id FROM users WHERE api_key = 'b-key'")).scalar()
+        auth._acl_cache.set(a_id, frozenset())
+        auth._acl_cache.set(b_id, frozenset())
+        assert seeding.load_memberships(con, [("a-key", "Apollo"), ("a-key", "Zephyr")]) == 2
+    assert auth._acl_cache.get(a_id) is None  # re-read on the next check instead of denying for the TTL
+    assert auth._acl_cache.get(b_id) == frozenset()
@@ -0,0 +1,104 @@
+import os
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, text
+
+from app import storage_monitor as monitor_module
+from app.storage_monitor import StorageMonitor, disk_usage
+
+
+def test_disk_usage_counts_fragments_not_4k_blocks(monkeypatch):
+    # f_frsize is the unit of f_blocks/f_bfree/f_bavail; f_bsize is only the preferred I/O size
+    stat = SimpleNamespace(f_blocks=1000, f_bfree=400, f_bavail=300, f_frsize=512, f_bsize=4096)
+    monkeypatch.setattr(monitor_module.os, "statvfs", lambda path: stat)
+    assert disk_usage("/") == {"total": 512000, "used": 307200, "free": 153600}
+
+
+def _monitor(tmp_path, engine_factory):
+    user_dir = tmp_path / "users"
+    (user_dir / "alice").mkdir(parents=True)
+    return StorageMonitor(lambda: str(tmp_path), lambda: str(user_dir), engine_factory)
+
+
+def test_snapshot_is_stale_until_a_reconcile_succeeds(tmp_path, monkeypatch):
+    def database_down():
+        raise RuntimeError("connection refused")
+
+    monitor = _monitor(tmp_path, database_down)
+    monitor.refresh_disk()
+    monitor.record_upload("alice", 10)
+    snapshot = monitor.snapshot()
+    assert snapshot["stale"] and snapshot["reconciled_at"] is None
+    assert snapshot["disk_usage"]["total_gb"] > 0 and snapshot["stored_bytes"] == 10
+
+    monkeypatch.setattr(monitor_module, "dedup_stats", lambda db: {"blobs": 1})
+    engine = create_engine(f"sqlite:///{tmp_path}/files.db")
+    with engine.begin() as con:
+        con.execute(text("CREATE TABLE user_files (user_id TEXT, project_id INTEGER, size_bytes INTEGER)"))
+        con.execute(text("INSERT INTO user_files VALUES ('alice', 3, 100), ('bob', NULL, 50)"))
+    monitor._engine_factory = lambda: engine
+    monitor.reconcile()
+    snapshot = monitor.snapshot()
+    assert not snapshot["stale"] and snapshot["file_count"] == 2 and snapshot["stored_bytes"] == 150
+    assert snapshot["user_count"] == 1 and monitor.project_bytes(3) == 100
+
+    monkeypatch.setattr(monitor, "reconciled_at", monitor.reconciled_at - 3 * monitor_module.RECONCILE_SECONDS)
+    assert monitor.snapshot()["stale"]
+
+
+def test_storage_info_serves_disk_usage_while_the_database_is_down(tmp_path, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.routers import users
+
+    def database_down():
+        raise AssertionError("/storage-info must not query the database")
+
+    monkeypatch.setattr(users, "storage_monitor", _monitor(tmp_path, database_down))
+    app = FastAPI()
+    app.include_router(users.router)
+    client = TestClient(app)
+    for _ in range(2):
+        response = client.get("/storage-info")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["stale"] and body["ssd_path"] == str(tmp_path)
+        assert body["disk_usage"]["total_gb"] == round(disk_usage(str(tmp_path))["total"] / 1024 ** 3, 2)
+    assert os.path.isdir(body["user_data_directory"])
+
+
+def test_per_user_and_project_usage_need_the_user_or_a_member(tmp_path, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app import auth
+    from app.db import get_db
+    from app.routers import users
+
+    monitor = _monitor(tmp_path, lambda: None)
+    monitor.record_upload("7", 10, 3)
+    monkeypatch.setattr(users, "storage_monitor", monitor)
+    monkeypatch.setattr(users, "readable_project_ids", lambda user, db: None if user["role"] == "ceo"
+                        else frozenset({3}) if user["id"] == 7 else frozenset())
+    caller = {}
+    app = FastAPI()
+    app.include_router(users.router)
+    app.dependency_overrides[get_db] = lambda: None
+    app.dependency_overrides[auth.get_current_user] = lambda: caller
+    client = TestClient(app)
+
+    caller.update({"id": 7, "name": "Alice", "role": "editor"})
+    assert client.get("/storage-info/users/7").json()["stored_bytes"] == 10
+    assert client.get("/storage-info/projects/3").json()["stored_bytes"] == 10
+    caller.update({"id": 8, "name": "Bob", "role": "admin"})
+    assert client.get("/storage-info/users/7").status_code == 403
+    assert client.get("/storage-info/projects/3").status_code == 403
+    caller.update({"id": 1, "name": "Boss", "role": "ceo"})
+    assert client.get("/storage-info/users/7").status_code == 200
+    assert client.get("/storage-info/projects/3").status_code == 200
+
+    del app.dependency_overrides[auth.get_current_user]
+    monkeypatch.setattr(auth, "DEV_MODE", False)
+    assert client.get("/storage-info/users/7").status_code == 401
+    assert client.get("/storage-info/projects/3").status_code == 401
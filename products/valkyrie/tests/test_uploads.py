@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+pytest.importorskip("aiofiles")
+
+from app.uploads import UploadTooLarge, publish, safe_filename, stream_to_temp
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_stream_to_temp_hashes_and_publishes_atomically(tmp_path):
+    async def scenario():
+        staged = await stream_to_temp(chunks(b"hello ", b"world"), str(tmp_path))
+        assert staged["size"] == 11
+        assert staged["sha256"] == hashlib.sha256(b"hello world").hexdigest()
+        final = await publish(staged["tmp_path"], str(tmp_path / "greeting.txt"))
+        assert open(final, "rb").read() == b"hello world"
+        assert os.listdir(tmp_path) == ["greeting.txt"]
+
+    asyncio.run(scenario())
+
+
+def test_oversized_upload_leaves_no_temp_file(tmp_path):
+    async def scenario():
+        with pytest.raises(UploadTooLarge):
+            await stream_to_temp(chunks(b"x" * 8, b"x" * 8), str(tmp_path), max_bytes=10)
+        assert os.listdir(tmp_path) == []
+
+    asyncio.run(scenario())
+
+
+def test_safe_filename_strips_directories():
+    assert safe_filename("../../etc/passwd") == "passwd"
+    assert safe_filename("C:\\Users\\x\\report.pdf") == "report.pdf"
+    with pytest.raises(ValueError):
+        safe_filename("..")
+
+
+class StreamedRequest:
+    """Just what MultipartUpload reads: headers and an async body stream."""
+
+    def __init__(self, body: bytes, boundary: str = "b0undary", piece: int = 7):
+        self.headers = {"content-type": f"multipart/form-data; boundary={boundary}"}
+        self.body, self.piece = body, piece
+
+    async def stream(self):
+        for i in range(0, len(self.body), self.piece):
+            yield self.body[i:i + self.piece]
+
+
+def multipart_body(*parts, boundary="b0undary", close=True) -> bytes:
+    out = b""
+    for name, value, filename in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        out += f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + value + b"\r\n"
+    return out + (f"--{boundary}--\r\n".encode() if close else b"")
+
+
+def test_multipart_upload_streams_the_file_part_and_collects_fields(tmp_path):
+    from app.uploads import MultipartUpload
+
+    payload = bytes(range(256)) * 40
+
+    async def scenario():
+        # project_id after the file: still known once the iterator is done
+        form = MultipartUpload(StreamedRequest(multipart_body(
+            ("note", b"hi", None), ("file", payload, "résumé.bin"), ("project_id", b"7", None))))
+        staged = await stream_to_temp(form.file_chunks(), str(tmp_path))
+        assert staged["size"] == len(payload)
+        assert staged["sha256"] == hashlib.sha256(payload).hexdigest()
+        assert form.filename == "résumé.bin" and form.fields == {"note": "hi", "project_id": "7"}
+
+        oversized = MultipartUpload(StreamedRequest(multipart_body(("file", payload, "a.bin"))))
+        with pytest.raises(UploadTooLarge):
+            await stream_to_temp(oversized.file_chunks(), str(tmp_path), max_bytes=1000)
+
+    asyncio.run(scenario())
+    assert len(os.listdir(tmp_path)) == 1  # the first upload's staged file only
+
+
+def test_multipart_upload_rejects_malformed_bodies(tmp_path):
+    from app.uploads import InvalidUpload, MultipartUpload
+
+    async def consume(body, **kw):
+        form = MultipartUpload(StreamedRequest(body, **kw))
+        return await stream_to_temp(form.file_chunks(), str(tmp_path))
+
+    for body in (multipart_body(("project_id", b"7", None)),  # no file part
+                 multipart_body(("file", b"abc", "a.txt"), close=False),  # truncated
+                 multipart_body(("file", b"a", "a.txt"), ("file", b"b", "b.txt"))):
+        with pytest.raises(InvalidUpload):
+            asyncio.run(consume(body))
+    with pytest.raises(InvalidUpload):
+        MultipartUpload(type("R", (), {"headers": {"content-type": "application/json"}})())
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_endpoint_links_the_streamed_file(tmp_path, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.blobstore import BlobStore
+    from app.db import get_db
+    from app.routers import users
+
+    class Session:
+        def commit(self):
+            pass
+
+        def rollback(self):
+            pass
+
+    linked = []
+    monkeypatch.setattr(users, "get_blob_store", lambda: BlobStore(str(tmp_path)))
+    monkeypatch.setattr(users, "link_file", lambda db, *args: linked.append(args))
+    monkeypatch.setattr(users.storage_monitor, "record_upload", lambda *args: None)
+    app = FastAPI()
+    app.include_router(users.router)
+    app.dependency_overrides[get_db] = Session
+    client = TestClient(app)
+
+    response = client.post("/upload-file/u1", files={"file": ("../notes.txt", b"hello world")},
+                           data={"project_id": "3"})
+    assert response.status_code == 200, response.text
+    digest = hashlib.sha256(b"hello world").hexdigest()
+    assert response.json()["sha256"] == digest and response.json()["deduplicated"] is False
+    assert linked == [("u1", "notes.txt", digest, 11, 3)]
+    assert open(BlobStore(str(tmp_path)).path_for(digest), "rb").read() == b"hello world"
+
+    assert client.post("/upload-file/u1", data={"project_id": "3"}).status_code == 400
+    assert client.post("/upload-file/u1", files={"file": ("a.txt", b"x")},
+                       data={"project_id": "three"}).status_code == 400
+    assert os.listdir(tmp_path / "tmp") == []
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from app import vector_index
+
+
+def test_vector_index_naming_and_sizing():
+    assert vector_index.index_name(7, "hnsw") == "ix_chunks_embedding_hnsw_p7"
+    with pytest.raises(ValueError):
+        vector_index.index_name(7, "flat; DROP TABLE chunks")
+    assert vector_index.ivfflat_lists(500) == 1
+    assert vector_index.ivfflat_lists(200_000) == 200
+    assert vector_index.ivfflat_lists(4_000_000) == 2000
+
+
+def test_search_passes_ann_knobs_for_its_transaction_only(monkeypatch):
+    np = pytest.importorskip("numpy")
+    from app.routers import search
+
+    class Result:
+        def mappings(self):
+            return self
+
+        def all(self):
+            return []
+
+    class Session:
+        def __init__(self):
+            self.statements = []
+
+        async def execute(self, statement, params=None):
+            self.statements.append(str(statement))
+            return Result()
+
+        async def rollback(self):
+            self.statements.append("ROLLBACK")
+
+    def knobs(**kwargs):
+        db = Session()
+        asyncio.run(search.hybrid_search(db, "q", np.zeros(4, dtype=np.float32), [1], limit=10, depth=20, **kwargs))
+        assert db.statements[-1] == "ROLLBACK"  # SET LOCAL ends with the read transaction
+        return [s for s in db.statements if s.startswith("SET LOCAL")]
+
+    monkeypatch.setattr(search, "HNSW_EF_SEARCH", 40)
+    assert knobs() == []
+    assert knobs(ef_search=200, probes=25) == ["SET LOCAL hnsw.ef_search = 200", "SET LOCAL ivfflat.probes = 25"]
+    # never below depth: the scan could not return enough candidates
+    assert knobs(ef_search=5) == ["SET LOCAL hnsw.ef_search = 20"]
+    monkeypatch.setattr(search, "HNSW_EF_SEARCH", 10)
+    assert knobs() == ["SET LOCAL hnsw.ef_search = 20"]
@@ -355,6 +355,25 @@ export interface SyncOptions {
   forceFullSync?: boolean;
 }
 
+// Delta sync high-water marks: the last row and tombstone applied, ordered by
+// the writing transaction (sync_xid) and then by id
+export interface SyncCursor {
+  xid: string;
+  id: string;
+  tombstoneXid: string;
+  tombstoneSeq: string;
+}
+
+// One delta sync batch; rows are positional arrays in `columns` order
+export interface ChangeBatch {
+  table: string;
+  columns: string[];
+  rows: any[][];
+  deleted: string[];
+  token: string;
+  hasMore: boolean;
+}
+
 export interface QueryOptions {
   limit?: number;
   offset?: number;
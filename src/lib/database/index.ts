@@ -3,6 +3,7 @@
 export { CloudDatabase, getCloudDatabase, initializeCloudDatabase } from './cloud';
 export { LocalDatabase, getLocalDatabase, initializeLocalDatabase } from './local';
 export { DatabaseSync } from './sync';
+export { SYNC_TABLES, getSyncTableSpec, encodeSyncToken, decodeSyncToken } from './delta';
 
 export * from '@/types/database';
 
@@ -2,6 +2,7 @@
 
 import Database from 'better-sqlite3';
 import { 
+  ChangeBatch,
   LocalDatabaseConfig, 
   UserSettings, 
   Session, 
@@ -17,9 +18,11 @@ import {
   EncryptionKey, 
   OfflineQueue 
 } from '@/types/database';
+import { getSyncTableSpec } from './delta';
 
 export class LocalDatabase {
   private db: Database.Database;
+  private syncStatements = new Map<string, { upsert: Database.Statement; remove: Database.Statement }>();
 
   constructor(config: LocalDatabaseConfig) {
     this.db = new Database(config.path);
@@ -27,6 +30,9 @@ export class LocalDatabase {
     // Enable WAL mode for better concurrency
     if (config.enableWAL !== false) {
       this.db.pragma('journal_mode = WAL');
+      // Safe under WAL (a crash can lose the last commits, never corrupt), and
+      // commits stop waiting on an fsync each, which sync batches do constantly
+      this.db.pragma('synchronous = NORMAL');
     }
     
     // Enable foreign keys
@@ -249,11 +255,16 @@ export class LocalDatabase {
 
   // Sync status methods
   updateSyncStatus(tableName: string, lastSyncAt: Date, syncToken?: string, errorMessage?: string): void {
+    // A missing token keeps the stored one, so recording an error doesn't reset the delta cursor
     const stmt = this.db.prepare(`
-      INSERT OR REPLACE INTO sync_status (table_name, last_sync_at, sync_token, error_message)
+      INSERT INTO sync_status (table_name, last_sync_at, sync_token, error_message)
       VALUES (?, ?, ?, ?)
+      ON CONFLICT(table_name) DO UPDATE SET
+        last_sync_at = excluded.last_sync_at,
+        sync_token = COALESCE(excluded.sync_token, sync_status.sync_token),
+        error_message = excluded.error_message
     `);
-    stmt.run(tableName, lastSyncAt.toISOString(), syncToken, errorMessage);
+    stmt.run(tableName, lastSyncAt.toISOString(), syncToken ?? null, errorMessage ?? null);
   }
 
   getSyncStatus(tableName: string): SyncStatus | null {
@@ -265,6 +276,59 @@ export class LocalDatabase {
     return result;
   }
 
+  // Delta sync methods
+  // One transaction per batch: rows, deletions and the new cursor commit together
+  applyChangeBatch(batch: ChangeBatch): void {
+    const spec = getSyncTableSpec(batch.table);
+    if (batch.columns.join(',') !== spec.columns.join(',')) {
+      throw new Error(`Unexpected columns for ${batch.table}: ${batch.columns.join(', ')}`);
+    }
+    const { upsert, remove } = this.getSyncStatements(batch.table);
+    const json = spec.columns.map(column => spec.jsonColumns.includes(column));
+    const saveToken = this.db.prepare(`
+      INSERT INTO sync_status (table_name, sync_token) VALUES (?, ?)
+      ON CONFLICT(table_name) DO UPDATE SET sync_token = excluded.sync_token
+    `);
+
+    this.db.transaction(() => {
+      for (const row of batch.rows) {
+        upsert.run(row.map((value, index) => toSqliteValue(value, json[index])));
+      }
+      for (const id of batch.deleted) {
+        remove.run(id);
+      }
+      saveToken.run(batch.table, batch.token);
+    })();
+  }
+
+  // Drop a table's cached rows and cursor so the next pull starts from scratch
+  resetSyncedTable(tableName: string): void {
+    const spec = getSyncTableSpec(tableName);
+    this.db.transaction(() => {
+      this.db.prepare(`DELETE FROM ${spec.localTable}`).run();
+      this.db.prepare('UPDATE sync_status SET sync_token = NULL WHERE table_name = ?').run(tableName);
+    })();
+  }
+
+  private getSyncStatements(tableName: string): { upsert: Database.Statement; remove: Database.Statement } {
+    let statements = this.syncStatements.get(tableName);
+    if (!statements) {
+      const spec = getSyncTableSpec(tableName);
+      const updates = spec.columns.filter(column => column !== 'id').map(column => `${column} = excluded.${column}`);
+      statements = {
+        // An upsert, unlike INSERT OR REPLACE, updates in place instead of a delete plus insert
+        upsert: this.db.prepare(`
+          INSERT INTO ${spec.localTable} (${spec.columns.join(', ')}, last_synced_at)
+          VALUES (${spec.columns.map(() => '?').join(', ')}, CURRENT_TIMESTAMP)
+          ON CONFLICT(id) DO UPDATE SET ${updates.join(', ')}, last_synced_at = excluded.last_synced_at
+        `),
+        remove: this.db.prepare(`DELETE FROM ${spec.localTable} WHERE id = ?`)
+      };
+      this.syncStatements.set(tableName, statements);
+    }
+    return statements;
+  }
+
   // Local audit log methods
   createLocalAuditLog(auditLog: Omit<LocalAuditLog, 'id' | 'created_at'>): LocalAuditLog {
     const stmt = this.db.prepare(`
@@ -385,6 +449,23 @@ export class LocalDatabase {
   }
 }
 
+// better-sqlite3 binds only numbers, strings, bigints, buffers and null
+function toSqliteValue(value: any, json: boolean): any {
+  if (value === undefined || value === null) {
+    return null;
+  }
+  if (json) {
+    return JSON.stringify(value);
+  }
+  if (value instanceof Date) {
+    return value.toISOString();
+  }
+  if (typeof value === 'boolean') {
+    return value ? 1 : 0;
+  }
+  return value;
+}
+
 // Singleton instance
 let localDbInstance: LocalDatabase | null = null;
 